@@ -9,8 +9,6 @@
 import os
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_openai import ChatOpenAI
-from langchain_cohere import ChatCohere
 
 load_dotenv()
 
@@ -24,6 +22,9 @@ break_word = "Quit"
 
 
 if use_cohere:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_cohere import ChatCohere
+
     api_key = os.getenv("COHERE_API_KEY")
     cohere_chat_model = ChatCohere(cohere_api_key=api_key)
     # For storing the existing converstaion
@@ -46,6 +47,9 @@ if use_cohere:
 
 
 if use_openai:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_openai import ChatOpenAI
+
     api_key = os.getenv("OPENAI_API_KEY")
     openai_chat_model = ChatOpenAI(
         api_key=api_key,
@@ -7,8 +7,6 @@
 import os
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
@@ -21,6 +19,9 @@ use_openai = False
 prompt = "Hello World"
 
 if use_cohere:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_cohere import ChatCohere
+
     # Initialize the language model
     api_key = os.getenv("COHERE_API_KEY")
     cohere_chat_model = ChatCohere(cohere_api_key=api_key)
@@ -33,6 +34,9 @@ if use_cohere:
 
 
 if use_openai:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_openai import ChatOpenAI
+
     # Initialize the language model
     api_key = os.getenv("OPENAI_API_KEY")
     openai_chat_model = ChatOpenAI(
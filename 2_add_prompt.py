@@ -11,8 +11,6 @@ import os
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
@@ -33,6 +31,9 @@ FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
 topic = "Cat"
 
 if use_cohere:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_cohere import ChatCohere
+
     api_key = os.getenv("COHERE_API_KEY")
     cohere_chat_model = ChatCohere(cohere_api_key=api_key)
 
@@ -43,6 +44,9 @@ if use_cohere:
 
 
 if use_openai:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_openai import ChatOpenAI
+
     api_key = os.getenv("OPENAI_API_KEY")
     openai_chat_model = ChatOpenAI(
         api_key=api_key,
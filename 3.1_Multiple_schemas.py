@@ -1,6 +1,8 @@
 '''
     Adds multiple schemas to dissect the output of the language model.
     LLM Decides which schema to use per prompt and generated response.
+    With use_router the same messages are also sent with the schema picked by a local classifier (llm_utils/intent.py),
+    the LLM gets only that one.
 
     Notes:
     - The order by which schemas are added into CombinedSchema Union seems to matter. First one takes priority
@@ -9,18 +11,19 @@
     - OpenAI succeeds acceptably after prioritizing simpler schemas over complex ones.
     - Cohere doesn't seem to support the common parent and union approach of schemas and causes the program to crash.
     - Cohere is not a viable tool here, but OpenAI seems to work.
+    - With use_router both work: a single schema per request, no Union. The prompts are also shorter.
 '''
 
 
 import os
 from dotenv import load_dotenv
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from typing import Optional
 from typing import Union        # Enables combining schemas
 
+from llm_utils import intent, models, structured_output
+
 load_dotenv()
 
 
@@ -28,6 +31,9 @@ load_dotenv()
 use_cohere = True
 use_openai = False
 
+# Also pick the schema with a local classifier before calling the LLM, instead of giving the LLM a Union of schemas
+use_router = True
+
 PROMPT = ChatPromptTemplate.from_template(
     """
     You will either tell a joke or answer in normal manner depending on the user's message. Choose appropriate schema accordingly.
@@ -67,10 +73,22 @@ class ConversationalSchema(BaseModel):
 class CombinedSchema(BaseModel):
     output: Union[ConversationalSchema, FunnySchema]
 
+# Label of the intent classifier -> the only schema sent to the LLM
+ROUTED_SCHEMAS = {"joke": FunnySchema, "conversation": ConversationalSchema}
+
+
+# The classifier runs locally in microseconds, the LLM is called with the single matching schema
+def routed_invoke(chat_model, message):
+    schema = ROUTED_SCHEMAS[intent.classify(message)]
+    return structured_output.bind(chat_model, schema).invoke(PROMPT.format(message=message))
+
 
 
 
 if use_openai:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_openai import ChatOpenAI
+
     api_key = os.getenv("OPENAI_API_KEY")
     openai_chat_model = ChatOpenAI(
         api_key=api_key,
@@ -108,6 +126,9 @@ if use_openai:
 
 
 if use_cohere:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_cohere import ChatCohere
+
     api_key = os.getenv("COHERE_API_KEY")
     cohere_chat_model = ChatCohere(cohere_api_key=api_key)
 
@@ -145,7 +166,17 @@ if use_cohere:
                 print(output.response)
     except Exception as e:
         print(f"CombinedSchema causes a deep level error when using Cohere:\n{e}")
-            
+
+
+if use_router:
+    model_keys = [key for key, used in (("openai:gpt-4o-mini", use_openai), ("cohere", use_cohere)) if used]
+    for model_key in model_keys:
+        chat_model = models.get_model(model_key)
+        print(f"\n/------- {model_key} response with a routed schema:\n")
+        for message in (joke_message, chat_message):
+            # Single schema output is the schema itself, no 'output' key
+            response = routed_invoke(chat_model, message)
+            print(f"{intent.classify(message)}: {response}\n")
 
 
 '''
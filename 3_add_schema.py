@@ -12,8 +12,6 @@
 
 import os
 from dotenv import load_dotenv
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from typing import Optional     # Enables the LLM to return only partially dissected response
@@ -67,6 +65,9 @@ class FunnySchema(BaseModel):
 
 
 if use_cohere:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_cohere import ChatCohere
+
     api_key = os.getenv("COHERE_API_KEY")
     cohere_chat_model = ChatCohere(cohere_api_key=api_key)
 
@@ -89,6 +90,9 @@ if use_cohere:
 
 
 if use_openai:
+    # Imported only when the model is used, importing the provider package is slow
+    from langchain_openai import ChatOpenAI
+
     api_key = os.getenv("OPENAI_API_KEY")
     openai_chat_model = ChatOpenAI(
         api_key=api_key,
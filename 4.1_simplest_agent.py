@@ -5,8 +5,10 @@
 
     Structure:
     - Nodes are stopping points within the graph. When agent enters a node, it calls the function associated with it using the agent's own state
-    - Node functions update the agent's state in predetermined manner.
+    - Node functions update the agent's state in predetermined manner. They return only the changed part of the state.
+    - Reducers (Annotated in the state) decide how the returned part is merged into the state.
     - Edges are connecting points between two nodes.    
+    - The graph has no LLM calls, so it can run on a minimal executor instead of the LangGraph runtime (use_fast_executor).
 
     Flow:
     - Agent is pushed into the graph at entry point.
@@ -17,25 +19,29 @@
 
 
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
+from typing import Annotated, TypedDict
+from graph_utils import channels, executor
+
+# The graph has only plain Python nodes, so it can run on the lightweight executor (graph_utils/executor.py)
+# instead of the full LangGraph runtime. Set to False to run the same definitions with LangGraph
+use_fast_executor = True
 
 
 # Agents state
 class AgentState(TypedDict):
-    numbers: List[int]
+    # Append-only channel: values returned by the nodes are appended to the list
+    numbers: Annotated[channels.AppendLog, channels.append]
 
 # When agent reaches node with this function, add 1 to it's numbers list
-def first_step(state: AgentState) -> AgentState:
-    state["numbers"] += [1]
-    return state
+def first_step(state: AgentState) -> dict:
+    return {"numbers": [1]}
 
 # When agent reaches node with this function, add 2 to it's numbers list
-def second_step(state: AgentState) -> AgentState:
-    state["numbers"] += [2]
-    return state
+def second_step(state: AgentState) -> dict:
+    return {"numbers": [2]}
 
 # Create a graph with the state
-workflow = StateGraph(AgentState)
+workflow = (executor.StateGraph if use_fast_executor else StateGraph)(AgentState)
 
 # Nodes             name     function
 workflow.add_node("first", first_step)
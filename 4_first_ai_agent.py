@@ -5,41 +5,36 @@
     - Create a simple agent that generates jokes about a topic
     - Create a graph with the agent (workflow)
     graph.invoke() will return the state of the agent after the execution
+    - The agent is memoized on the topic and the model, the same topic is answered from the cache without calling the model
 
     Differences between language models:
     - As previously noted, Cohere can't really work with schemas
 '''
 
-import os
 from dotenv import load_dotenv
-from langchain_cohere import ChatCohere 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from typing import Optional
-from langchain_core.messages import (
-    HumanMessage,
-    AIMessage
-)
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
-# Enables typing of the structured LLM model
-from langchain_core.runnables.base import RunnableSequence
+from typing import Annotated, Deque, TypedDict
+# Append-only state channels and the compact message record
+from graph_utils import channels, memo
+from graph_utils.channels import Record
+# The graph's config tells the nodes which model to use
+from langchain_core.runnables import RunnableConfig
+# Model registry (models are looked up by a short key) and cached structured output runnables
+from llm_utils import models, structured_output
 
 load_dotenv()
 
-cohere_chat_model = ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"))
-openai_chat_model = ChatOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model="gpt-4o-mini",
-)
-
 
 # Select which models you want to use
 use_cohere = True
 use_openai = False
 
+# How many messages the state keeps, older ones are dropped from the message log
+message_retention = 50
+
 
 FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
     """
@@ -48,6 +43,7 @@ FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
     """
 )
 
+@structured_output.register_schema
 class FunnySchema(BaseModel):
     """Joke to be told to the user"""    
 
@@ -64,26 +60,30 @@ class FunnySchema(BaseModel):
 
 # Agents state
 class AgentState(TypedDict):
-    messages: List[str]
+    # Bounded message log. Nodes return new messages, which are appended to it
+    messages: Annotated[Deque[Record], channels.ring_buffer(message_retention)]
     joke_topic: str
     generated_joke: str
-    # The state holds the LLM model to be used
-    LLM_model: RunnableSequence
 
-def joker_agent(state: AgentState) -> AgentState:
+# The model isn't part of the state, the node finds it with the model key given in the config
+# The prompt depends only on the topic, so the joke is cached per topic and model
+@memo.node(keys=("joke_topic",), config_keys=("model",))
+def joker_agent(state: AgentState, config: RunnableConfig) -> dict:
     # Use created schema to structure the output
+    structured_llm = structured_output.bind(models.model_from_config(config), FunnySchema)
     prompt = FUNNY_LLM_PROMPT.format(topic=state["joke_topic"])
     # Invoke the LLM with a prompt and get the structured output
-    res = state["LLM_model"].invoke(prompt)
-    # Store the result in the state
-    state["messages"] += [
-        AIMessage(content=f"Generated joke: {res.joke}"),
-        AIMessage(content=f"Topic: {res.topic}"),
-        AIMessage(content=f"Rating: {res.rating}"),
-    ]
-    # Store the joke in the state to easily access it later
-    state["generated_joke"] = res.joke
-    return state
+    res = structured_llm.invoke(prompt)
+    # Return only the changed part of the state
+    return {
+        "messages": [
+            Record("ai", f"Generated joke: {res.joke}"),
+            Record("ai", f"Topic: {res.topic}"),
+            Record("ai", f"Rating: {res.rating}"),
+        ],
+        # Store the joke in the state to easily access it later
+        "generated_joke": res.joke,
+    }
 
 # Create a graph with the state
 workflow = StateGraph(AgentState)
@@ -103,10 +103,9 @@ graph = workflow.compile()
 # Invoke the graph with the state we want to start with
 # Just for example we use same "Hello World" as a joke topic and a message
 if use_cohere:
-    structured_cohere = cohere_chat_model.with_structured_output(FunnySchema)
-    res = graph.invoke({"messages": [HumanMessage(content="Hello world")], 
-                        "joke_topic": "Hello World", 
-                        "LLM_model": structured_cohere})
+    res = graph.invoke({"messages": [Record("human", "Hello world")], 
+                        "joke_topic": "Hello World"},
+                       config=models.model_config("cohere"))
     # Print the whole state
     print(f"\nCohere's response:\n{res}")
     # Print particular fields from the state
@@ -117,10 +116,9 @@ if use_cohere:
     print(f"\n\n{res["generated_joke"]}")
 
 if use_openai:
-    structured_openai = openai_chat_model.with_structured_output(FunnySchema)     
-    res = graph.invoke({"messages": [HumanMessage(content="Hello world")], 
-                        "joke_topic": "Hello World", 
-                        "LLM_model": structured_openai})
+    res = graph.invoke({"messages": [Record("human", "Hello world")], 
+                        "joke_topic": "Hello World"},
+                       config=models.model_config("openai:gpt-4o-mini"))
     # Print the whole state
     print(f"\nOpenAI's response:\n{res}")
     # Print particular fields from the state
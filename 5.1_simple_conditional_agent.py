@@ -4,24 +4,32 @@
     This strips all AI-tools from the intelligent-agent concept, focussing on the agent's behaviour.
 
     Conditional edges have a function which the agent calls, passing it's state and the function returns the node that the agent moves to next.
+    With use_fast_executor the loop runs on a minimal executor, which has no recursion limit and a fraction of LangGraph's per-step cost.
 '''
 
 
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
+from typing import Annotated, TypedDict
+from graph_utils import channels, executor, memo
+
+# The graph has only plain Python nodes, so it can run on the lightweight executor (graph_utils/executor.py)
+# instead of the full LangGraph runtime. Set to False to run the same definitions with LangGraph
+use_fast_executor = True
 
 
 # Agents state
 class AgentState(TypedDict):
-    marks: List[int]
+    # Append-only channel: the node returns only the new mark, which is appended to the list
+    marks: Annotated[channels.AppendLog, channels.append]
 
-def add_x(state: AgentState) -> AgentState:    
-    state["marks"] += ["X"]
-    print(f"Adding new mark to the list. After update: {state["marks"]}")
-    return state
+def add_x(state: AgentState) -> dict:
+    print(f"Adding new mark to the list. After update: {len(state["marks"]) + 1} marks")
+    return {"marks": ["X"]}
 
 # When agent reached edge with this function, it either goes back to "add" node
 # or continues to the END node
+# The answer depends only on the number of marks, so that is all the cache needs to look at
+@memo.node(key=lambda state: len(state["marks"]))
 def is_done(state):
     if len(state["marks"]) > 5:
         return END
@@ -29,7 +37,7 @@ def is_done(state):
 
 
 # Create a graph with the state
-workflow = StateGraph(AgentState)
+workflow = (executor.StateGraph if use_fast_executor else StateGraph)(AgentState)
 
 # Nodes
 workflow.add_node("add", add_x)
@@ -53,6 +61,9 @@ res = graph.invoke({"marks": ["X", "X", "X", "X", "X", "X", "X", "X", "X", "X",
 print(res)
 print(res["marks"])
 
+# How often the router's answer came from the cache
+memo.print_stats()
+
 
 # The graph will look like this:
 #                  +-----------------+
@@ -5,25 +5,29 @@
     - Add conditional edge to the graph
     - Use the state of the agent to determine the next steps (END or improve the joke)
     - loop the agents until the joke is funny enough (max 5 iterations, so not to loop forever)
+    - Optionally generate several candidate jokes at once and keep the best one (fan-out mode)
+    - Each run has a deadline and a token budget. When they run low the graph ends with the best joke so far
 
     Differences between language models:
     - Surprisingly Cohere is able to run this graph sometimes. The result isn't great, but works.
     - Cohere's version of joke_improver isn't anywhere as good as OpenAI's.
 '''
 
-import os
-from langchain_openai import ChatOpenAI
-from langchain_cohere import ChatCohere 
+import asyncio
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import (
-    HumanMessage,
-    AIMessage
-)
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
+from typing import Annotated, Deque, List, TypedDict
 from dotenv import load_dotenv
-from langchain_core.runnables.base import RunnableSequence
+# The graph's config tells the nodes which model to use
+from langchain_core.runnables import RunnableConfig
+# Model registry (models are looked up by a short key) and cached structured output runnables
+from llm_utils import models, structured_output
+# Append-only state channels and the compact message record
+from graph_utils import channels
+from graph_utils.channels import Record
+# Deadlines and token budgets of the runs
+from graph_utils import budget
 
 load_dotenv()
 
@@ -31,9 +35,33 @@ load_dotenv()
 use_cohere = True
 use_openai = False
 
+# How many messages the state keeps, older ones are dropped from the message log
+message_retention = 50
+
+# Budget of one run. Model calls still running at the deadline are cancelled
+run_seconds = 60
+run_tokens = 20_000
+# What one more improvement round is expected to cost. With less left the graph ends with the best joke so far
+reserve_seconds = 10
+reserve_tokens = 1_500
+
 # Joke topic to be used
 joke_topic = "Not funny Hello World joke"
 
+# How many candidate jokes the joke node generates concurrently. The best rated one is kept.
+# 1 = the original sequential loop. The graph loops only if every candidate is rated too low.
+candidate_count = 1
+
+# Variations mixed into the topic, so the concurrently generated candidates differ from each other
+TOPIC_VARIATIONS = [
+    "",
+    " (as a pun)",
+    " (as a one-liner)",
+    " (with an unexpected twist)",
+    " (as an absurd story)",
+    " (as a dad joke)",
+]
+
 
 # Create a prompt template, topic is a variable
 FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
@@ -55,6 +83,7 @@ IMPROVER_LLM_PROMPT = ChatPromptTemplate.from_template(
 )
 
 
+@structured_output.register_schema
 class FunnySchema(BaseModel):
     topic: str = Field(
         description="The topic of the joke",
@@ -69,6 +98,7 @@ class FunnySchema(BaseModel):
         description="Why the joke is rated this way",
     )
     
+@structured_output.register_schema
 class ImprovedJokeSchema(BaseModel):
     suggestions: List[str] = Field(
         description="Suggestions to improve the joke",
@@ -78,56 +108,94 @@ class ImprovedJokeSchema(BaseModel):
     )
 
 class AgentState(TypedDict):
-    messages: List[str]
+    # Bounded message log. Nodes return new messages, which are appended to it
+    messages: Annotated[Deque[Record], channels.ring_buffer(message_retention)]
     joke_topic: str
     generated_joke: str
     joke_rating: int
     iteration: int
-    LLM_model: RunnableSequence
-
-def joker_agent(state: AgentState) -> AgentState:
+    candidate_count: int
+    # Best joke of the whole run, returned when the budget runs out
+    best_joke: str
+    best_rating: int
+    # Run's budget (see graph_utils/budget.py). Nodes subtract the tokens they use
+    deadline: float
+    tokens_left: int
+
+# The model isn't part of the state, nodes find it with the model key given in the graph's config
+# Nodes are async, so model calls can be cancelled when the run's deadline passes
+async def joker_agent(state: AgentState, config: RunnableConfig) -> dict:
     print(f"\n**Joker Agent**")
-    prompt = FUNNY_LLM_PROMPT.format(topic=state["joke_topic"])
-    structured_LLM = state["LLM_model"].with_structured_output(FunnySchema)
-    res = structured_LLM.invoke(prompt)
+    count = state.get("candidate_count", 1)
+    topics = [state["joke_topic"] + TOPIC_VARIATIONS[i % len(TOPIC_VARIATIONS)] for i in range(count)]
+    prompts = [FUNNY_LLM_PROMPT.format(topic=topic) for topic in topics]
+    structured_LLM = structured_output.bind(models.model_from_config(config), FunnySchema)
 
     try:
-        # Store the result in the state
-        state["messages"] += [
-            AIMessage(content=f"Generated joke: {res.joke}"),
-            AIMessage(content=f"Topic: {res.topic}"),
-            AIMessage(content=f"Rating: {res.rating}"),
-        ]
-        # Store the joke in the state to easily access it later
-        state["generated_joke"] = res.joke
-        state["joke_rating"] = res.rating
+        # abatch() runs the calls concurrently. Failed candidates are returned as exceptions instead of raised
+        candidates, tokens = await budget.abatch(structured_LLM, prompts, state,
+                                                 {**config, "max_concurrency": count}, return_exceptions=True)
+    except budget.DeadlineExceeded as e:
+        print("Deadline passed, keeping the best joke so far")
+        return {"tokens_left": state["tokens_left"] - e.tokens_used}
+
+    try:
+        # Keep the best rated candidate, failed or empty responses are skipped
+        jokes = [candidate for candidate in candidates if isinstance(candidate, FunnySchema)]
+        if not jokes:
+            raise ValueError(f"All {count} candidates failed: {candidates}")
+        res = max(jokes, key=lambda joke: joke.rating)
+        if count > 1:
+            print(f"Candidate ratings: {[joke.rating for joke in jokes]}")
         print(f"Joke: {res.joke}")
         print(f"Joke rating: {res.rating}")
-        return state
+        print(f"Tokens used: {tokens}, left: {state['tokens_left'] - tokens}")
+        # Return only the changed part of the state
+        update = {
+            "messages": [
+                Record("ai", f"Generated joke: {res.joke}"),
+                Record("ai", f"Topic: {res.topic}"),
+                Record("ai", f"Rating: {res.rating}"),
+            ],
+            # Store the joke in the state to easily access it later
+            "generated_joke": res.joke,
+            "joke_rating": res.rating,
+            "tokens_left": state["tokens_left"] - tokens,
+        }
+        if res.rating > state.get("best_rating", 0):
+            update["best_joke"] = res.joke
+            update["best_rating"] = res.rating
+        return update
     except Exception as e:
         print(f"The LLM model failed with response:\n{e}\nExiting program")
         exit()
 
 
 # This agent will improve the joke if the orginal joke is not funny enough (used in the conditional edge)
-def joke_improver_agent(state: AgentState) -> AgentState:
+async def joke_improver_agent(state: AgentState, config: RunnableConfig) -> dict:
     print(f"\n**Joke Improver Agent**")
     prompt = IMPROVER_LLM_PROMPT.format(topic=state["joke_topic"], joke=state["generated_joke"])
     # Invoke the LLM with a prompt and get the structured output
-    structured_LLM = state["LLM_model"].with_structured_output(ImprovedJokeSchema)
-    res = structured_LLM.invoke(prompt)
+    structured_LLM = structured_output.bind(models.model_from_config(config), ImprovedJokeSchema)
+    try:
+        res, tokens = await budget.ainvoke(structured_LLM, prompt, state, config)
+    except budget.DeadlineExceeded as e:
+        print("Deadline passed, keeping the best joke so far")
+        return {"tokens_left": state["tokens_left"] - e.tokens_used}
 
     try:
-        # Store the result in the state
-        state["messages"] += [
-            AIMessage(content=f"Joke suggestions for new topic: {res.suggestions}"),
-            AIMessage(content=f"New topic for the joke: {res.new_topic}"),
-        ]
-        # Overwrite the joke topic with the new improved topic, so the joker agent can generate a new joke using it
-        state["joke_topic"] = res.new_topic
-        state["iteration"] += 1
         print(f"new topic: {res.new_topic}")
-        return state
+        # Return only the changed part of the state
+        return {
+            "messages": [
+                Record("ai", f"Joke suggestions for new topic: {res.suggestions}"),
+                Record("ai", f"New topic for the joke: {res.new_topic}"),
+            ],
+            # Overwrite the joke topic with the new improved topic, so the joker agent can generate a new joke using it
+            "joke_topic": res.new_topic,
+            "iteration": state["iteration"] + 1,
+            "tokens_left": state["tokens_left"] - tokens,
+        }
     except Exception as e:
         print(f"The LLM model failed with response:\n{e}\nExiting program")
         exit()
@@ -136,23 +204,30 @@ def joke_improver_agent(state: AgentState) -> AgentState:
 workflow = StateGraph(AgentState)
 
 def is_done(state):
+    # Not enough time or tokens left for another round, end with the best joke so far
+    if budget.low(state, reserve_seconds, reserve_tokens):
+        return END
     # Determ next steps after the first run
-    if state["joke_rating"] < 6:
+    if state.get("joke_rating", 0) < 6:
         if state["iteration"] > 3:
             return END
         return "joke_improver"
     else:
         return END
 
+# After the improver, generate a new joke only if the budget isn't already spent
+def has_budget(state):
+    if budget.low(state):
+        return END
+    return "joke"
+
 # Nodes
 workflow.add_node("joke", joker_agent)
 workflow.add_node("joke_improver", joke_improver_agent)
 
-# Edges
-workflow.add_edge("joke_improver", "joke")
-
-# Add conditional edge
+# Add conditional edges
 workflow.add_conditional_edges("joke", is_done)
+workflow.add_conditional_edges("joke_improver", has_budget)
 
 # Set entry point
 workflow.set_entry_point("joke")
@@ -161,32 +236,32 @@ workflow.set_entry_point("joke")
 graph = workflow.compile()
 
 
-if use_cohere:
+# The graph is only run when the file is executed directly (benchmarks import the graph from this file)
+if use_cohere and __name__ == "__main__":
     print("Running agent with Cohere:\n")    
-    cohere_chat_model = ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"))
-    res = graph.invoke({"messages": [HumanMessage(content="Not funny Hello world joke")], 
-                        "joke_topic": joke_topic,
-                        "iteration": 0,
-                        "LLM_model": cohere_chat_model})
+    res = asyncio.run(graph.ainvoke({"messages": [Record("human", "Not funny Hello world joke")], 
+                                     "joke_topic": joke_topic,
+                                     "iteration": 0,
+                                     "candidate_count": candidate_count,
+                                     **budget.new_budget(run_seconds, run_tokens)},
+                                    config=models.model_config("cohere")))
     print(f"\n\n{res}")
     print(res["messages"])
     print(res["joke_topic"])
-    print(f"\n\n{res["generated_joke"]}")
+    print(f"\n\nBest joke (rating {res.get("best_rating")}):\n{res.get("best_joke")}")
 
-if use_openai:
+if use_openai and __name__ == "__main__":
     print("Running agent with OpenAI:\n")    
-    openai_chat_model = ChatOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",
-    ) 
-    res = graph.invoke({"messages": [HumanMessage(content="Not funny Hello world joke")], 
-                        "joke_topic": joke_topic,
-                        "iteration": 0,
-                        "LLM_model": openai_chat_model})
+    res = asyncio.run(graph.ainvoke({"messages": [Record("human", "Not funny Hello world joke")], 
+                                     "joke_topic": joke_topic,
+                                     "iteration": 0,
+                                     "candidate_count": candidate_count,
+                                     **budget.new_budget(run_seconds, run_tokens)},
+                                    config=models.model_config("openai:gpt-4o-mini")))
     print(f"\n\n{res}")
     print(res["messages"])
     print(res["joke_topic"])
-    print(f"\n\n{res["generated_joke"]}")    
+    print(f"\n\nBest joke (rating {res.get("best_rating")}):\n{res.get("best_joke")}")
 
 #GRAPH WILL LOOK LIKE THIS
 #                  +------------------+
@@ -2,11 +2,19 @@
 '''
     Defines tools for the agent to use. 
     The agent's path is practically one node which does simple a calculation.
+    The graph has no LLM calls, so by default it runs on the minimal executor of graph_utils/executor.py.
+    The node is memoized on the two numbers, the tool is called only once for the same input.
+    The tool also has a vectorized NumPy version, which adds a whole batch of numbers in one call (batch mode at the end).
 '''
 
 from langchain_core.tools import tool
 from langgraph.graph import END, StateGraph
 from typing import List, TypedDict
+from graph_utils import batch_tools, executor, memo
+
+# The graph has only plain Python nodes, so it can run on the lightweight executor (graph_utils/executor.py)
+# instead of the full LangGraph runtime. Set to False to run the same definitions with LangGraph
+use_fast_executor = True
 
 # Decorator declared this function as a tool and can now be user with .invoke()
 @tool
@@ -14,21 +22,27 @@ def add_tool(a: int, b:int) -> int:
     """Adds a and b"""
     return a + b
 
+# Batch implementation of the same tool. Gets NumPy arrays of a and b, adds them in one go
+@batch_tools.vectorized(add_tool)
+def add_many(a, b):
+    return a + b
+
 # Agents state
 class AgentState(TypedDict):
     number_a: int
     number_b: int
     number_sum: int
 
-def add_agent(state: AgentState) -> AgentState:
+# The sum depends only on the two numbers, so the update is cached per (number_a, number_b)
+@memo.node(keys=("number_a", "number_b"))
+def add_agent(state: AgentState) -> dict:
     # Tools have to be invoked rather than simply called because metadata is passed within langchain
     result = add_tool.invoke({"a": state["number_a"], "b": state["number_b"]})
-    state["number_sum"] = result
-    return state
+    return {"number_sum": result}
 
 
 # Create a graph with the state
-workflow = StateGraph(AgentState)
+workflow = (executor.StateGraph if use_fast_executor else StateGraph)(AgentState)
 
 # Nodes             name     function
 workflow.add_node("entry", add_agent)
@@ -52,3 +66,15 @@ print(res["number_a"])
 print(res["number_b"])
 print(res["number_sum"])
 
+# Same numbers again, the tool isn't invoked this time
+res = graph.invoke({"number_a": 1,
+                    "number_b": 1,
+                    "number_sum": 0})
+print(res["number_sum"])
+memo.print_stats()
+
+
+
+# Batch mode: many additions with one NumPy call instead of invoking the tool for every pair
+pairs = [{"a": number, "b": number * 10} for number in range(1, 6)]
+print(batch_tools.invoke_batch(add_tool, pairs))
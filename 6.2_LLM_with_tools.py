@@ -4,16 +4,28 @@
     The bad_add_tool is infected with bad math for demonstration purposes.
     Note how the LLM contorts to the tool's will.
 
+    The model and the tools take turns in a small graph:
+    - "agent" node invokes the model with the tools bound to it
+    - "tools" node runs all the tool calls of the model's answer concurrently (graph_utils/tool_node.py)
+    - the graph loops agent -> tools -> agent until the model answers without tool calls
+
     Differences between language models:
     - Both models seem to be equally valid.
 '''
 
-import os
+import asyncio
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, StateGraph
+from typing import Annotated, TypedDict
+# Model registry, the model is given in the graph's config
+from llm_utils import models
+# Append-only state channels
+from graph_utils import channels
+# Tool registry: tool lookup, binding and concurrent tool calls
+from graph_utils.tool_node import ToolRegistry
 
 load_dotenv()
 
@@ -32,75 +44,70 @@ def bad_add_tool(a: int, b:int) -> int:
     return a + b + 5
 
 # Multiple tools can be used if they are in same list
-tools = [bad_add_tool]
-
-
-if use_cohere:
-    print(f"\n\n****************** Cohere's results: ******************\n")
-    api_key = os.getenv("COHERE_API_KEY")
-    cohere_chat_model = ChatCohere(cohere_api_key=api_key)
-    
-    # Ration the model with tools
-    llm_with_tools = cohere_chat_model.bind_tools(tools)
-
-    # A list to hold the conversation. Necessary for extracting the final otuput
-    messages = [HumanMessage(query)]
-    ai_message = llm_with_tools.invoke(messages)
-
-    # Print initial values
-    print(f"*** First stage output:\n{ai_message}")
-    print(f"\n*** Focus on the 'tools' part:\n{ai_message.tool_calls}")
-    messages.append(ai_message)
-    print(f"\n*** Note the content of the message:\n{ai_message.content}")
-    print(f"\n*** Messages before extracting the tool values:\n{messages}")
-
-    # Iterate over all the tool calls used in the query
-    for tool_call in ai_message.tool_calls:
-        #               List all the used tools here
-        selected_tool = {"bad_add_tool": bad_add_tool}[tool_call["name"].lower()]
-        #               Invokes the used tool with the tool call 
-        ai_message = selected_tool.invoke(tool_call)
-        messages.append(ai_message)
-    print(f"\n*** The messages after extracting the tool values:\n{messages}")
-    # Invokes the LLM again with the extracted messages
-    final_response = llm_with_tools.invoke(messages)
-    # Now the output is more user friendly yet still uses the defined tools
-    print(f"\n*** Final reponse:\n{final_response}")
-    print(f"\n*** Final content (Note the math is bad, but consistent with bad_add_tool):\n{final_response.content}")
-
- 
-if use_openai:
-    print(f"\n\n****************** OpenAI's results: ****************** \n")
-    api_key = os.getenv("OPENAI_API_KEY")
-    openai_chat_model = ChatOpenAI(
-        api_key=api_key,
-        model="gpt-4o-mini",
-    )
-
-    # Ration the model with tools
-    llm_with_tools = openai_chat_model.bind_tools(tools)
-
-    # A list to hold the conversation. Necessary for extracting the final otuput
-    messages = [HumanMessage(query)]
-    ai_message = llm_with_tools.invoke(messages)
-
-    # Print initial values
-    print(f"*** First stage output:\n{ai_message}")
-    print(f"\n*** Focus on the 'tools' part:\n{ai_message.tool_calls}")
-    messages.append(ai_message)
-    print(f"\n*** Note the content of the message:\n{ai_message.content}")
-    print(f"\n*** Messages before extracting the tool values:\n{messages}")
-
-    # Iterate over all the tool calls used in the query
-    for tool_call in ai_message.tool_calls:
-        #               List all the used tools here
-        selected_tool = {"bad_add_tool": bad_add_tool}[tool_call["name"].lower()]
-        #               Invokes the used tool with the tool call 
-        ai_message = selected_tool.invoke(tool_call)
-        messages.append(ai_message)
-    print(f"\n*** The messages after extracting the tool values:\n{messages}")
-    # Invokes the LLM again with the extracted messages
-    final_response = llm_with_tools.invoke(messages)
+# The registry is built once. A tool call that takes longer than the timeout is answered with an error
+tools = ToolRegistry([bad_add_tool], timeout=10)
+
+
+# Agents state
+class AgentState(TypedDict):
+    # The conversation. The model needs the whole of it (tool calls and their results) on every turn
+    messages: Annotated[channels.AppendLog, channels.append]
+
+async def agent(state: AgentState, config: RunnableConfig) -> dict:
+    # Ration the model with tools (bound once per model)
+    llm_with_tools = tools.bind(models.model_from_config(config))
+    ai_message = await llm_with_tools.ainvoke(list(state["messages"]))
+    if ai_message.tool_calls:
+        print(f"\n*** The model asks for tools:\n{ai_message.tool_calls}")
+    return {"messages": [ai_message]}
+
+
+# Create a graph with the state
+workflow = StateGraph(AgentState)
+
+# Nodes
+workflow.add_node("agent", agent)
+workflow.add_node("tools", tools.node)
+
+# Edges: to the tools while the model asks for them, otherwise the model's answer is final
+workflow.add_conditional_edges("agent", tools.route)
+workflow.add_edge("tools", "agent")
+
+# Set entry point
+workflow.set_entry_point("agent")
+
+# Build the graph
+graph = workflow.compile()
+
+
+providers = [("Cohere", "cohere", use_cohere), ("OpenAI", "openai:gpt-4o-mini", use_openai)]
+
+for name, model_key, used in providers:
+    if not used:
+        continue
+    print(f"\n\n****************** {name}'s results: ******************\n")
+    res = asyncio.run(graph.ainvoke({"messages": [HumanMessage(query)]},
+                                    config=models.model_config(model_key)))
+    messages = res["messages"]
+    print(f"\n*** The whole conversation:\n{messages}")
     # Now the output is more user friendly yet still uses the defined tools
-    print(f"\n*** Final reponse:\n{final_response}")
-    print(f"\n*** Final content (Note the math is bad, but consistent with bad_add_tool):\n{final_response.content}")
+    print(f"\n*** Final content (Note the math is bad, but consistent with bad_add_tool):\n{messages[-1].content}")
+
+
+# The graph will look like this:
+#                  +-----------------+
+#                  | Start (Entry)   |
+#                  +--------+--------+
+#                           |
+#                           v
+#                  +--------+--------+
+#                  |  "agent" Node   |<---+
+#                  |  (model)        |    |
+#                  +--------+--------+    |
+#                           |             |
+#              (tool calls) v             |
+#                  +--------+--------+    |
+#                  |  "tools" Node   |----+
+#                  +-----------------+
+#
+#          (no tool calls) -> END
@@ -5,25 +5,34 @@
     - Database is initialized and some jokes are inserted into it on the start (if not already)
     - Use the database tables and their descriptions in the prompt, so the agent can generate a query to insert the joke
     - If inserted joke is a duplicate, the database will raise an error (and app will end without inserting the joke)
+    - The state is checkpointed into SQLite after every node. Every run gets a new run id, giving the id of an earlier
+      run resumes it instead: python 6_database_and_agents.py <run id>
+    - Each run has a deadline and a token budget. When they run low the graph ends with the best joke so far
 '''
 
 
-import os
+import asyncio
 import sqlite3 # for database
-from langchain_openai import ChatOpenAI
-from langchain_cohere import ChatCohere 
+import sys
+import uuid
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import (
-    HumanMessage,
-    AIMessage
-)
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
+from typing import Annotated, Deque, List, TypedDict
 from dotenv import load_dotenv
-from langchain_core.runnables.base import RunnableSequence
+# The graph's config tells the nodes which model to use
+from langchain_core.runnables import RunnableConfig
+# Model registry (models are looked up by a short key) and cached structured output runnables
+from llm_utils import models, structured_output
+# Append-only state channels and the compact message record
+from graph_utils import channels
+from graph_utils.channels import Record
 #DATABASE THINGS
 from database import init_db, sql
+# Stores the state after every node, so a crashed run can be resumed
+from graph_utils.checkpoint import Checkpointer
+# Deadlines and token budgets of the runs
+from graph_utils import budget
 
 load_dotenv()
 
@@ -31,6 +40,23 @@ load_dotenv()
 use_cohere = False
 use_openai = True
 
+# How many messages the state keeps, older ones are dropped from the message log
+message_retention = 50
+
+# Budget of one run. Model calls still running at the deadline are cancelled
+run_seconds = 90
+run_tokens = 30_000
+# What one more round is expected to cost. With less left the graph ends with the best joke so far
+reserve_seconds = 10
+reserve_tokens = 1_500
+
+# Runs with the same id continue from their last checkpoint. Finished runs just return their final state.
+# A new id for every run, unless the id of an earlier run is given on the command line
+if __name__ == "__main__" and len(sys.argv) > 1:
+    run_id = sys.argv[1]
+else:
+    run_id = f"bengal-cat-joke-{uuid.uuid4().hex[:8]}"
+
 
 # Initialize the database, create the table and insert some jokes to it
 init_db.initialize_database("database/jokes.db")
@@ -82,6 +108,7 @@ DATABASE_QUERY_LLM_PROMPT = ChatPromptTemplate.from_template(
 )
 
 
+@structured_output.register_schema
 class FunnySchema(BaseModel):
     topic: str = Field(
         description="The topic of the joke",
@@ -96,6 +123,7 @@ class FunnySchema(BaseModel):
         description="Why the joke is rated this way",
     )
     
+@structured_output.register_schema
 class ImprovedJokeSchema(BaseModel):
     suggestions: List[str] = Field(
         description="Suggestions to improve the joke",
@@ -105,75 +133,102 @@ class ImprovedJokeSchema(BaseModel):
     )
     
 # Create a Pydantic model for the query    
+@structured_output.register_schema
 class QuerySchema(BaseModel):
     query: str = Field(
         description="The generated query to find the closest jokes to the given topic",
     )
 
 class AgentState(TypedDict):
-    messages: List[str]
+    # Bounded message log. Nodes return new messages, which are appended to it
+    messages: Annotated[Deque[Record], channels.ring_buffer(message_retention)]
     joke_topic: str
     generated_joke: str
     joke_rating: int
     iteration: int
-    LLM_model: RunnableSequence
-
-
-def joker_agent(state: AgentState) -> AgentState:
+    # Best joke of the whole run, returned when the budget runs out
+    best_joke: str
+    best_rating: int
+    # Run's budget (see graph_utils/budget.py). Nodes subtract the tokens they use
+    deadline: float
+    tokens_left: int
+    # Set by the checkpointer when a run is resumed, name of the last node that completed
+    last_node: str
+
+
+# The model isn't part of the state, nodes find it with the model key given in the graph's config
+# Nodes are async, so model calls can be cancelled when the run's deadline passes
+async def joker_agent(state: AgentState, config: RunnableConfig) -> dict:
     print(f"\n**Joker Agent**")
-    structured_llm = state["LLM_model"].with_structured_output(FunnySchema)
+    structured_llm = structured_output.bind(models.model_from_config(config), FunnySchema)
     prompt = FUNNY_LLM_PROMPT.format(topic=state["joke_topic"])
-    res = structured_llm.invoke(prompt)
+    try:
+        res, tokens = await budget.ainvoke(structured_llm, prompt, state, config)
+    except budget.DeadlineExceeded as e:
+        print("Deadline passed, keeping the best joke so far")
+        return {"tokens_left": state["tokens_left"] - e.tokens_used}
 
     try:
-        state["messages"] += [
-            AIMessage(content=f"Generated joke: {res.joke}"),
-            AIMessage(content=f"Topic: {res.topic}"),
-            AIMessage(content=f"Rating: {res.rating}"),
-        ]
-        state["generated_joke"] = res.joke
-        state["joke_rating"] = res.rating
         print(f"Joke: {res.joke}")
         print(f"Joke rating: {res.rating}")
-        return state
+        update = {
+            "messages": [
+                Record("ai", f"Generated joke: {res.joke}"),
+                Record("ai", f"Topic: {res.topic}"),
+                Record("ai", f"Rating: {res.rating}"),
+            ],
+            "generated_joke": res.joke,
+            "joke_rating": res.rating,
+            "tokens_left": state["tokens_left"] - tokens,
+        }
+        if res.rating > state.get("best_rating", 0):
+            update["best_joke"] = res.joke
+            update["best_rating"] = res.rating
+        return update
     except Exception as e:
         print(f"The LLM model failed with response:\n{e}\nExiting program")
         exit()
 
-def joke_improver_agent(state: AgentState) -> AgentState:
+async def joke_improver_agent(state: AgentState, config: RunnableConfig) -> dict:
     print(f"\n**Joke Improver Agent**")
-    structured_llm = state["LLM_model"].with_structured_output(ImprovedJokeSchema)
+    structured_llm = structured_output.bind(models.model_from_config(config), ImprovedJokeSchema)
     prompt = IMPROVER_LLM_PROMPT.format(topic=state["joke_topic"], joke=state["generated_joke"])
-    res = structured_llm.invoke(prompt)
+    try:
+        res, tokens = await budget.ainvoke(structured_llm, prompt, state, config)
+    except budget.DeadlineExceeded as e:
+        print("Deadline passed, keeping the best joke so far")
+        return {"tokens_left": state["tokens_left"] - e.tokens_used}
 
     try:
-        state["messages"] += [
-            AIMessage(content=f"Joke suggestions for new topic: {res.suggestions}"),
-            AIMessage(content=f"New topic for the joke: {res.new_topic}"),
-        ]
-        state["joke_topic"] = res.new_topic
-        state["iteration"] += 1
         print(f"new topic: {res.new_topic}")
-        return state
+        return {
+            "messages": [
+                Record("ai", f"Joke suggestions for new topic: {res.suggestions}"),
+                Record("ai", f"New topic for the joke: {res.new_topic}"),
+            ],
+            "joke_topic": res.new_topic,
+            "iteration": state["iteration"] + 1,
+            "tokens_left": state["tokens_left"] - tokens,
+        }
     except Exception as e:
         print(f"The LLM model failed with response:\n{e}\nExiting program")
         exit()
 
-def database_query_agent(state: AgentState) -> AgentState:
+async def database_query_agent(state: AgentState, config: RunnableConfig) -> dict:
     print(f"\n**Database Query Agent**")
     # Use created schema to structure the output
-    structured_llm = state["LLM_model"].with_structured_output(QuerySchema)
+    structured_llm = structured_output.bind(models.model_from_config(config), QuerySchema)
     prompt = DATABASE_QUERY_LLM_PROMPT.format(topic=state["joke_topic"], 
                                               tables=tables, 
                                               table_descriptions=description_of_tables, 
                                               joke=state["generated_joke"], 
                                               rating=state["joke_rating"])
     # Invoke the LLM with a prompt and get the structured output
-    res = structured_llm.invoke(prompt)
-    # Store the result in the state
-    state["messages"] += [
-        AIMessage(content=f"Generated query: {res.query}"),
-    ]
+    try:
+        res, tokens = await budget.ainvoke(structured_llm, prompt, state, config)
+    except budget.DeadlineExceeded as e:
+        print("Deadline passed, the joke is not inserted")
+        return {"tokens_left": state["tokens_left"] - e.tokens_used}
     print(f"Generated query: {res.query}")
     
     try:
@@ -182,7 +237,9 @@ def database_query_agent(state: AgentState) -> AgentState:
     except Exception as e:
         print(f"Error: {e}")
     
-    return state
+    # Store the result in the state
+    return {"messages": [Record("ai", f"Generated query: {res.query}")],
+            "tokens_left": state["tokens_left"] - tokens}
     
 
 # Create a graph with the state
@@ -194,53 +251,86 @@ workflow.add_node("database_query", database_query_agent)
 workflow.add_node("joke_improver", joke_improver_agent)
 
 # Edges
-workflow.add_edge("joke_improver", "joke")
 workflow.add_edge("database_query", END)
 
 def is_done(state):
+    # Not enough time or tokens left for another round (or the database query),
+    # end with the best joke so far without inserting it
+    if budget.low(state, reserve_seconds, reserve_tokens):
+        return END
     # Determ next steps after the first run
-    if state["joke_rating"] < 5:
+    if state.get("joke_rating", 0) < 5:
         if state["iteration"] > 5:
             return END
         return "joke_improver"
     else:
         return "database_query"
 
-# Add conditional edge
-workflow.add_conditional_edges("joke", is_done)
+# After the improver, generate a new joke only if the budget isn't already spent
+def has_budget(state):
+    if budget.low(state):
+        return END
+    return "joke"
 
-# Set entry point
-workflow.set_entry_point("joke")
+# Add conditional edges
+workflow.add_conditional_edges("joke", is_done)
+workflow.add_conditional_edges("joke_improver", has_budget)
+
+# Entry point. A resumed run continues from the node that follows the last completed one
+def resume_entry(state):
+    last_node = state.get("last_node")
+    if last_node == "joke":
+        return is_done(state)
+    if last_node == "joke_improver":
+        return has_budget(state)
+    if last_node == "database_query":
+        return END
+    # Fresh run
+    return "joke"
+
+workflow.set_conditional_entry_point(resume_entry)
 
 # Build the graph
 graph = workflow.compile()
 
+checkpointer = Checkpointer("database/checkpoints.db")
+
+
+# Initial state of a run. Also used by the batch runner (graph_utils/batch_runner.py), one run per topic
+def initial_state(joke_topic):
+    return {"messages": [Record("human", joke_topic)],
+            "joke_topic": joke_topic,
+            "iteration": 0,
+            **budget.new_budget(run_seconds, run_tokens)}
+
+
+if __name__ == "__main__":
+    print(f"\nRun id: {run_id}, resume it with: python 6_database_and_agents.py {run_id}")
 
-if use_cohere:
+if use_cohere and __name__ == "__main__":
     print("\nRunning graph with Cohere:\n")
-    cohere_chat_model = ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"))
-    res = graph.invoke({"messages": [HumanMessage(content="Very bad joke about bengal cats")], 
-                        "joke_topic": "Very bad joke about bengal cats", 
-                        "iteration": 0,
-                        "LLM_model": cohere_chat_model})
+    res = asyncio.run(checkpointer.arun(graph,
+                                        initial_state("Very bad joke about bengal cats"),
+                                        run_id=f"{run_id}-cohere",
+                                        # A resumed run gets a new deadline, the tokens left come from the checkpoint
+                                        restore={"deadline": budget.deadline_in(run_seconds)},
+                                        config=models.model_config("cohere")))
 
     print(f"\n\n{res}")
     print(res["messages"])
     print(res["joke_topic"])
-    print(f"\n\n{res["generated_joke"]}")
+    print(f"\n\nBest joke (rating {res.get("best_rating")}):\n{res.get("best_joke")}")
 
-if use_openai:
+if use_openai and __name__ == "__main__":
     print("\nRunning graph with OpenAI:\n")
-    openai_chat_model = ChatOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",
-    ) 
-    res = graph.invoke({"messages": [HumanMessage(content="Very bad joke about bengal cats")], 
-                        "joke_topic": "Very bad joke about bengal cats", 
-                        "iteration": 0,
-                        "LLM_model": openai_chat_model})
+    res = asyncio.run(checkpointer.arun(graph,
+                                        initial_state("Very bad joke about bengal cats"),
+                                        run_id=f"{run_id}-openai",
+                                        # A resumed run gets a new deadline, the tokens left come from the checkpoint
+                                        restore={"deadline": budget.deadline_in(run_seconds)},
+                                        config=models.model_config("openai:gpt-4o-mini")))
 
     print(f"\n\n{res}")
     print(res["messages"])
     print(res["joke_topic"])
-    print(f"\n\n{res["generated_joke"]}")
+    print(f"\n\nBest joke (rating {res.get("best_rating")}):\n{res.get("best_joke")}")
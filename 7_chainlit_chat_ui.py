@@ -6,22 +6,46 @@
     - The bot generates jokes based on a user-provided topic
     - A schema is added to structure the output from the language model, including the joke and its rating
     - The LLM output is sent back to the user via Chainlit's messaging interface
+    - Users asking about the same topic at the same time share one LLM call (chainlit_utils/single_flight.py)
+    - Only a few messages are handled at once, the rest wait in a queue or get a quick "busy" answer (chainlit_utils/admission.py)
+    - Popular topics are answered at once from a pool of jokes generated in the background (chainlit_utils/joke_pool.py)
+    - Prometheus metrics on http://localhost:8000/metrics (chainlit_utils/metrics.py)
 '''
 
 
-import os
 import chainlit as cl
-from langchain_openai import ChatOpenAI
-from langchain_cohere import ChatCohere 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from dotenv import load_dotenv
+# Model registry and cached structured output runnables
+from llm_utils import ledger, models, structured_output
+# Concurrent identical prompts share one LLM call
+from chainlit_utils.single_flight import SingleFlight, make_key
+# Limits how many messages are handled at once
+from chainlit_utils.admission import INTERACTIVE, AdmissionController, Busy
+# Pre-generated jokes for the popular topics
+from chainlit_utils.joke_pool import JokePool, PoolWarmer
+# Latencies, LLM calls and tokens, cache hit ratios for /metrics
+from chainlit_utils import metrics
+# Record / replay of the HTTP traffic (HTTP_CASSETTE=<file>, HTTP_CASSETTE_MODE=replay|record|auto)
+from llm_utils import http_cassettes
 
 load_dotenv()
+http_cassettes.install_from_env()
 
 
 # Select which models you want to use. Cohere = True, OpenAI = False
 use_cohere = False
+model_key = "cohere" if use_cohere else "openai:gpt-4o-mini"
+
+# Shared by all the chat sessions. flights.stats counts the coalesced requests
+flights = SingleFlight()
+
+# At most 8 messages are handled at once. If the wait in the queue would be over 10 s, the user is told to try later
+admission = AdmissionController(max_concurrent=8, max_wait=10)
+
+# The answer for a message that doesn't fit in the queue
+BUSY_MESSAGE = "Sorry, too many people want jokes right now. Please try again in {seconds:.0f} seconds"
 
 
 FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
@@ -32,6 +56,7 @@ FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
 )
 
 
+@structured_output.register_schema
 class FunnySchema(BaseModel):
     topic: str = Field(
         description="The topic of the joke",
@@ -47,31 +72,72 @@ class FunnySchema(BaseModel):
     )
 
 
+# Good jokes (rating 7 or more) for the 10 most asked topics, made while the app is not busy.
+# Every pooled joke is told once and only within 6 hours after it was made
+pool = JokePool(FunnySchema, db_path="database/joke_pool.db", min_rating=7, max_serves=1, max_age_seconds=6 * 3600)
+
+
+async def generate_joke(topic):
+    # The model is created once and reused by all the sessions
+    structured_llm = structured_output.bind(models.get_model(model_key), FunnySchema)
+    # The callback counts the LLM calls and tokens for /metrics
+    return await structured_llm.ainvoke(FUNNY_LLM_PROMPT.format(topic=topic), config={"callbacks": [metrics.llm_callback]})
+
+
+# Checks the pool every 5 seconds, keeps 2 places of the admission controller free for the users
+warmer = PoolWarmer(pool, generate_joke, admission, interval=5, reserve=2)
+
+# GET /metrics on the Chainlit server. The stats of the helpers are read when the metrics are scraped
+metrics.add_route()
+metrics.watch_admission(admission)
+metrics.watch_flights(flights, "llm")
+metrics.watch_pool(pool, warmer)
+
+
 # CHAINLIT - first message when chat starts
 @cl.on_chat_start
+@metrics.timed("on_chat_start")
 async def on_chat_start():
+    metrics.SESSIONS_ACTIVE.inc()
+    # Runs in the background, started here because the event loop is running now
+    warmer.start()
     await cl.Message(
         content="Hello! I am a funny chatbot. I can make jokes about any topic. What topic would you like me to make a joke about?"
     ).send()
 
 
 # chainlit - send the joke to the user
+@cl.on_chat_end
+async def on_chat_end():
+    metrics.SESSIONS_ACTIVE.dec()
+
+
 @cl.on_message
+@metrics.timed("on_message")
 async def main(message: cl.Message):
-    structured_llm = None
-    if use_cohere:
-        cohere_chat_model = ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"))
-        structured_llm = cohere_chat_model.with_structured_output(FunnySchema)
-    else:
-        openai_chat_model = ChatOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            model="gpt-4o-mini",
-        )
-        structured_llm = openai_chat_model.with_structured_output(FunnySchema)
+    # A fresh joke from the pool needs no LLM call and no place in the queue
+    res = pool.take(message.content)
+    if res is not None:
+        # Recorded in the token ledger as a call that cost nothing
+        ledger.record_cache_hit(model_key, node="joke_pool")
+        await send_joke(res)
+        return
+    try:
+        async with admission.slot(INTERACTIVE):
+            await tell_joke(message)
+    except Busy as e:
+        await cl.Message(BUSY_MESSAGE.format(seconds=e.retry_after)).send()
+
 
+async def tell_joke(message: cl.Message):
     prompt = FUNNY_LLM_PROMPT.format(topic=message.content)
-    # Invoke the LLM with a prompt and get the structured output
-    res = await structured_llm.ainvoke(prompt)
+    # Invoke the LLM with a prompt and get the structured output.
+    # If another user is already waiting for the same prompt, wait for that answer instead
+    res = await flights.do(make_key(prompt, model_key, FunnySchema), lambda: generate_joke(message.content))
+    await send_joke(res)
+
+
+async def send_joke(res):
     if res == None:
         await cl.Message(f"Model failed to generate response").send()    
     else:
@@ -7,32 +7,84 @@
     - Use Chainlit to manage the chatbot interface and interaction
     - Use a state graph to manage the agent's workflow, starting with an API call and followed by the joke generation
     - The final joke is personalized and structured with a rating before being sent to the user via Chainlit
+    - The API is called with a shared async HTTP client (chainlit_utils/http_client.py): the event loop isn't blocked,
+      responses are cached and revalidated, concurrent users asking for the same data share one request
+    - Users asking for the same joke at the same time share one LLM call (chainlit_utils/single_flight.py)
+    - Only a few graph runs are going on at once, other messages wait in a queue or get a quick "busy" answer (chainlit_utils/admission.py)
+    - JOKE_API_URL selects the API, ie. the local stand-in: python -m chainlit_utils.stub_api
+    - Prometheus metrics on http://localhost:8000/metrics: handler and node latencies, LLM calls and tokens,
+      cache hit ratios, the queue (chainlit_utils/metrics.py)
+    - HTTP_CASSETTE=<file> records or replays the API and LLM traffic, so a session can be replayed offline
+      (llm_utils/http_cassettes.py)
+    - The answer is one message updated in place (chainlit_utils/progress.py): the graph is consumed as a stream of
+      events, the message shows when the API node has finished and the joke as its tokens arrive.
+      use_streaming = False waits for the whole graph instead
 '''
 
 
 import os
+import warnings
 import chainlit as cl
-import requests
-from langchain_openai import ChatOpenAI
-from langchain_cohere import ChatCohere
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
 from langgraph.graph import END, StateGraph
-from typing import List, TypedDict
+from typing import Annotated, Deque, TypedDict
 from dotenv import load_dotenv
+# The graph's config tells the nodes which model to use
+from langchain_core.runnables import RunnableConfig
+# Append-only state channels and the compact message record
+from graph_utils import channels
+from graph_utils.channels import Record
+# Shared async HTTP client with a response cache
+from chainlit_utils.http_client import HttpClient
+# Concurrent identical prompts share one LLM call
+from chainlit_utils.single_flight import SingleFlight, make_key
+# One message per answer, updated as the graph runs
+from chainlit_utils.progress import ProgressMessage
+# Limits how many graph runs are going on at once
+from chainlit_utils.admission import INTERACTIVE, AdmissionController, Busy
+# Model registry and cached structured output runnables
+from llm_utils import models, structured_output
+# Latencies, LLM calls and tokens, cache hit ratios for /metrics
+from chainlit_utils import metrics
+# Record / replay of the HTTP traffic (HTTP_CASSETTE=<file>, HTTP_CASSETTE_MODE=replay|record|auto)
+from llm_utils import http_cassettes
+# Per node profiles of the graph runs with GRAPH_PROFILE=1 (graph_utils/profiling.py)
+from graph_utils import profiling
 
 
 load_dotenv()
+http_cassettes.install_from_env()
+profiling.enable_from_env()
 
+# astream_events (the streamed answer) is marked beta
+warnings.filterwarnings("ignore", message="This API is in beta")
 
 
-api_key = os.getenv("OPENAI_API_KEY")
+# One client for all the chat sessions. The user data changes rarely, so it is cached for 5 minutes
+api = HttpClient(os.getenv("JOKE_API_URL", "https://jsonplaceholder.typicode.com"), timeout=5, ttl=300)
 
-llm = ChatOpenAI(
-    api_key=api_key,
-    model="gpt-4o-mini",
-)
+# Shared by all the chat sessions. flights.stats counts the coalesced requests
+flights = SingleFlight()
+
+# At most 8 graph runs at once. If the wait in the queue would be over 10 s, the user is told to try later
+admission = AdmissionController(max_concurrent=8, max_wait=10)
+
+# The answer for a message that doesn't fit in the queue
+BUSY_MESSAGE = "Sorry, too many people want jokes right now. Please try again in {seconds:.0f} seconds"
+
+# Model used by the graph (llm_utils/models.py)
+model_key = "openai:gpt-4o-mini"
+
+# Show the progress of the graph and the joke's tokens while it runs, instead of only the final joke
+use_streaming = True
+
+# GET /metrics on the Chainlit server. The stats of the helpers are read when the metrics are scraped
+metrics.add_route()
+metrics.watch_admission(admission)
+metrics.watch_flights(flights, "llm")
+metrics.watch_flights(api.flights, "joke_api")
+metrics.watch_http(api, "joke_api")
 
 
 FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
@@ -43,6 +95,7 @@ FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
     """
 )
 
+@structured_output.register_schema
 class FunnySchema(BaseModel):
     topic: str = Field(
         description="The topic of the joke",
@@ -58,38 +111,43 @@ class FunnySchema(BaseModel):
     )
 
 class AgentState(TypedDict):
-    messages: List[str]
+    # Bounded message log. Nodes return new messages, which are appended to it
+    messages: Annotated[Deque[Record], channels.ring_buffer(50)]
     joke_topic: str
     generated_joke: str
     person_name: str
 
 
-async def api_agent(state: AgentState) -> AgentState:
-    url = "https://jsonplaceholder.typicode.com/users/1"
-    response = requests.get(url)
-    await cl.Message(content=f"API response: {response.json()}").send()
-    state["messages"] += AIMessage(content=f"API response: {response.json()}")
-    state["person_name"] = response.json()["name"]
-    return state
+async def api_agent(state: AgentState) -> dict:
+    # Awaiting the request lets the other users' sessions run meanwhile
+    user = await api.get_json("/users/1")
+    # The handler shows the result when the node has finished
+    return {
+        "messages": [Record("ai", f"API response: {user}")],
+        "person_name": user["name"],
+    }
 
 
-def joker_agent(state: AgentState) -> AgentState:
+async def joker_agent(state: AgentState, config: RunnableConfig) -> dict:
     # Use created schema to structure the output
-    structured_llm = llm.with_structured_output(FunnySchema)
+    structured_llm = structured_output.bind(models.model_from_config(config), FunnySchema)
     prompt = FUNNY_LLM_PROMPT.format(
         topic=state["joke_topic"], name=state["person_name"]
     )
-    # Invoke the LLM with a prompt and get the structured output
-    res = structured_llm.invoke(prompt)
-    # Store the result in the state
-    state["messages"] += [
-        AIMessage(content=f"Generated joke: {res.joke}"),
-        AIMessage(content=f"Topic: {res.topic}"),
-        AIMessage(content=f"Rating: {res.rating}"),
-    ]
-    # Store the joke in the state to easily access it later
-    state["generated_joke"] = res.joke
-    return state
+    # Invoke the LLM with a prompt and get the structured output.
+    # If another user is already waiting for the same prompt, wait for that answer instead
+    # (its tokens are streamed to the user whose call it is, the others get the joke when it is ready)
+    res = await flights.do(make_key(prompt, config["configurable"]["model"], FunnySchema), lambda: structured_llm.ainvoke(prompt))
+    # Return only the changed part of the state
+    return {
+        "messages": [
+            Record("ai", f"Generated joke: {res.joke}"),
+            Record("ai", f"Topic: {res.topic}"),
+            Record("ai", f"Rating: {res.rating}"),
+        ],
+        # Store the joke in the state to easily access it later
+        "generated_joke": res.joke,
+    }
 
 
 # Create a graph with the state
@@ -112,27 +170,65 @@ graph = workflow.compile()
 
 # CHAINLIT - first message when chat starts
 @cl.on_chat_start
+@metrics.timed("on_chat_start")
 async def on_chat_start():
+    metrics.SESSIONS_ACTIVE.inc()
     await cl.Message(
         content="Hello! I am a funny chatbot. I can make jokes about any topic. What topic would you like me to make a joke about?"
     ).send()
 
+@cl.on_chat_end
+async def on_chat_end():
+    metrics.SESSIONS_ACTIVE.dec()
+
+# Runs the graph as a stream of events and shows them in the progress message. Returns the final state
+async def stream_graph(state, config, progress):
+    res = None
+    async for event in graph.astream_events(state, config, version="v2"):
+        kind = event["event"]
+        node = event["metadata"].get("langgraph_node")
+        # Pieces of the joke's tool call arguments (JSON) as the model writes them
+        if kind == "on_chat_model_stream" and node == "joke":
+            for chunk in event["data"]["chunk"].tool_call_chunks:
+                await progress.tool_chunk(chunk["args"])
+        elif kind == "on_chain_end" and node == "api" and event["name"] == "api":
+            await progress.status(f"Writing a joke about {state['joke_topic']} for {event['data']['output']['person_name']}...")
+        # The graph itself has finished
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            res = event["data"]["output"]
+    return res
+
+
 # Print the whole state
 # chainlit - send the joke to the user
 @cl.on_message  # this function will be called every time a user inputs a message in the UI
+@metrics.timed("on_message")
 async def main(message: cl.Message):
     print(message.content)
     # first invoke should have something to add to the state
-
-    res = await graph.ainvoke(
-        {
-            "messages": [HumanMessage(content=message.content)],
-            "joke_topic": message.content,
-        }
-    )
-
-    # Send the joke to the user (which is stored in the state)
-    await cl.Message(content=res["generated_joke"]).send()
+    state = {
+        "messages": [Record("human", message.content)],
+        "joke_topic": message.content,
+    }
+    # The callback times the nodes and counts the LLM calls and tokens
+    config = {**models.model_config(model_key), "callbacks": [metrics.llm_callback]}
+
+    # The answer's message is sent at once and updated as the graph runs
+    progress = ProgressMessage("Looking for someone to joke about...")
+    await progress.send()
+    try:
+        async with admission.slot(INTERACTIVE):
+            if use_streaming:
+                res = await stream_graph(state, config, progress)
+            else:
+                res = await graph.ainvoke(state, config=config)
+    except Busy as e:
+        await progress.finish(BUSY_MESSAGE.format(seconds=e.retry_after))
+        return
+
+    # Show the joke to the user (which is stored in the state)
+    await progress.finish(res["generated_joke"])
+    metrics.observe_progress("on_message", progress)
 
 
 # GRAPH:
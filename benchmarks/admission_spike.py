@@ -0,0 +1,108 @@
+'''
+    A traffic spike against a provider with limited capacity, with and without admission control
+    (chainlit_utils/admission.py).
+
+    The simulated provider runs --capacity calls at a time, each takes --latency seconds, the rest queue up
+    inside the provider. Calls that can't start within --provider-timeout seconds fail (throttled).
+    --requests messages arrive evenly within --spike seconds, --background of them are background work.
+
+    Reported per priority: answered jokes, latency percentiles of the answers, refused ("busy") requests
+    and how fast the refusal came.
+
+    Run from the repository root:
+    -> python -m benchmarks.admission_spike --requests 300 --spike 2 --capacity 8 --latency 1
+'''
+
+import argparse
+import asyncio
+import random
+import time
+
+from chainlit_utils.admission import BACKGROUND, INTERACTIVE, AdmissionController, Busy
+
+
+class Throttled(Exception):
+    pass
+
+
+class Provider:
+    def __init__(self, capacity, latency, timeout):
+        self.slots = asyncio.Semaphore(capacity)
+        self.latency = latency
+        self.timeout = timeout
+
+    async def call(self):
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise Throttled() from None
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.slots.release()
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def spike(args, admission):
+    provider = Provider(args.capacity, args.latency, args.provider_timeout)
+    results = {INTERACTIVE: {"ok": [], "busy": [], "failed": 0}, BACKGROUND: {"ok": [], "busy": [], "failed": 0}}
+    priorities = [BACKGROUND] * args.background + [INTERACTIVE] * (args.requests - args.background)
+    random.Random(0).shuffle(priorities)
+
+    async def request(delay, priority):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            if admission is None:
+                await provider.call()
+            else:
+                async with admission.slot(priority):
+                    await provider.call()
+            results[priority]["ok"].append(time.perf_counter() - start)
+        except Busy:
+            results[priority]["busy"].append(time.perf_counter() - start)
+        except Throttled:
+            results[priority]["failed"] += 1
+
+    await asyncio.gather(*(request(index * args.spike / args.requests, priority)
+                           for index, priority in enumerate(priorities)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--background", type=int, default=60)
+    parser.add_argument("--spike", type=float, default=2.0, help="Seconds in which all the requests arrive")
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--provider-timeout", type=float, default=30.0)
+    parser.add_argument("--slo", type=float, default=5.0, help="Longest acceptable queue wait (max_wait)")
+    args = parser.parse_args()
+
+    print(f"\n{args.requests} requests ({args.background} background) in {args.spike}s, "
+          f"provider: {args.capacity} at a time, {args.latency}s per call, SLO {args.slo}s\n")
+    print(f"{'':<26} {'answered':>8} {'p50 s':>7} {'p95 s':>7} {'max s':>7} {'throttled':>9} {'busy':>5} {'busy in s':>9}")
+    runs = (("no admission", None),
+            ("admission", AdmissionController(max_concurrent=args.capacity, max_wait=args.slo,
+                                              initial_run_seconds=args.latency)))
+    for label, admission in runs:
+        results = asyncio.run(spike(args, admission))
+        for priority, name in ((INTERACTIVE, "interactive"), (BACKGROUND, "background")):
+            ok, busy = results[priority]["ok"], results[priority]["busy"]
+            print(f"{label + ', ' + name:<26} {len(ok):>8} {percentile(ok, 50):>7.2f} {percentile(ok, 95):>7.2f} "
+                  f"{max(ok, default=float('nan')):>7.2f} {results[priority]['failed']:>9} {len(busy):>5} "
+                  f"{percentile(busy, 95):>9.3f}")
+        if admission:
+            print(f"\n{admission.stats()}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''
+    The API step of 8_chainlit_api_agent.py with many users at once, against the local stand-in server.
+
+    - blocking: the old node, requests.get() inside the async function and response.json() three times
+    - client:   chainlit_utils/http_client.py (async, pooled, cached, concurrent fetches collapsed)
+    - client, ttl 0: every fetch is stale, so the client revalidates with the ETag and gets 304 answers
+
+    Every user sends --messages messages. Reported: wall time, requests that reached the server and
+    the worst event loop lag (how late a 10 ms ticker woke up, ie. how long other users were frozen).
+
+    Run from the repository root:
+    -> python -m benchmarks.api_fetch --users 50 --messages 3 --latency 0.2
+'''
+
+import argparse
+import asyncio
+import time
+
+import requests
+
+from chainlit_utils.http_client import HttpClient
+from chainlit_utils.stub_api import start_in_thread
+
+
+async def blocking_fetch(url):
+    response = requests.get(url)
+    return {"message": f"API response: {response.json()}", "name": response.json()["name"], "raw": response.json()}
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def run_users(fetch, users, messages):
+    async def user():
+        for _ in range(messages):
+            await fetch()
+
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return elapsed, max(lags, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the stand-in server takes per response")
+    args = parser.parse_args()
+
+    server = start_in_thread(latency=args.latency)
+    print(f"\n{args.users} users x {args.messages} messages, server latency {args.latency}s\n")
+    print(f"{'':<16} {'wall s':>8} {'server requests':>16} {'304s':>6} {'max loop lag s':>15}")
+
+    clients = {"client": HttpClient(server.url, ttl=300), "client, ttl 0": HttpClient(server.url, ttl=0)}
+    runs = [("blocking", lambda: blocking_fetch(f"{server.url}/users/1"))]
+    runs += [(label, lambda client=client: client.get_json("/users/1")) for label, client in clients.items()]
+    for label, fetch in runs:
+        requests_before, not_modified_before = server.requests, server.not_modified
+        elapsed, lag = asyncio.run(run_users(fetch, args.users, args.messages))
+        print(f"{label:<16} {elapsed:>8.2f} {server.requests - requests_before:>16} "
+              f"{server.not_modified - not_modified_before:>6} {lag:>15.3f}")
+
+    for label, client in clients.items():
+        print(f"\n{label}: {client.stats}\n{'':<{len(label)}}  single-flight {client.flights.stats}")
+    print()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+'''
+    Wall-clock latency to reach a joke rated >= 6 in 5_conditional_agent.py:
+    the sequential improvement loop (candidate_count = 1) versus fan-out best-of-N.
+
+    The graph is imported from the example and run with an offline model that sleeps --latency
+    seconds per call and rates jokes randomly (by default only 25 % of the jokes are good enough).
+
+    Run from the repository root:
+    -> python -m benchmarks.best_of_n_latency --latency 0.2 --trials 20 --candidates 1 3 5
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import threading
+import time
+
+from benchmarks.examples import load_example
+from benchmarks.fake_models import FakeStructuredChatModel
+from graph_utils import budget
+from llm_utils import models
+
+
+class Responder:
+    def __init__(self, good_ratio, seed):
+        self.good_ratio = good_ratio
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, tool_name, prompt):
+        with self.lock:
+            self.calls += 1
+            good = self.rng.random() < self.good_ratio
+            rating = self.rng.randint(6, 10) if good else self.rng.randint(1, 5)
+        if tool_name == "FunnySchema":
+            return {"topic": "topic", "joke": f"Joke {self.calls}", "rating": rating, "rating_reason": "fake"}
+        return {"suggestions": ["be funnier"], "new_topic": f"Improved topic {self.calls}"}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per LLM call")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--good-ratio", type=float, default=0.25, help="Probability of a joke rated >= 6")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1, 3, 5])
+    args = parser.parse_args()
+
+    example = load_example("5_conditional_agent.py")
+
+    print(f"\nLLM latency {args.latency}s, {args.good_ratio:.0%} of jokes rated >= 6, {args.trials} trials\n")
+    print(f"{'candidates':>10} {'reached >=6':>12} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'LLM calls':>10}")
+
+    for count in args.candidates:
+        responder = Responder(args.good_ratio, seed=count)
+        models.register_model(f"fake:best-of-{count}", FakeStructuredChatModel(latency=args.latency, responder=responder))
+        times, reached = [], 0
+        for _ in range(args.trials):
+            start = time.perf_counter()
+            # The example prints every step, keep the benchmark output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                # A budget large enough that only the rating ends the run
+                res = asyncio.run(example.graph.ainvoke({"messages": [],
+                                                         "joke_topic": example.joke_topic,
+                                                         "iteration": 0,
+                                                         "candidate_count": count,
+                                                         **budget.new_budget(3600, 10**9)},
+                                                        config=models.model_config(f"fake:best-of-{count}")))
+            elapsed = time.perf_counter() - start
+            if res.get("best_rating", 0) >= 6:
+                reached += 1
+                times.append(elapsed)
+
+        if times:
+            print(f"{count:>10} {reached:>8}/{args.trials:<3} {statistics.mean(times):>8.2f} "
+                  f"{percentile(times, 50):>8.2f} {percentile(times, 95):>8.2f} {responder.calls / args.trials:>10.1f}")
+        else:
+            print(f"{count:>10} {reached:>8}/{args.trials:<3} {'-':>8} {'-':>8} {'-':>8} {responder.calls / args.trials:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
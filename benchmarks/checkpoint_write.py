@@ -0,0 +1,57 @@
+'''
+    Cost of writing one checkpoint, ie. the time graph_utils.checkpoint adds to every node.
+    The state looks like the state of 6_database_and_agents.py after a few improvement loops.
+
+    Run from the repository root:
+    -> python -m benchmarks.checkpoint_write --writes 2000
+'''
+
+import argparse
+import os
+import tempfile
+import time
+
+from graph_utils.channels import Record
+from graph_utils.checkpoint import Checkpointer
+
+
+def example_state(iteration):
+    messages = [Record("human", "Very bad joke about bengal cats")]
+    for i in range(iteration):
+        messages += [
+            Record("ai", f"Generated joke: Why did the bengal cat {i} sit on the keyboard? To keep an eye on the mouse!"),
+            Record("ai", f"Topic: Bengal cats {i}"),
+            Record("ai", "Rating: 4"),
+            Record("ai", "Joke suggestions for new topic: ['Add wordplay', 'Use a surprising setting']"),
+            Record("ai", f"New topic for the joke: Bengal cats working in an office {i}"),
+        ]
+    return {"messages": messages,
+            "joke_topic": "Bengal cats working in an office",
+            "generated_joke": "Why did the bengal cat sit on the keyboard? To keep an eye on the mouse!",
+            "joke_rating": 4,
+            "iteration": iteration}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpointer = Checkpointer(os.path.join(directory, "checkpoints.db"))
+        for iteration in (1, 5, 20):
+            state = example_state(iteration)
+            timings = []
+            for step in range(args.writes):
+                start = time.perf_counter()
+                checkpointer.save(f"run-{iteration}", step, "joke", state)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            mean = sum(timings) / len(timings) * 1000
+            p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+            print(f"{len(state['messages']):>4} messages: mean {mean:.3f} ms, p99 {p99:.3f} ms, max {timings[-1] * 1000:.3f} ms per checkpoint")
+        checkpointer.close()
+
+
+if __name__ == "__main__":
+    main()
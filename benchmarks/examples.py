@@ -0,0 +1,23 @@
+'''
+    Loads the numbered example scripts as modules, so benchmarks can reuse their graphs.
+    File names like 5_conditional_agent.py can't be imported with a normal import statement.
+    The examples only run their demos when executed directly (__name__ == "__main__").
+'''
+
+import importlib.util
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_example(filename):
+    name = "example_" + os.path.splitext(os.path.basename(filename))[0].replace(".", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,68 @@
+'''
+    Steps per second of a long loop: LangGraph runtime versus graph_utils/executor.py.
+
+    The graph is the loop of 5.1_simple_conditional_agent.py without the prints: the node appends a mark
+    to an append-only channel and the router loops until there are --steps marks.
+    The same definitions are compiled with both builders.
+
+    Run from the repository root:
+    -> python -m benchmarks.executor_steps --steps 1000000
+'''
+
+import argparse
+import time
+from typing import Annotated, TypedDict
+
+from langgraph.graph import END, StateGraph
+
+from graph_utils import channels, executor
+
+
+class AgentState(TypedDict):
+    marks: Annotated[channels.AppendLog, channels.append]
+
+
+def add_x(state):
+    return {"marks": ["X"]}
+
+
+def build(builder, steps):
+    def is_done(state):
+        if len(state["marks"]) >= steps:
+            return END
+        return "add"
+
+    workflow = builder(AgentState)
+    workflow.add_node("add", add_x)
+    workflow.add_conditional_edges("add", is_done)
+    workflow.set_entry_point("add")
+    return workflow.compile()
+
+
+def measure(label, graph, steps):
+    start = time.perf_counter()
+    # LangGraph stops at 25 steps by default, both get a limit just above the loop's length
+    res = graph.invoke({"marks": []}, {"recursion_limit": steps + 10})
+    elapsed = time.perf_counter() - start
+    assert len(res["marks"]) == steps
+    print(f"{label:<10} {steps:>10} steps {elapsed:>9.2f} s {steps / elapsed:>12,.0f} steps/s "
+          f"{elapsed / steps * 1e6:>8.2f} us/step")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--langgraph-steps", type=int,
+                        help="Steps for the LangGraph run (default --steps). LangGraph needs minutes for a million steps")
+    args = parser.parse_args()
+    langgraph_steps = args.langgraph_steps or args.steps
+
+    print()
+    fast = measure("executor", build(executor.StateGraph, args.steps), args.steps)
+    slow = measure("langgraph", build(StateGraph, langgraph_steps), langgraph_steps)
+    print(f"\nexecutor is {(slow / langgraph_steps) / (fast / args.steps):.0f}x faster per step\n")
+
+
+if __name__ == "__main__":
+    main()
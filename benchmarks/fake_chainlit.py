@@ -0,0 +1,89 @@
+'''
+    Stand-in for the chainlit package, so the Chainlit examples can be driven without a browser or server.
+
+    The example is loaded with this module in place of chainlit (see load_chainlit_example). Its
+    @cl.on_chat_start / @cl.on_message / @cl.on_chat_end handlers are collected into `handlers` and
+    cl.Message(...).send() records the message into the session that is currently running (a context variable,
+    so messages sent from graph nodes end up in the right session too). Every version the user would see of
+    a message (send, update, stream_token) is kept in its `history` as (time.perf_counter(), content).
+'''
+
+import contextvars
+import sys
+import time
+
+from benchmarks.examples import load_example
+
+
+handlers = {}
+
+_current_session = contextvars.ContextVar("fake_chainlit_session")
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        # Messages sent to this user
+        self.sent = []
+        self.user_session = {}
+
+
+class Message:
+    def __init__(self, content="", author=None, **kwargs):
+        self.content = content
+        self.author = author
+        self.history = []
+
+    def _shown(self):
+        self.history.append((time.perf_counter(), self.content))
+
+    async def send(self):
+        _current_session.get().sent.append(self)
+        self._shown()
+        return self
+
+    async def update(self):
+        self._shown()
+        return True
+
+    async def stream_token(self, token, is_sequence=False):
+        if not token:
+            return
+        self.content = token if is_sequence else self.content + token
+        self._shown()
+
+
+class _UserSession:
+    def get(self, key, default=None):
+        return _current_session.get().user_session.get(key, default)
+
+    def set(self, key, value):
+        _current_session.get().user_session[key] = value
+
+
+user_session = _UserSession()
+
+
+def on_chat_start(function):
+    handlers["on_chat_start"] = function
+    return function
+
+
+def on_chat_end(function):
+    handlers["on_chat_end"] = function
+    return function
+
+
+def on_message(function):
+    handlers["on_message"] = function
+    return function
+
+
+# Makes the calling task act as the given session. Call it at the start of the session's own task
+def enter(session):
+    _current_session.set(session)
+
+
+def load_chainlit_example(filename):
+    sys.modules["chainlit"] = sys.modules[__name__]
+    return load_example(filename)
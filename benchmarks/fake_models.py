@@ -0,0 +1,173 @@
+'''
+    Offline stand-in for the chat models used by the benchmarks.
+
+    FakeStructuredChatModel behaves like ChatOpenAI / ChatCohere from the agent's point of view:
+    - bind_tools() and with_structured_output() work, the answer is returned as a tool call
+    - Answers are generated from the tool's JSON schema (or by a custom responder function)
+    - An optional latency simulates the provider round-trip (time.sleep / asyncio.sleep)
+    - usage_metadata is filled with rough token counts (4 characters per token)
+    - With tool_turns > 0 it acts like a tool using agent: for tool_turns turns it asks for calls_per_turn
+      tool calls (spread over the bound tools), then answers in plain text
+    - Streaming (astream, astream_events) sends the answer in 4 character tokens, token_latency seconds apart,
+      after the latency. The tool call arguments arrive as pieces of JSON like from the providers.
+      With token_latency a call that isn't streamed takes as long as a streamed one
+'''
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+_call_ids = itertools.count()
+
+
+# Generates a value for every property of a JSON schema. Integers are kept between 1 and 10 (ratings)
+def fill_schema(parameters, rng, prompt=""):
+    args = {}
+    for name, prop in parameters.get("properties", {}).items():
+        kind = prop.get("type")
+        if kind == "integer":
+            args[name] = rng.randint(1, 10)
+        elif kind == "number":
+            args[name] = rng.random() * 10
+        elif kind == "boolean":
+            args[name] = rng.random() < 0.5
+        elif kind == "array":
+            args[name] = [f"{name} {i} for {prompt[-40:].strip()}" for i in range(2)]
+        else:
+            args[name] = f"{name} {rng.randint(0, 10**6)} about {prompt[-40:].strip()}"
+    return args
+
+
+def _prompt_text(messages):
+    return "\n".join(str(message.content) for message in messages)
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeStructuredChatModel(BaseChatModel):
+    # Simulated provider round-trip in seconds
+    latency: float = 0.0
+    # Reported as the model name, used by the benchmarks to tell models apart
+    model_name: str = "fake-model"
+    seed: int = 0
+    # Optional (tool_name, prompt) -> args dict (or text when no tools are bound)
+    responder: Optional[Callable[..., Any]] = None
+    # Tool using agent mode, see the module docstring
+    tool_turns: int = 0
+    calls_per_turn: int = 1
+    # Seconds per streamed token
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-structured"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _answer(self, messages, tools):
+        prompt = _prompt_text(messages)
+        rng = random.Random(hash((self.seed, prompt, next(_call_ids))))
+        if tools and self.tool_turns:
+            turns_done = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+            if turns_done < self.tool_turns:
+                calls = []
+                for index in range(self.calls_per_turn):
+                    function = tools[index % len(tools)]["function"]
+                    calls.append({"name": function["name"],
+                                  "args": fill_schema(function["parameters"], rng, prompt),
+                                  "id": f"call_{next(_call_ids)}"})
+                completion = json.dumps([call["args"] for call in calls])
+                message = AIMessage(content="", tool_calls=calls)
+            else:
+                results = [str(message.content) for message in messages if isinstance(message, ToolMessage)]
+                completion = f"Answer from {len(results)} tool results"
+                message = AIMessage(content=completion)
+        elif tools:
+            function = tools[0]["function"]
+            if self.responder is not None:
+                args = self.responder(function["name"], prompt)
+            else:
+                args = fill_schema(function["parameters"], rng, prompt)
+            completion = json.dumps(args)
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": function["name"], "args": args, "id": f"call_{next(_call_ids)}"}],
+            )
+        else:
+            completion = self.responder(None, prompt) if self.responder else f"Fake answer to: {prompt[-80:]}"
+            message = AIMessage(content=completion)
+
+        message.usage_metadata = {
+            "input_tokens": _tokens(prompt),
+            "output_tokens": _tokens(completion),
+            "total_tokens": _tokens(prompt) + _tokens(completion),
+        }
+        message.response_metadata = {"model_name": self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    # Seconds the answer takes to arrive
+    def _duration(self, result):
+        return self.latency + self.token_latency * len(_pieces(result.generations[0].message))
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        result = self._answer(messages, tools)
+        if self.latency or self.token_latency:
+            time.sleep(self._duration(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        result = self._answer(messages, tools)
+        if self.latency or self.token_latency:
+            await asyncio.sleep(self._duration(result))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        message = self._answer(messages, tools).generations[0].message
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        pieces = _pieces(message)
+        for number, (position, token) in enumerate(pieces):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            if position is None:
+                chunk = AIMessageChunk(content=token)
+            else:
+                call = message.tool_calls[position]
+                # Name and id come with the first piece of a call's arguments
+                first = number == 0 or pieces[number - 1][0] != position
+                chunk = AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": call["name"] if first else None,
+                    "args": token,
+                    "id": call["id"] if first else None,
+                    "index": position,
+                }])
+            if number == len(pieces) - 1:
+                chunk.usage_metadata = message.usage_metadata
+                chunk.response_metadata = message.response_metadata
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _split(text):
+    return [text[start:start + 4] for start in range(0, len(text), 4)] or [""]
+
+
+# The answer in 4 character tokens: (tool call index, piece of its arguments as JSON) or (None, piece of the text)
+def _pieces(message):
+    if message.tool_calls:
+        return [(position, token) for position, call in enumerate(message.tool_calls)
+                for token in _split(json.dumps(call["args"]))]
+    return [(None, token) for token in _split(str(message.content))]
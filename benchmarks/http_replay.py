@@ -0,0 +1,126 @@
+'''
+    Record / replay of the HTTP traffic (llm_utils/http_cassettes.py): how fast replay is, and that it
+    never reaches the network.
+
+    Recorded from the local stand-in API (chainlit_utils/stub_api.py) with --latency seconds per response:
+    --urls different /users URLs with httpx and requests, and chat completions of ChatOpenAI from an
+    offline stand-in for the OpenAI API (an httpx.MockTransport answering in the API's format).
+    Then the server is shut down and --requests requests are replayed with each client:
+    - httpx.Client, httpx.AsyncClient (--concurrency at once), requests, ChatOpenAI.invoke
+    Reported: requests per second, the cassette's size and the requests that reached the server while replaying.
+
+    Run from the repository root:
+    -> python -m benchmarks.http_replay --urls 50 --requests 5000 --latency 0.05
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import requests
+
+from chainlit_utils.stub_api import start_in_thread
+from llm_utils import http_cassettes
+from llm_utils.http_cassettes import AsyncRecordingTransport, HttpCassette, RecordingTransport
+
+
+def fake_openai(request):
+    messages = json.loads(request.content)["messages"]
+    return httpx.Response(200, json={
+        "id": "chatcmpl-offline",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": f"Answer to: {messages[-1]['content']}"}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    })
+
+
+def chat_model(transport):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(api_key="offline", model="gpt-4o-mini", max_retries=0, http_client=httpx.Client(transport=transport))
+
+
+def rate(count, function):
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=50, help="Different URLs recorded")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests replayed per client")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per response of the stand-in API")
+    args = parser.parse_args()
+
+    server = start_in_thread(latency=args.latency, users=args.urls)
+    urls = [f"{server.url}/users/{index}?lang=en&page=1" for index in range(1, args.urls + 1)]
+    prompts = [f"Tell me a joke about number {index}" for index in range(args.urls)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.db")
+
+        cassette = HttpCassette(path, "record")
+        start = time.perf_counter()
+        with httpx.Client(transport=RecordingTransport(cassette)) as client:
+            for url in urls:
+                client.get(url)
+        http_cassettes.install(cassette)
+        for url in urls:
+            # Same requests with another parameter order: matched to the httpx recordings, not sent
+            requests.get(url.replace("?lang=en&page=1", "?page=1&lang=en"))
+        http_cassettes.uninstall()
+        cassette = HttpCassette(path, "record")
+        model = chat_model(RecordingTransport(cassette, inner=httpx.MockTransport(fake_openai)))
+        for prompt in prompts:
+            model.invoke(prompt)
+        recorded = time.perf_counter() - start
+        cassette.close()
+        server.shutdown()
+        sent = server.requests
+
+        print(f"\nrecorded {len(urls)} URLs and {len(prompts)} chat completions in {recorded:.2f} s, "
+              f"cassette {os.path.getsize(path) / 1024:.0f} KB (+ WAL)")
+        print(f"\nreplaying {args.requests} requests per client (server down)\n")
+
+        cassette = HttpCassette(path)
+        with httpx.Client(transport=RecordingTransport(cassette)) as client:
+            per_second = rate(args.requests, lambda: [client.get(urls[index % len(urls)]) for index in range(args.requests)])
+        print(f"{'httpx.Client':<26} {per_second:>9.0f} requests/s")
+
+        async def replay_async():
+            semaphore = asyncio.Semaphore(args.concurrency)
+            async with httpx.AsyncClient(transport=AsyncRecordingTransport(cassette)) as client:
+                async def get(url):
+                    async with semaphore:
+                        return await client.get(url)
+                await asyncio.gather(*(get(urls[index % len(urls)]) for index in range(args.requests)))
+
+        per_second = rate(args.requests, lambda: asyncio.run(replay_async()))
+        print(f"{'httpx.AsyncClient':<26} {per_second:>9.0f} requests/s")
+
+        http_cassettes.install(cassette)
+        with requests.Session() as session:
+            per_second = rate(args.requests, lambda: [session.get(urls[index % len(urls)]) for index in range(args.requests)])
+        print(f"{'requests':<26} {per_second:>9.0f} requests/s")
+        http_cassettes.uninstall()
+
+        cassette = HttpCassette(path)
+        model = chat_model(RecordingTransport(cassette))
+        per_second = rate(args.requests, lambda: [model.invoke(prompts[index % len(prompts)]) for index in range(args.requests)])
+        print(f"{'ChatOpenAI.invoke':<26} {per_second:>9.0f} calls/s")
+        print(f"\nserver requests while replaying: {server.requests - sent}, cassette stats {cassette.stats}")
+        cassette.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()
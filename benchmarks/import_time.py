@@ -0,0 +1,133 @@
+'''
+    Start up time of the example scripts before and after the lazy provider loading (llm_utils/models.py).
+
+    For every numbered script, the imports it runs on start up (the top level imports and the ones inside
+    the enabled "if use_cohere:" / "if use_openai:" blocks) are executed in a fresh interpreter with
+    python -X importtime, in the current tree and in the baseline git revision. The time is the sum of the
+    cumulative times of the script's own imports, the interpreter's own start up imports are left out.
+    With the registry, the provider package is imported when the first model is created: the first call
+    pays the "first model" row once, the scripts that never create a model (ie. 4.1) never pay it.
+
+    The baseline defaults to the revision before the provider imports of llm_utils/models.py were moved.
+    It is extracted with git archive into a temporary directory.
+
+    Run from the repository root:
+    -> python -m benchmarks.import_time --repeat 5
+    -> python -m benchmarks.import_time --baseline HEAD~3 7_chainlit_chat_ui.py 8_chainlit_api_agent.py
+'''
+
+import argparse
+import ast
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from benchmarks.examples import ROOT
+
+
+FIRST_MODEL = "first model"
+
+
+def default_baseline():
+    # The last commit that added or removed the top level provider import of the registry, and its parent
+    commit = subprocess.run(
+        ["git", "log", "-n", "1", "--format=%H", "-G", "^from langchain_openai import", "--", "llm_utils/models.py"],
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    return f"{commit}^" if commit else "HEAD"
+
+
+def export(revision, directory):
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], cwd=ROOT, capture_output=True,
+                             check=True).stdout
+    path = os.path.join(directory, "archive.tar")
+    with open(path, "wb") as f:
+        f.write(archive)
+    with tarfile.open(path) as tar:
+        tar.extractall(directory)
+    os.remove(path)
+
+
+def _enabled_flags(tree):
+    flags = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and node.value.value is True:
+            flags.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    return flags
+
+
+# The import statements a script runs on start up, as source code
+def startup_imports(path):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    flags = _enabled_flags(tree)
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(node)
+        elif isinstance(node, ast.If) and isinstance(node.test, ast.Name) and node.test.id in flags:
+            imports.extend(child for child in node.body if isinstance(child, (ast.Import, ast.ImportFrom)))
+    return "\n".join(ast.get_source_segment(source, node) for node in imports)
+
+
+# Top level module -> cumulative microseconds, from the -X importtime output of running code
+def importtime(code, directory):
+    env = {**os.environ, "PYTHONPATH": directory, "OPENAI_API_KEY": "offline", "COHERE_API_KEY": "offline",
+           "LLM_LEDGER": "0"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=directory, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented, only the modules imported by the code itself are counted
+        if not name.startswith("  ", 1):
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure(code, directory, repeat, interpreter):
+    totals, modules = [], {}
+    for _ in range(repeat):
+        modules = {name: us for name, us in importtime(code, directory).items() if name not in interpreter}
+        totals.append(sum(modules.values()))
+    heaviest = max(modules, key=modules.get) if modules else "-"
+    return statistics.median(totals) / 1000, heaviest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scripts", nargs="*", help="Default: every numbered script")
+    parser.add_argument("--baseline", help="Git revision to compare with")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per script, the median is reported")
+    args = parser.parse_args()
+
+    scripts = args.scripts or sorted(os.path.basename(path) for path in glob.glob(os.path.join(ROOT, "[0-9]*.py")))
+    baseline = args.baseline or default_baseline()
+    interpreter = set(importtime("pass", ROOT))
+
+    with tempfile.TemporaryDirectory() as directory:
+        export(baseline, directory)
+        print(f"\nstart up imports, median of {args.repeat} runs, baseline {baseline}\n")
+        print(f"{'script':<34} {'before ms':>10} {'after ms':>10} {'saved':>7}  heaviest import after")
+        rows = [(script, startup_imports(os.path.join(directory, script)), startup_imports(os.path.join(ROOT, script)))
+                for script in scripts if os.path.exists(os.path.join(directory, script))]
+        # The deferred cost: the registry creating its first model
+        rows.append((FIRST_MODEL, "", "from llm_utils import models\nmodels.get_model('openai')"))
+        for script, before_code, after_code in rows:
+            before, _ = measure(before_code, directory, args.repeat, interpreter) if before_code else (0.0, "-")
+            after, heaviest = measure(after_code, ROOT, args.repeat, interpreter)
+            saved = f"{(before - after) / before:>6.0%}" if before else ""
+            print(f"{script:<34} {before:>10.1f} {after:>10.1f} {saved:>7}  {heaviest}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+'''
+    Routing a message to a single schema with the local intent classifier (llm_utils/intent.py) versus
+    giving the model the Union of schemas, as in 3.1_Multiple_schemas.py.
+
+    - The classifier: training time, time per message and accuracy on held-out messages (EVAL)
+    - Per approach: prompt tokens, latency per message and success rate. Success means the answer was
+      parsed into the schema matching the message's label
+
+    Offline (default) the model is FakeStructuredChatModel: the prompt tokens are estimated from the prompt
+    and the tool schema sent with it (4 characters per token) and the success rate is the routing accuracy,
+    the offline model can't tell how a real model copes with the Union. With --model the messages go to
+    a real provider (API key needed), tokens are the provider's own counts and a Cohere crash is a failure.
+
+    Run from the repository root:
+    -> python -m benchmarks.intent_routing
+    -> python -m benchmarks.intent_routing --model openai:gpt-4o-mini
+'''
+
+import argparse
+import json
+import statistics
+import time
+import timeit
+from typing import Optional, Union
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import intent, models, structured_output
+
+
+# Same prompt and schemas as 3.1_Multiple_schemas.py
+PROMPT = ChatPromptTemplate.from_template(
+    """
+    You will either tell a joke or answer in normal manner depending on the user's message. Choose appropriate schema accordingly.
+    User's message: {message}
+    """
+)
+
+
+class FunnySchema(BaseModel):
+    """Joke to be told to the user"""
+    topic: Optional[str] = Field(description="The topic of the joke")
+    joke: Optional[str] = Field(description="The joke")
+    rating: Optional[int] = Field(description="The rating of the joke, from 1 to 10 (bigger is funnier)")
+    rating_reason: Optional[str] = Field(description="Why the joke is rated thi way")
+
+
+class ConversationalSchema(BaseModel):
+    """A regular back and forth conversation with user"""
+    response: str = Field(description="A regular response to the user's message")
+
+
+class CombinedSchema(BaseModel):
+    output: Union[ConversationalSchema, FunnySchema]
+
+
+ROUTED_SCHEMAS = {"joke": FunnySchema, "conversation": ConversationalSchema}
+
+# Held-out messages, none of them is in intent.EXAMPLES
+EVAL = [
+    ("Tell me a joke about dogs", "joke"),
+    ("A joke about cows and farmers", "joke"),
+    ("Make something funny about Python", "joke"),
+    ("I would like a pun about trains", "joke"),
+    ("Any jokes about pirates?", "joke"),
+    ("Make a joke of my boss", "joke"),
+    ("Give me a funny one-liner about cars", "joke"),
+    ("Something funny about winter in Finland", "joke"),
+    ("Tell a dad joke about sandwiches", "joke"),
+    ("Can you joke about robots", "joke"),
+    ("What is the capital of Sweden", "conversation"),
+    ("How do airplanes fly?", "conversation"),
+    ("Who is the president of Finland", "conversation"),
+    ("Hi, how is it going", "conversation"),
+    ("What is the boiling point of water", "conversation"),
+    ("Can you recommend a movie", "conversation"),
+    ("How do I learn to swim", "conversation"),
+    ("What do dogs eat", "conversation"),
+    ("Explain what a black hole is", "conversation"),
+    ("Where do penguins live", "conversation"),
+]
+
+
+def estimated_tokens(prompt, schema):
+    return max(1, (len(prompt) + len(json.dumps(structured_output.schema_json(schema)))) // 4)
+
+
+def success(parsed, expected, union):
+    if union:
+        parsed = getattr(parsed, "output", None)
+    return isinstance(parsed, expected)
+
+
+# (prompt tokens, seconds, success) per message
+def run(model, union, live):
+    results = []
+    for message, label in EVAL:
+        prompt = PROMPT.format(message=message)
+        start = time.perf_counter()
+        schema = CombinedSchema if union else ROUTED_SCHEMAS[intent.classify(message)]
+        try:
+            answer = structured_output.bind(model, schema, include_raw=True).invoke(prompt)
+        except Exception:
+            results.append((0, time.perf_counter() - start, False))
+            continue
+        elapsed = time.perf_counter() - start
+        if live:
+            usage = answer["raw"].usage_metadata or {}
+            results.append((usage.get("input_tokens", 0), elapsed, success(answer["parsed"], ROUTED_SCHEMAS[label], union)))
+        else:
+            # The offline model fills any schema, only the routing decides the success
+            ok = None if union else schema is ROUTED_SCHEMAS[label]
+            results.append((estimated_tokens(prompt, schema), elapsed, ok))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Model key of a real provider, ie. openai:gpt-4o-mini or cohere")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    classifier = intent.default_classifier()
+    trained = (time.perf_counter() - start) * 1000
+    number = 20_000
+    per_message = timeit.timeit(lambda: classifier.predict(EVAL[0][0]), number=number) / number * 1e6
+    correct = sum(classifier.predict(message) == label for message, label in EVAL)
+    print(f"\nclassifier: {len(intent.EXAMPLES)} examples, {len(classifier.vocabulary)} features, "
+          f"trained in {trained:.1f} ms")
+    print(f"            {per_message:.1f} us per message, {correct}/{len(EVAL)} held-out messages right")
+
+    live = args.model is not None
+    model = models.get_model(args.model) if live else FakeStructuredChatModel()
+    print(f"\n{len(EVAL)} messages, model {args.model or 'offline (estimated tokens)'}\n")
+    print(f"{'':<14} {'prompt tok':>10} {'mean ms':>8} {'success':>8}")
+    for label, union in (("Union schema", True), ("routed schema", False)):
+        results = run(model, union, live)
+        tokens = statistics.mean(result[0] for result in results)
+        latency = statistics.mean(result[1] for result in results) * 1000
+        outcomes = [result[2] for result in results]
+        rate = "-" if None in outcomes else f"{sum(outcomes) / len(outcomes):.0%}"
+        print(f"{label:<14} {tokens:>10.0f} {latency:>8.1f} {rate:>8}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
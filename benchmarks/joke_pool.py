@@ -0,0 +1,131 @@
+'''
+    Messages about a few popular topics (Zipf distributed), answered the way 7_chainlit_chat_ui.py does it,
+    with and without the pool of pre-generated jokes (chainlit_utils/joke_pool.py).
+
+    Messages arrive at --rate per second for --duration seconds. The offline model takes --latency seconds
+    per call and rates its jokes randomly from 1 to 10, only jokes rated 7 or more go to the pool.
+    The warmer checks the pool every --interval seconds. The pool database is a temporary file.
+
+    Reported: pool hits, mean and percentiles of the answer latency, live and background LLM calls and
+    the pooled jokes left unused at the end (the price of the warming).
+
+    Run from the repository root:
+    -> python -m benchmarks.joke_pool --rate 3 --duration 60 --topics 200 --latency 0.8
+    -> python -m benchmarks.joke_pool --max-serves 3 --target-size 5
+'''
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from chainlit_utils.admission import INTERACTIVE, AdmissionController, Busy
+from chainlit_utils.joke_pool import JokePool, PoolWarmer
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import structured_output
+
+
+PROMPT = ChatPromptTemplate.from_template("Make a joke about: {topic}")
+
+
+class FunnySchema(BaseModel):
+    topic: str = Field(description="The topic of the joke")
+    joke: str = Field(description="The joke")
+    rating: int = Field(description="The rating of the joke, from 1 to 10")
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def zipf_topics(count, topics, rng, exponent=1.1):
+    weights = [1 / rank ** exponent for rank in range(1, topics + 1)]
+    return [f"topic {index}" for index in rng.choices(range(topics), weights=weights, k=count)]
+
+
+async def traffic(args, use_pool, db_path):
+    rng = random.Random(args.seed)
+    structured_llm = structured_output.bind(FakeStructuredChatModel(latency=args.latency), FunnySchema)
+    calls = {"live": 0, "background": 0}
+
+    async def generate(topic, kind):
+        calls[kind] += 1
+        return await structured_llm.ainvoke(PROMPT.format(topic=topic))
+
+    admission = AdmissionController(max_concurrent=args.capacity, max_wait=10, initial_run_seconds=args.latency)
+    pool = warmer = None
+    if use_pool:
+        pool = JokePool(FunnySchema, db_path=db_path, max_serves=args.max_serves, target_size=args.target_size,
+                        half_life_seconds=args.duration)
+        warmer = PoolWarmer(pool, lambda topic: generate(topic, "background"), admission, interval=args.interval)
+        warmer.start()
+
+    latencies, busy = [], 0
+
+    async def message(topic):
+        nonlocal busy
+        start = time.perf_counter()
+        if pool is not None and pool.take(topic) is not None:
+            latencies.append(time.perf_counter() - start)
+            return
+        try:
+            async with admission.slot(INTERACTIVE):
+                await generate(topic, "live")
+            latencies.append(time.perf_counter() - start)
+        except Busy:
+            busy += 1
+
+    topics = zipf_topics(int(args.rate * args.duration), args.topics, rng)
+    tasks = []
+    for topic in topics:
+        tasks.append(asyncio.ensure_future(message(topic)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+    unused = 0
+    if use_pool:
+        warmer.stop()
+        unused = sum(pool.available(topic) for topic in set(topics))
+        pool.close()
+    return latencies, busy, calls, pool, unused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=3.0, help="Messages per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of traffic")
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--capacity", type=int, default=8, help="Messages handled at once (admission)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between warming rounds")
+    parser.add_argument("--target-size", type=int, default=3, help="Unused jokes kept per hot topic")
+    parser.add_argument("--max-serves", type=int, default=1, help="Times a pooled joke is told")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"\n{int(args.rate * args.duration)} messages at {args.rate}/s, {args.topics} Zipf distributed topics, "
+          f"model latency {args.latency}s, {args.capacity} at once\n")
+    print(f"{'':<10} {'hits':>6} {'mean s':>7} {'p50 s':>7} {'p95 s':>7} {'busy':>5} {'live calls':>10} "
+          f"{'background':>10} {'unused':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, use_pool in (("no pool", False), ("pool", True)):
+            latencies, busy, calls, pool, unused = asyncio.run(
+                traffic(args, use_pool, os.path.join(directory, "joke_pool.db")))
+            hits = pool.stats["hits"] if pool else 0
+            mean = sum(latencies) / len(latencies) if latencies else float("nan")
+            print(f"{label:<10} {hits:>6} {mean:>7.3f} {percentile(latencies, 50):>7.3f} "
+                  f"{percentile(latencies, 95):>7.3f} {busy:>5} {calls['live']:>10} {calls['background']:>10} {unused:>7}")
+            if pool:
+                print(f"\n{pool.stats}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
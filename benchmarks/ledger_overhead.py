@@ -0,0 +1,79 @@
+'''
+    Cost of the token ledger (llm_utils/ledger.py) for the model calls, and what its report looks like.
+
+    - Ledger.record() in the caller's thread, in nanoseconds
+    - Writer throughput: records per second into SQLite with --batch-size records per transaction
+    - An offline structured LLM call with and without the ledger callback, in microseconds
+    - The report of the calls by node and model. The ledger database is a temporary file
+
+    Run from the repository root:
+    -> python -m benchmarks.ledger_overhead --calls 2000 --records 100000
+'''
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import timeit
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import ledger, structured_output
+
+
+class FunnySchema(BaseModel):
+    joke: str = Field(description="The joke")
+    rating: int = Field(description="The rating of the joke, from 1 to 10")
+
+
+async def llm_calls(calls, callbacks, model_name):
+    model = FakeStructuredChatModel(model_name=model_name, callbacks=callbacks)
+    structured_llm = structured_output.bind(model, FunnySchema)
+    start = time.perf_counter()
+    for index in range(calls):
+        config = {"configurable": {"run_id": f"run {index % 10}"}, "metadata": {"langgraph_node": "joke"}}
+        await structured_llm.ainvoke(f"Make a joke about topic {index}", config=config)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        book = ledger.Ledger(os.path.join(directory, "ledger.db"), batch_size=args.batch_size)
+        record = lambda: book.record("run", "node", "openai", "gpt-4o-mini", 120, 40, 850.0)
+
+        number = args.records
+        elapsed = timeit.timeit(record, number=number)
+        print(f"\nLedger.record()             {elapsed / number * 1e9:>8.0f} ns")
+        start = time.perf_counter()
+        book.flush(timeout=600)
+        elapsed += time.perf_counter() - start
+        print(f"writer throughput           {book.written / elapsed:>8.0f} records/s "
+              f"({book.written} records, batches of {args.batch_size})")
+        book.close()
+
+        # The module's callback writes into a ledger of its own in the temporary directory
+        ledger.callback.ledger = ledger.Ledger(os.path.join(directory, "calls.db"))
+        print(f"\nstructured LLM call (offline model, {args.calls} calls)")
+        without = asyncio.run(llm_calls(args.calls, None, "fake-model"))
+        with_ledger = asyncio.run(llm_calls(args.calls, [ledger.callback], "fake-model"))
+        print(f"without ledger              {without:>8.1f} us")
+        print(f"with ledger callback        {with_ledger:>8.1f} us  (+{with_ledger - without:.1f} us)")
+
+        print("\nreport by node and model:")
+        for row in ledger.callback.ledger.rollup(("node", "model")):
+            node, model, calls, prompt, completion, cost, latency, hits, errors = row
+            print(f"  {node:<6} {model:<20} {calls:>6} calls {prompt:>8} + {completion:>7} tokens "
+                  f"{cost:>8.4f} USD {latency:>6.2f} ms")
+        ledger.callback.ledger.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+'''
+    Load test for the Chainlit examples: how many concurrent users can 8_chainlit_api_agent.py sustain?
+
+    Simulated users arrive at --arrival-rate users per second (Poisson arrivals). Each one opens a chat
+    (on_chat_start) and sends --messages messages (on_message), thinking --think-time seconds on average
+    (exponential) before each one. Everything runs offline:
+    - chainlit is replaced by benchmarks/fake_chainlit.py, the handlers of the example are called directly
+    - the example's model key is registered to an offline model with --llm-latency seconds per call
+    - the joke API is the local stand-in server (chainlit_utils/stub_api.py) with --api-latency
+
+    Reported: answered / busy / failed messages, throughput, latency percentiles of the answers,
+    event loop lag (how late a 10 ms ticker wakes up) and traced memory per concurrent session.
+
+    Run from the repository root:
+    -> python -m benchmarks.load_test --users 200 --arrival-rate 20 --messages 3 --think-time 2
+    -> python -m benchmarks.load_test --script 7_chainlit_chat_ui.py
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import time
+import tracemalloc
+
+from benchmarks import fake_chainlit
+from benchmarks.fake_models import FakeStructuredChatModel
+from chainlit_utils.stub_api import start_in_thread
+from llm_utils import models
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class LoadTest:
+    def __init__(self, example, args):
+        self.example = example
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.busy_prefix = getattr(example, "BUSY_MESSAGE", "\0").split("{")[0]
+        self.latencies = []
+        self.busy = 0
+        self.failed = 0
+        self.active = 0
+        self.max_active = 0
+        self.lags = []
+        self.memory_samples = []
+
+    async def user(self, number):
+        session = fake_chainlit.Session(number)
+        fake_chainlit.enter(session)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await fake_chainlit.handlers["on_chat_start"]()
+            for _ in range(self.args.messages):
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time) if self.args.think_time else 0)
+                topic = f"topic {self.rng.randrange(self.args.topics)}"
+                sent_before = len(session.sent)
+                start = time.perf_counter()
+                try:
+                    await fake_chainlit.handlers["on_message"](fake_chainlit.Message(content=topic))
+                except Exception:
+                    self.failed += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                answers = session.sent[sent_before:]
+                if any(str(answer.content).startswith(self.busy_prefix) for answer in answers):
+                    self.busy += 1
+                else:
+                    self.latencies.append(elapsed)
+            if "on_chat_end" in fake_chainlit.handlers:
+                await fake_chainlit.handlers["on_chat_end"]()
+        finally:
+            self.active -= 1
+
+    async def ticker(self, stop, baseline):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            self.lags.append(time.perf_counter() - start - 0.01)
+            if tracemalloc.is_tracing() and self.active:
+                self.memory_samples.append((tracemalloc.get_traced_memory()[0] - baseline) / self.active)
+
+    async def run(self):
+        baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        stop = asyncio.Event()
+        tick = asyncio.create_task(self.ticker(stop, baseline))
+        start = time.perf_counter()
+        users = []
+        for number in range(self.args.users):
+            users.append(asyncio.create_task(self.user(number)))
+            await asyncio.sleep(self.rng.expovariate(self.args.arrival_rate))
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await tick
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default="8_chainlit_api_agent.py")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--arrival-rate", type=float, default=20.0, help="New users per second")
+    parser.add_argument("--messages", type=int, default=3, help="Messages per user")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean seconds between a user's messages")
+    parser.add_argument("--topics", type=int, default=50, help="Different topics the users pick from")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows everything down)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_in_thread(latency=args.api_latency)
+    os.environ["JOKE_API_URL"] = server.url
+    example = fake_chainlit.load_chainlit_example(args.script)
+    models.register_model(example.model_key, FakeStructuredChatModel(latency=args.llm_latency))
+
+    if not args.no_memory:
+        tracemalloc.start()
+    test = LoadTest(example, args)
+    # The handlers print every message, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = asyncio.run(test.run())
+    tracemalloc.stop()
+    server.shutdown()
+
+    sent = args.users * args.messages
+    print(f"\n{args.script}: {args.users} users arriving {args.arrival_rate}/s, {args.messages} messages each, "
+          f"think time {args.think_time}s, LLM {args.llm_latency}s, API {args.api_latency}s\n")
+    print(f"messages        {sent} sent, {len(test.latencies)} answered, {test.busy} busy, {test.failed} failed")
+    print(f"duration        {elapsed:.1f} s, at most {test.max_active} sessions at once")
+    print(f"throughput      {len(test.latencies) / elapsed:.1f} answers/s")
+    print(f"latency         p50 {percentile(test.latencies, 50):.2f} s  p95 {percentile(test.latencies, 95):.2f} s  "
+          f"p99 {percentile(test.latencies, 99):.2f} s  max {max(test.latencies, default=float('nan')):.2f} s")
+    print(f"event loop lag  p99 {percentile(test.lags, 99) * 1000:.1f} ms  max {max(test.lags, default=0) * 1000:.1f} ms")
+    if test.memory_samples:
+        print(f"memory          {percentile(test.memory_samples, 50) / 1024:.1f} KiB per session (median over the run)")
+    for name in ("admission", "flights", "api", "pool", "warmer"):
+        component = getattr(example, name, None)
+        if component is not None:
+            stats = component.stats() if callable(component.stats) else component.stats
+            print(f"{name:<15} {stats}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+'''
+    Cost of recording metrics (chainlit_utils/metrics.py) on the hot paths of the Chainlit apps.
+
+    - Counter increment, histogram observation and a timed block, in nanoseconds
+    - An offline structured LLM call with and without the metrics callback, in microseconds
+    - Rendering /metrics with --series label combinations per metric
+
+    Run from the repository root:
+    -> python -m benchmarks.metrics_overhead --calls 2000 --series 50
+'''
+
+import argparse
+import asyncio
+import time
+import timeit
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from chainlit_utils import metrics
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import structured_output
+
+
+class FunnySchema(BaseModel):
+    joke: str = Field(description="The joke")
+    rating: int = Field(description="The rating of the joke, from 1 to 10")
+
+
+def nanoseconds(statement, number=200_000, **names):
+    return min(timeit.repeat(statement, globals=names, number=number, repeat=5)) / number * 1e9
+
+
+async def llm_calls(calls, config):
+    structured_llm = structured_output.bind(FakeStructuredChatModel(), FunnySchema)
+    start = time.perf_counter()
+    for index in range(calls):
+        await structured_llm.ainvoke(f"Make a joke about topic {index}", config=config)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--series", type=int, default=50)
+    args = parser.parse_args()
+
+    registry = metrics.Registry()
+    counter = registry.counter("bench_total", "Benchmark counter", ["name"])
+    histogram = registry.histogram("bench_seconds", "Benchmark histogram", ["name"])
+    child, buckets = counter.labels("a"), histogram.labels("a")
+
+    print("\nrecording")
+    labelled = nanoseconds("counter.labels('a').inc()", counter=counter)
+    print(f"counter.labels(...).inc()   {labelled:>8.0f} ns")
+    print(f"bound child .inc()          {nanoseconds('child.inc()', child=child):>8.0f} ns")
+    print(f"histogram .observe()        {nanoseconds('buckets.observe(0.3)', buckets=buckets):>8.0f} ns")
+    print(f"with histogram.time()       {nanoseconds('with buckets.time(): pass', buckets=buckets):>8.0f} ns")
+
+    print(f"\nstructured LLM call (offline model, {args.calls} calls)")
+    without = asyncio.run(llm_calls(args.calls, None))
+    with_callback = asyncio.run(llm_calls(args.calls, {"callbacks": [metrics.llm_callback]}))
+    print(f"without callback            {without:>8.1f} us")
+    print(f"with metrics callback       {with_callback:>8.1f} us  (+{with_callback - without:.1f} us)")
+
+    for index in range(args.series):
+        counter.labels(f"series {index}").inc()
+        histogram.labels(f"series {index}").observe(index / args.series)
+    start = time.perf_counter()
+    text = registry.expose()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"\n/metrics with {args.series} series per metric: {len(text.splitlines())} lines, {elapsed:.2f} ms")
+
+    print("\nllm metrics after the calls:")
+    for line in metrics.REGISTRY.expose().splitlines():
+        if line.startswith(("llm_calls_total", "llm_tokens_total", "llm_call_seconds_count")):
+            print(f"  {line}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
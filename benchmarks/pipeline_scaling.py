@@ -0,0 +1,134 @@
+'''
+    Throughput of the joke job (database/joke_pipeline.py) from 1 to N check processes.
+
+    Two runs per number of shards, each into a fresh copy of the jokes database:
+    - pipeline:    the whole job with the offline model (--latency seconds per call, --workers calls in flight)
+    - checks only: the generation stage returns ready made model answers, so the check and write stages
+                   set the pace (--checks-factor times as many items)
+    Shards 0 is the baseline: the checks and the writes run in the event loop, like in a single script.
+
+    The offline model answers --duplicates of the jokes from a small set of repeated jokes, rates the jokes
+    from 1 to 10 and writes a query that isn't a single INSERT for --bad-queries of them.
+    Reported: items per second, speedup over the baseline, rows written, duplicates and invalid queries
+    found and how busy the check processes (mean) and the writer were.
+
+    Run from the repository root:
+    -> python -m benchmarks.pipeline_scaling --topics 5000 --latency 0.2 --workers 256
+    -> python -m benchmarks.pipeline_scaling --shards 0,1,2,4,8
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import shutil
+import tempfile
+import zlib
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from database import init_db, joke_pipeline
+
+
+def _field(name, prompt):
+    match = re.search(rf"{name}: (.*)", prompt)
+    return match.group(1).strip() if match else ""
+
+
+class Answers:
+    def __init__(self, duplicates, bad_queries, seed=0):
+        self.duplicates = duplicates
+        self.bad_queries = bad_queries
+        self.seed = seed
+
+    def joke(self, topic):
+        rng = random.Random(zlib.crc32(f"{self.seed} {topic}".encode()))
+        if rng.random() < self.duplicates:
+            # Repeated jokes come back with other case and punctuation
+            joke = f"Why did the {rng.choice(['cat', 'cow', 'coder'])} cross the road? To get to the other side!"
+            joke = joke.upper() if rng.random() < 0.5 else joke.replace("?", " ?")
+        else:
+            joke = f"Why is {topic} like a database? Both lose their keys at the worst moment ({rng.getrandbits(48):x})."
+        return {"topic": topic, "joke": joke, "rating": rng.randint(1, 10), "rating_reason": "It has a twist"}
+
+    def query(self, topic, joke, rating):
+        quote = lambda text: "'" + text.replace("'", "''") + "'"
+        if random.Random(zlib.crc32(joke.encode())).random() < self.bad_queries:
+            return {"query": f"DELETE FROM jokes WHERE topic = {quote(topic)};"}
+        return {"query": f"INSERT INTO jokes (topic, joke, rating) VALUES ({quote(topic)}, {quote(joke)}, {rating});"}
+
+    # FakeStructuredChatModel's responder
+    def __call__(self, tool_name, prompt):
+        if tool_name == "QuerySchema":
+            return self.query(_field("Topic", prompt), _field("Joke", prompt), int(_field("Rating", prompt) or 0))
+        return self.joke(_field("Topic", prompt))
+
+    # What generate() of the job returns, without the model
+    def record(self, topic):
+        joke = self.joke(topic)
+        query = self.query(topic, joke["joke"], joke["rating"]) if joke["rating"] >= joke_pipeline.MIN_RATING else None
+        return {"topic": topic, "joke": joke, "query": query}
+
+
+def run(db_template, directory, generate, items, shards, args):
+    db_path = os.path.join(directory, f"jokes-{shards}.db")
+    shutil.copy(db_template, db_path)
+    model = FakeStructuredChatModel(latency=args.latency, responder=Answers(args.duplicates, args.bad_queries))
+    # build() prints the tables like example 6
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline = joke_pipeline.build(model, db_path, shards=shards, workers=args.workers)
+    if generate is not None:
+        pipeline.generate = generate
+    return pipeline.run(items)
+
+
+def print_table(title, results):
+    print(f"\n{title}\n")
+    print(f"{'shards':>6} {'items/s':>9} {'speedup':>8} {'written':>8} {'duplicate':>9} {'bad query':>9} "
+          f"{'checks busy':>11} {'writer busy':>11}")
+    baseline = results[0][1]["items_per_second"]
+    for shards, stats in results:
+        statuses = stats["statuses"]
+        checks_busy = sum(stats["shard_busy"]) / len(stats["shard_busy"]) / stats["seconds"]
+        print(f"{shards:>6} {stats['items_per_second']:>9.0f} {stats['items_per_second'] / baseline:>7.2f}x "
+              f"{stats['written']:>8} {statuses.get('duplicate', 0):>9} {statuses.get('invalid query', 0):>9} "
+              f"{checks_busy:>11.0%} {stats['writer_busy'] / stats['seconds']:>11.0%}")
+
+
+def main():
+    cores = os.cpu_count()
+    default_shards = sorted({0, *(2 ** power for power in range(cores.bit_length()) if 2 ** power <= cores), cores})
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per call of the offline model")
+    parser.add_argument("--workers", type=int, default=128, help="Model calls in flight")
+    parser.add_argument("--shards", default=",".join(map(str, default_shards)), help="Comma separated shard counts")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Share of jokes from the repeated set")
+    parser.add_argument("--bad-queries", type=float, default=0.05, help="Share of queries that aren't an INSERT")
+    parser.add_argument("--checks-factor", type=int, default=10, help="Items of the checks only run, times --topics")
+    args = parser.parse_args()
+
+    answers = Answers(args.duplicates, args.bad_queries)
+    shard_counts = [int(value) for value in args.shards.split(",")]
+    topics = [f"topic {index}" for index in range(args.topics)]
+    records = [answers.record(f"topic {index}") for index in range(args.topics * args.checks_factor)]
+
+    async def ready(record):
+        return record
+
+    print(f"\n{cores} cores, {args.topics} topics, model latency {args.latency} s, {args.workers} workers")
+    with tempfile.TemporaryDirectory() as directory:
+        db_template = os.path.join(directory, "template.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_db.initialize_database(db_template)
+
+        print_table("pipeline (offline model)",
+                    [(shards, run(db_template, directory, None, topics, shards, args)) for shards in shard_counts])
+        print_table(f"checks only ({len(records)} ready made answers)",
+                    [(shards, run(db_template, directory, ready, records, shards, args)) for shards in shard_counts])
+    print()
+
+
+if __name__ == "__main__":
+    main()
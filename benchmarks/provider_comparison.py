@@ -0,0 +1,222 @@
+'''
+    Cohere versus OpenAI on the prompts, schemas and graph of the examples, replayed from recorded
+    provider answers (llm_utils/cassettes.py), so the comparison is repeatable and runs offline.
+
+    Scenarios:
+    - schema: FunnySchema of 3_add_schema.py for --topics topics. Success = every field filled
+    - union:  CombinedSchema of 3.1_Multiple_schemas.py for joke and chat messages. Success = the answer
+              uses the schema matching the message. A provider error (Cohere) is a failure
+    - graph:  5_conditional_agent.py for the topics. Success = a joke rated >= 6, "iterations" is the mean
+              number of joke rounds it took
+
+    Every item is asked --repeat times, all providers and items run concurrently (--concurrency per provider).
+    Reported per provider and scenario: success rate, latency of the model calls (recorded), prompt and
+    completion tokens per call, iterations to the rating threshold and calls missing from the cassette.
+    Provider errors are recorded too and fail the same items when replayed. A call that isn't in the
+    cassette (the prompts changed since recording) fails its item, record again to compare the new prompts.
+
+    Record once with real providers (API keys needed), then replay as often as needed:
+    -> python -m benchmarks.provider_comparison --record --providers openai:gpt-4o-mini,cohere --repeat 5
+    -> python -m benchmarks.provider_comparison --providers openai:gpt-4o-mini,cohere
+    The offline model (provider "fake") runs the same pipeline without API keys:
+    -> python -m benchmarks.provider_comparison --record --providers fake:a --cassettes /tmp/cassettes
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+from typing import Optional, Union
+
+from benchmarks.examples import ROOT, load_example
+from benchmarks.fake_models import FakeStructuredChatModel
+from graph_utils import budget
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import cassettes, models, structured_output
+
+
+# Same prompts and schemas as 3_add_schema.py and 3.1_Multiple_schemas.py (they run their demos on import)
+FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You are the funniest person in the world, a comedian, a joker. You make up jokes about every topic.
+    Topic: {topic}
+    """
+)
+
+ROUTING_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You will either tell a joke or answer in normal manner depending on the user's message. Choose appropriate schema accordingly.
+    User's message: {message}
+    """
+)
+
+
+class FunnySchema(BaseModel):
+    """Joke to be told to the user"""
+    topic: Optional[str] = Field(description="The topic of the joke")
+    joke: Optional[str] = Field(description="The joke")
+    rating: Optional[int] = Field(description="The rating of the joke, from 1 to 10 (bigger is funnier)")
+    rating_reason: Optional[str] = Field(description="Why the joke is rated this way")
+
+
+class ConversationalSchema(BaseModel):
+    """A regular back and forth conversation with user"""
+    response: str = Field(description="A regular response to the user's message")
+
+
+class CombinedSchema(BaseModel):
+    output: Union[ConversationalSchema, FunnySchema]
+
+
+TOPICS = ["Cat", "Not funny Hello World joke", "Cows", "Finland", "Programmers", "Coffee", "Mondays", "Space"]
+
+MESSAGES = [
+    ("Tell me a joke about cows", FunnySchema),
+    ("What is the capital of Finland", ConversationalSchema),
+    ("Make a joke about programmers", FunnySchema),
+    ("How do airplanes fly?", ConversationalSchema),
+]
+
+SCENARIOS = ("schema", "union", "graph")
+
+
+def cassette_path(directory, model_key):
+    return os.path.join(directory, model_key.replace(":", "_") + ".jsonl")
+
+
+async def schema_item(model, topic, config):
+    answer = await structured_output.bind(model, FunnySchema).ainvoke(FUNNY_LLM_PROMPT.format(topic=topic))
+    return answer is not None and all(value is not None for value in answer.dict().values()), None
+
+
+async def union_item(model, item, config):
+    message, expected = item
+    answer = await structured_output.bind(model, CombinedSchema).ainvoke(ROUTING_PROMPT.format(message=message))
+    return isinstance(getattr(answer, "output", None), expected), None
+
+
+class GraphExited(Exception):
+    pass
+
+
+def _exit(*args):
+    raise GraphExited("The example's node gave up after a model failure")
+
+
+async def graph_item(model, topic, config):
+    example = load_example("5_conditional_agent.py")
+    # The nodes exit() when the model fails. A SystemExit in a node's task stops the event loop, and with
+    # it every provider's run, so the node's exit() fails only this item
+    example.exit = _exit
+    # A budget large enough that only the rating ends the run
+    res = await example.graph.ainvoke({"messages": [], "joke_topic": topic, "iteration": 0, "candidate_count": 1,
+                                       **budget.new_budget(3600, 10**9)}, config=config)
+    reached = res.get("best_rating", 0) >= 6
+    return reached, res["iteration"] + 1 if reached else None
+
+
+async def run_scenario(name, model_key, model, items, concurrency):
+    run_item = {"schema": schema_item, "union": union_item, "graph": graph_item}[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    config = models.model_config(model_key)
+
+    async def guarded(item):
+        async with semaphore:
+            try:
+                return await run_item(model, item, config)
+            # A failed run is a failure. So is a call missing from the cassette, it is counted in the
+            # cassette's misses
+            except Exception:
+                return False, None
+
+    first_call = len(model.cache.calls)
+    first_miss = model.cache.misses
+    outcomes = await asyncio.gather(*(guarded(item) for item in items))
+    return outcomes, model.cache.calls[first_call:], model.cache.misses - first_miss
+
+
+async def compare(model_key, args):
+    model = models.get_model(model_key)
+    mode = cassettes.RECORD if args.record else cassettes.REPLAY
+    cassettes.use(model, cassette_path(args.cassettes, model_key), mode, args.speed)
+    items = {
+        "schema": TOPICS[:args.topics] * args.repeat,
+        "union": MESSAGES * args.repeat,
+        "graph": TOPICS[:args.topics] * args.repeat,
+    }
+    results = {}
+    for name in args.scenarios:
+        results[name] = await run_scenario(name, model_key, model, items[name], args.concurrency)
+    return results
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", default="openai:gpt-4o-mini,cohere", help="Comma separated model keys")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--cassettes", default=os.path.join(ROOT, "benchmarks", "cassettes"))
+    parser.add_argument("--record", action="store_true", help="Call the providers and record their answers")
+    parser.add_argument("--topics", type=int, default=4, help=f"Topics of the schema and graph scenarios (max {len(TOPICS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Times every item is asked")
+    parser.add_argument("--concurrency", type=int, default=8, help="Items run at once per provider")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay the recorded latencies times this")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="Seconds per call of the offline model")
+    args = parser.parse_args()
+
+    # The offline model
+    models.register_provider("fake", lambda name: FakeStructuredChatModel(model_name=name or "fake-model",
+                                                                           latency=args.fake_latency))
+    # Placeholder keys so the provider clients can be created for replaying.
+    # Replayed calls cost nothing, they are kept out of the token ledger
+    if not args.record:
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        os.environ.setdefault("COHERE_API_KEY", "replay")
+        os.environ.setdefault("LLM_LEDGER", "0")
+
+    keys = [key.strip() for key in args.providers.split(",") if key.strip()]
+    if not args.record:
+        missing = [key for key in keys if not os.path.exists(cassette_path(args.cassettes, key))]
+        for key in missing:
+            print(f"No cassette for {key} in {args.cassettes}, record it first with --record")
+        keys = [key for key in keys if key not in missing]
+        if not keys:
+            return
+
+    async def compare_all():
+        return await asyncio.gather(*(compare(key, args) for key in keys), return_exceptions=True)
+
+    # The examples print every step, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        all_results = asyncio.run(compare_all())
+
+    print(f"\n{'record' if args.record else 'replay'} from {args.cassettes}, every item asked {args.repeat} times\n")
+    print(f"{'provider':<22} {'scenario':<8} {'items':>6} {'success':>8} {'p50 s':>7} {'p95 s':>7} "
+          f"{'prompt tok':>10} {'compl. tok':>10} {'iterations':>10} {'missed':>7}")
+    for key, results in zip(keys, all_results):
+        if isinstance(results, BaseException):
+            raise results
+        for name, (outcomes, calls, misses) in results.items():
+            successes = sum(1 for ok, _ in outcomes if ok)
+            iterations = [count for ok, count in outcomes if ok and count is not None]
+            latencies = [call[0] for call in calls]
+            prompt = statistics.mean(call[1] for call in calls) if calls else 0
+            completion = statistics.mean(call[2] for call in calls) if calls else 0
+            mean_iterations = f"{statistics.mean(iterations):.2f}" if iterations else "-"
+            print(f"{key:<22} {name:<8} {len(outcomes):>6} {successes / len(outcomes):>8.0%} "
+                  f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} "
+                  f"{prompt:>10.0f} {completion:>10.0f} {mean_iterations:>10} {misses:>7}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
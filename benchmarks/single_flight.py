@@ -0,0 +1,97 @@
+'''
+    Many users asking for jokes about a few topics at the same moment, with and without single-flight
+    (chainlit_utils/single_flight.py), the way the message handler of 7_chainlit_chat_ui.py calls the model.
+
+    The offline model takes --latency seconds per call. Also checks that a call is cancelled
+    when every user waiting for it disconnects.
+
+    Run from the repository root:
+    -> python -m benchmarks.single_flight --users 200 --topics 5 --latency 0.5
+'''
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from chainlit_utils.single_flight import SingleFlight, make_key
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from llm_utils import structured_output
+
+
+PROMPT = ChatPromptTemplate.from_template("Make a joke about: {topic}")
+
+
+class FunnySchema(BaseModel):
+    joke: str = Field(description="The joke")
+    rating: int = Field(description="The rating of the joke, from 1 to 10")
+
+
+class CountingModel(FakeStructuredChatModel):
+    started: int = 0
+    finished: int = 0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        self.started += 1
+        result = await super()._agenerate(messages, stop, run_manager, tools, **kwargs)
+        self.finished += 1
+        return result
+
+
+async def users(model, topics, flights):
+    structured_llm = structured_output.bind(model, FunnySchema)
+
+    async def user(topic):
+        # Users type the same topic a bit differently
+        prompt = PROMPT.format(topic=random.choice([topic, topic.upper(), f"  {topic} "]))
+        if flights is None:
+            return await structured_llm.ainvoke(prompt)
+        return await flights.do(make_key(prompt, "fake", FunnySchema), lambda: structured_llm.ainvoke(prompt))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(topic) for topic in topics))
+    return time.perf_counter() - start
+
+
+async def everyone_leaves(model, flights):
+    structured_llm = structured_output.bind(model, FunnySchema)
+    prompt = PROMPT.format(topic="nobody waits for this")
+    waiters = [asyncio.ensure_future(flights.do(make_key(prompt, "fake", FunnySchema),
+                                                lambda: structured_llm.ainvoke(prompt)))
+               for _ in range(10)]
+    await asyncio.sleep(model.latency / 2)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(model.latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    topics = [f"topic {random.randrange(args.topics)}" for _ in range(args.users)]
+    print(f"\n{args.users} users at once, {args.topics} different topics, model latency {args.latency}s\n")
+
+    for label, flights in (("independent calls", None), ("single-flight", SingleFlight())):
+        model = CountingModel(latency=args.latency)
+        elapsed = asyncio.run(users(model, topics, flights))
+        print(f"{label:<18} {model.started:>5} LLM calls {elapsed:>6.2f} s")
+        if flights:
+            print(f"{'':<18} {flights.stats}")
+
+    model = CountingModel(latency=args.latency)
+    flights = SingleFlight()
+    asyncio.run(everyone_leaves(model, flights))
+    print(f"\nall 10 waiters disconnect: {model.started} call started, {model.finished} finished, "
+          f"{flights.stats['cancelled']} cancelled\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+'''
+    10k loop iterations: whole-state mutation versus append-only channels with a bounded message log.
+
+    - whole state: every node does state["messages"] += [AIMessage(...)] and returns the whole state,
+      like the examples used to. The message list grows without a limit
+    - channels:    nodes return only the change, messages go to a ring buffer (channels.ring_buffer)
+      and are stored as slotted Records
+
+    With --snapshot the state is also serialized after every step, like graph_utils.checkpoint does.
+    That is where carrying an unbounded list costs O(n^2) in total.
+
+    Run from the repository root:
+    -> python -m benchmarks.state_channels --iterations 10000 --snapshot
+'''
+
+import argparse
+import time
+import tracemalloc
+from typing import Annotated, Deque, List, TypedDict
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, StateGraph
+
+from graph_utils import channels
+from graph_utils.channels import Record
+from graph_utils.checkpoint import dumps_state
+
+
+class WholeState(TypedDict):
+    messages: List[AIMessage]
+    iteration: int
+    limit: int
+
+
+def whole_state_node(state: WholeState) -> WholeState:
+    state["messages"] += [
+        AIMessage(content=f"Generated joke number {state['iteration']}"),
+        AIMessage(content="Rating: 4"),
+    ]
+    state["iteration"] += 1
+    return state
+
+
+def build_channel_state(retention):
+    class ChannelState(TypedDict):
+        messages: Annotated[Deque[Record], channels.ring_buffer(retention)]
+        iteration: int
+        limit: int
+
+    return ChannelState
+
+
+def channel_node(state) -> dict:
+    return {
+        "messages": [
+            Record("ai", f"Generated joke number {state['iteration']}"),
+            Record("ai", "Rating: 4"),
+        ],
+        "iteration": state["iteration"] + 1,
+    }
+
+
+def is_done(state):
+    return END if state["iteration"] >= state["limit"] else "loop"
+
+
+def build_graph(state_type, node):
+    workflow = StateGraph(state_type)
+    workflow.add_node("loop", node)
+    workflow.add_conditional_edges("loop", is_done)
+    workflow.set_entry_point("loop")
+    return workflow.compile()
+
+
+def measure(label, graph, iterations, snapshot):
+    config = {"recursion_limit": iterations + 10}
+    state = {"messages": [], "iteration": 0, "limit": iterations}
+    tracemalloc.start()
+    start = time.perf_counter()
+    snapshot_bytes = 0
+    if snapshot:
+        for values in graph.stream(state, config, stream_mode="values"):
+            snapshot_bytes += len(dumps_state(values))
+            result = values
+    else:
+        result = graph.invoke(state, config)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    extra = f", snapshots {snapshot_bytes / 1e6:8.1f} MB" if snapshot else ""
+    print(f"{label:<26} {elapsed:7.2f} s  {iterations / elapsed:8.0f} steps/s  peak {peak / 1e6:7.1f} MB  "
+          f"messages kept {len(result['messages']):>6}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--retention", type=int, default=50, help="Size of the message ring buffer")
+    parser.add_argument("--snapshot", action="store_true", help="Serialize the state after every step")
+    args = parser.parse_args()
+
+    print(f"\n{args.iterations} loop iterations, message retention {args.retention}\n")
+    measure("whole state (unbounded)", build_graph(WholeState, whole_state_node), args.iterations, args.snapshot)
+    measure("channels + ring buffer", build_graph(build_channel_state(args.retention), channel_node),
+            args.iterations, args.snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+'''
+    Snapshotting the agent's state after every step.
+
+    The graph of 5_conditional_agent.py is run with an offline model. After every step the state is
+    serialized to JSON (like graph_utils.checkpoint does) and deep copied. Since the model is given in the
+    graph's config (llm_utils/models.py), the state is plain data and the snapshots cost next to nothing.
+    For comparison, the old kind of state that carried the chat model itself is snapshotted as well.
+
+    Run from the repository root:
+    -> python -m benchmarks.state_snapshot --runs 200
+'''
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import pickle
+import time
+
+from benchmarks.examples import load_example
+from benchmarks.fake_models import FakeStructuredChatModel
+from graph_utils import budget
+from graph_utils.channels import Record
+from graph_utils.checkpoint import dumps_state
+from llm_utils import models
+
+
+def try_snapshot(label, state):
+    for name, snapshot in (("json", dumps_state), ("deepcopy", copy.deepcopy), ("pickle", pickle.dumps)):
+        try:
+            start = time.perf_counter()
+            for _ in range(100):
+                snapshot(state)
+            print(f"{label:<34} {name:<9} {(time.perf_counter() - start) / 100 * 1e6:10.1f} us")
+        except Exception as e:
+            print(f"{label:<34} {name:<9} fails: {type(e).__name__}: {str(e)[:60]}")
+
+
+# Returns (graph time, snapshot time, steps, final state) of one run
+async def snapshot_run(graph, state, config):
+    snapshot_time = 0.0
+    steps = 0
+    start = time.perf_counter()
+    async for values in graph.astream(state, config, stream_mode="values"):
+        step_end = time.perf_counter()
+        dumps_state(values)
+        copy.deepcopy(values)
+        snapshot_time += time.perf_counter() - step_end
+        steps += 1
+    return time.perf_counter() - start - snapshot_time, snapshot_time, steps, values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    example = load_example("5_conditional_agent.py")
+    models.register_model("fake:snapshot", FakeStructuredChatModel())
+    config = models.model_config("fake:snapshot")
+
+    graph_time = snapshot_time = 0.0
+    steps = 0
+    for _ in range(args.runs):
+        state = {"messages": [Record("human", "Not funny Hello world joke")],
+                 "joke_topic": example.joke_topic,
+                 "iteration": 0,
+                 **budget.new_budget(3600, 10**9)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_graph_time, run_snapshot_time, run_steps, values = asyncio.run(snapshot_run(example.graph, state, config))
+        graph_time += run_graph_time
+        snapshot_time += run_snapshot_time
+        steps += run_steps
+
+    print(f"\n{args.runs} runs, {steps} steps of 5_conditional_agent.py with an instant offline model")
+    print(f"graph execution {graph_time / steps * 1e6:10.1f} us/step")
+    print(f"json + deepcopy {snapshot_time / steps * 1e6:10.1f} us/step "
+          f"({snapshot_time / graph_time * 100:.1f} % of the graph's own overhead, before any LLM latency)\n")
+
+    # The same state once more, now carrying a chat model like the examples used to
+    plain_state = {**values}
+    try_snapshot("plain state", plain_state)
+    try_snapshot("state with a fake model", {**plain_state, "LLM_model": FakeStructuredChatModel()})
+    try:
+        from langchain_openai import ChatOpenAI
+        try_snapshot("state with ChatOpenAI", {**plain_state, "LLM_model": ChatOpenAI(api_key="offline")})
+    except ImportError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+'''
+    What the user of 8_chainlit_api_agent.py sees while the graph runs: the answer's message updated as
+    the nodes finish and the joke's tokens arrive (use_streaming = True) versus the joke only at the end.
+
+    Offline like the load test: chainlit is benchmarks/fake_chainlit.py, the API is the local stand-in
+    (--api-latency) and the model is FakeStructuredChatModel. Its answer starts after --llm-latency seconds
+    and streams one token per --token-latency seconds, a call that isn't streamed takes as long in total.
+    --users users send one message each at the same time (different topics, so no call is shared).
+
+    Reported per mode, from the user's message (percentiles over the users):
+    - first output: the first thing the graph produced shown to the user (the API node's result or the joke)
+    - first token:  the first characters of the joke
+    - answer:       the whole joke
+    - updates per message and CPU time per message (astream_events has a cost)
+
+    Run from the repository root:
+    -> python -m benchmarks.streaming_progress --users 8 --llm-latency 0.5 --token-latency 0.02
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from benchmarks import fake_chainlit
+from benchmarks.fake_models import FakeStructuredChatModel
+from benchmarks.load_test import percentile
+from chainlit_utils.stub_api import start_in_thread
+from llm_utils import models
+
+
+def responder(tool_name, prompt):
+    topic = prompt.split("topic:")[-1].split(" and the person")[0].strip()
+    return {"topic": topic,
+            "joke": f"Why did {topic} join the comedy club? Because every time someone told a joke about it, "
+                    f"the whole room asked for the sequel, and {topic} never learned to say no to an encore.",
+            "rating": 7,
+            "rating_reason": "Personal and a little absurd"}
+
+
+# Seconds from the start to the first version of the answer matching the condition
+def first_seen(history, start, condition):
+    for seen, content in history:
+        if condition(content):
+            return seen - start
+    return float("nan")
+
+
+async def user(number):
+    session = fake_chainlit.Session(number)
+    fake_chainlit.enter(session)
+    start = time.perf_counter()
+    await fake_chainlit.handlers["on_message"](fake_chainlit.Message(content=f"topic {number}"))
+    # The answer is the message sent by the handler, its history has every version the user saw
+    answer = session.sent[-1]
+    placeholder = answer.history[0][1]
+    final = answer.content
+    return {
+        "first output": first_seen(answer.history, start, lambda content: content != placeholder),
+        "first token": first_seen(answer.history, start, lambda content: content and final.startswith(content)),
+        "answer": answer.history[-1][0] - start,
+        "updates": len(answer.history),
+    }
+
+
+# Results of every message per mode
+async def run(example, args):
+    results = {}
+    for streaming in (False, True):
+        example.use_streaming = streaming
+        results[streaming] = []
+        cpu = time.process_time()
+        for _ in range(args.rounds):
+            # The example caches the API's answer, every round fetches it again
+            example.api.invalidate()
+            results[streaming].extend(await asyncio.gather(*(user(number) for number in range(args.users))))
+        results[streaming, "cpu"] = (time.process_time() - cpu) / len(results[streaming]) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8, help="Users sending a message at the same time")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds to the model's first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Seconds per streamed token")
+    parser.add_argument("--api-latency", type=float, default=0.2)
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds of --users messages per mode")
+    args = parser.parse_args()
+
+    server = start_in_thread(latency=args.api_latency)
+    os.environ["JOKE_API_URL"] = server.url
+    example = fake_chainlit.load_chainlit_example("8_chainlit_api_agent.py")
+    models.register_model(example.model_key, FakeStructuredChatModel(latency=args.llm_latency,
+                                                                     token_latency=args.token_latency,
+                                                                     responder=responder))
+
+    print(f"\n{args.users} users at once, {args.rounds} rounds, API {args.api_latency} s, "
+          f"model {args.llm_latency} s + {args.token_latency} s per token\n")
+    print(f"{'':<10} {'first output p50/p95 s':>22} {'first token p50/p95 s':>22} {'answer p50/p95 s':>18} "
+          f"{'updates':>8} {'CPU ms':>7}")
+    # The handlers print every message
+    with contextlib.redirect_stdout(io.StringIO()):
+        all_results = asyncio.run(run(example, args))
+    for label, streaming in (("blocking", False), ("streaming", True)):
+        results = all_results[streaming]
+
+        def column(name):
+            values = [result[name] for result in results]
+            return f"{percentile(values, 50):.2f} / {percentile(values, 95):.2f}"
+
+        updates = sum(result["updates"] for result in results) / len(results)
+        print(f"{label:<10} {column('first output'):>22} {column('first token'):>22} {column('answer'):>18} "
+              f"{updates:>8.1f} {all_results[streaming, 'cpu']:>7.1f}")
+    server.shutdown()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+'''
+    Micro-benchmark: per-iteration overhead of binding the structured output schemas.
+
+    Simulates the improvement loop of 5_conditional_agent.py (joke -> joke_improver, 5 iterations)
+    with an offline model that answers instantly, so only the LangChain overhead is measured.
+    - uncached: model.with_structured_output(Schema) on every node execution (the old way)
+    - cached:   structured_output.bind(model, Schema)
+
+    Run from the repository root:
+    -> python -m benchmarks.structured_output_binding
+'''
+
+import argparse
+import time
+from typing import List
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from llm_utils import structured_output
+
+
+FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template("Make a joke. Topic: {topic}")
+IMPROVER_LLM_PROMPT = ChatPromptTemplate.from_template("Improve the joke about {topic}. Original joke: {joke}")
+
+
+@structured_output.register_schema
+class FunnySchema(BaseModel):
+    topic: str = Field(description="The topic of the joke")
+    joke: str = Field(description="The joke")
+    rating: int = Field(description="The rating of the joke, from 1 to 10 (bigger is funnier)")
+    rating_reason: str = Field(description="Why the joke is rated this way")
+
+
+@structured_output.register_schema
+class ImprovedJokeSchema(BaseModel):
+    suggestions: List[str] = Field(description="Suggestions to improve the joke")
+    new_topic: str = Field(description="The new improved topic of the joke")
+
+
+def uncached(model, schema):
+    return model.with_structured_output(schema)
+
+
+# One improvement loop, returns the time spent binding and the total time per iteration
+def improvement_loop(model, bind, iterations, invoke):
+    topic, joke = "Hello World", ""
+    bind_time = 0.0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        joker = bind(model, FunnySchema)
+        bind_time += time.perf_counter() - t
+        if invoke:
+            joke = joker.invoke(FUNNY_LLM_PROMPT.format(topic=topic)).joke
+
+        t = time.perf_counter()
+        improver = bind(model, ImprovedJokeSchema)
+        bind_time += time.perf_counter() - t
+        if invoke:
+            topic = improver.invoke(IMPROVER_LLM_PROMPT.format(topic=topic, joke=joke)).new_topic
+    total = time.perf_counter() - start
+    return bind_time / iterations, total / iterations
+
+
+def run(label, model, bind, args, invoke):
+    bind_times, totals = [], []
+    for _ in range(args.repeat):
+        bind_time, total = improvement_loop(model, bind, args.iterations, invoke)
+        bind_times.append(bind_time)
+        totals.append(total)
+    bind_avg = sum(bind_times) / len(bind_times) * 1e6
+    total_avg = sum(totals) / len(totals) * 1e6
+    print(f"{label:<28} binding {bind_avg:10.1f} us/iteration   total {total_avg:10.1f} us/iteration")
+    return total_avg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5, help="Improvement loop iterations")
+    parser.add_argument("--repeat", type=int, default=200, help="How many loops are averaged")
+    args = parser.parse_args()
+
+    model = FakeStructuredChatModel()
+    print(f"\n{args.iterations}-iteration improvement loop, averaged over {args.repeat} runs\n")
+
+    run("uncached, bind only", model, uncached, args, invoke=False)
+    run("cached, bind only", model, structured_output.bind, args, invoke=False)
+    before = run("uncached, bind + invoke", model, uncached, args, invoke=True)
+    after = run("cached, bind + invoke", model, structured_output.bind, args, invoke=True)
+
+    print(f"\nPer-iteration overhead saved: {before - after:.1f} us ({(1 - after / before) * 100:.1f} %)")
+    print(f"Binding cache: {structured_output.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+'''
+    Tool call dispatch: one at a time (the old loop of 6.2_LLM_with_tools.py) versus graph_utils/tool_node.py.
+
+    An offline model asks for --calls tool calls per turn for --turns turns before answering.
+    Half of the tools are sync (time.sleep) and half async (asyncio.sleep), each takes --tool-latency seconds.
+    The old loop builds the tool dict and runs the calls one after another, the registry runs them concurrently.
+
+    Run from the repository root:
+    -> python -m benchmarks.tool_dispatch --calls 16 --turns 3 --tool-latency 0.2
+'''
+
+import argparse
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import StructuredTool
+
+from benchmarks.fake_models import FakeStructuredChatModel
+from graph_utils.tool_node import ToolRegistry
+
+
+def make_tools(count, latency):
+    tools = []
+    for index in range(count):
+        if index % 2:
+            async def slow(a: int, b: int) -> int:
+                await asyncio.sleep(latency)
+                return a + b
+            tools.append(StructuredTool.from_function(coroutine=slow, name=f"async_tool_{index}", description="Adds a and b"))
+        else:
+            def slow(a: int, b: int) -> int:
+                time.sleep(latency)
+                return a + b
+            tools.append(StructuredTool.from_function(func=slow, name=f"sync_tool_{index}", description="Adds a and b"))
+    return tools
+
+
+# The loop of the old 6.2 example
+async def sequential_agent(model, tools, messages):
+    llm_with_tools = model.bind_tools(tools)
+    messages = list(messages)
+    while True:
+        ai_message = await llm_with_tools.ainvoke(messages)
+        messages.append(ai_message)
+        if not ai_message.tool_calls:
+            return messages
+        for tool_call in ai_message.tool_calls:
+            selected_tool = {tool.name: tool for tool in tools}[tool_call["name"].lower()]
+            messages.append(await selected_tool.ainvoke(tool_call))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=16, help="Tool calls per model turn")
+    parser.add_argument("--turns", type=int, default=3, help="Model turns with tool calls")
+    parser.add_argument("--tools", type=int, default=8, help="Number of different tools")
+    parser.add_argument("--tool-latency", type=float, default=0.2)
+    parser.add_argument("--model-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tools = make_tools(args.tools, args.tool_latency)
+    model = FakeStructuredChatModel(latency=args.model_latency, tool_turns=args.turns, calls_per_turn=args.calls)
+    registry = ToolRegistry(tools, timeout=args.tool_latency * 10, max_workers=args.calls)
+    messages = [HumanMessage("Add all the numbers")]
+    total_calls = args.calls * args.turns
+    model_time = (args.turns + 1) * args.model_latency
+
+    print(f"\n{args.turns} turns x {args.calls} tool calls, tools take {args.tool_latency}s, "
+          f"the model {args.model_latency}s ({model_time:.2f}s of model time per conversation)\n")
+    for label, run in (("one at a time", lambda: sequential_agent(model, tools, messages)),
+                       ("registry", lambda: registry.run_agent(model, messages))):
+        start = time.perf_counter()
+        conversation = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        answered = sum(1 for message in conversation if message.type == "tool")
+        assert answered == total_calls, answered
+        print(f"{label:<14} {elapsed:>7.2f} s per conversation {total_calls / elapsed:>8.1f} tool calls/s")
+    print()
+
+
+if __name__ == "__main__":
+    main()
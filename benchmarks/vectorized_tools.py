@@ -0,0 +1,79 @@
+'''
+    Throughput of add_tool from 6.1_agents_and_tools.py: invoking the tool once per addition
+    versus its vectorized batch implementation (graph_utils/batch_tools.py).
+
+    - invoke:         add_tool.invoke({"a": a, "b": b}) for every pair (measured on --invoke-calls pairs)
+    - invoke_batch:   a list of argument dicts, turned into arrays and added in one NumPy call
+    - invoke_columns: the arguments are already arrays
+    - registry:       tool calls answered by ToolRegistry, which coalesces them into batches
+                      (measured on --registry-calls calls, every call still gets its own ToolMessage)
+
+    Run from the repository root:
+    -> python -m benchmarks.vectorized_tools --additions 1000000
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from benchmarks.examples import load_example
+from graph_utils import batch_tools
+from graph_utils.tool_node import ToolRegistry
+
+
+def report(label, calls, elapsed, additions):
+    rate = calls / elapsed
+    print(f"{label:<15} {calls:>10} calls {elapsed:>8.3f} s {rate:>14,.0f} additions/s "
+          f"-> {additions / rate:>8.2f} s for {additions:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--additions", type=int, default=1_000_000)
+    parser.add_argument("--invoke-calls", type=int, default=20_000)
+    parser.add_argument("--registry-calls", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        example = load_example("6.1_agents_and_tools.py")
+    add_tool = example.add_tool
+
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 1000, args.additions)
+    b = rng.integers(0, 1000, args.additions)
+    pairs = [{"a": x, "b": y} for x, y in zip(a.tolist(), b.tolist())]
+    expected = (a + b).tolist()
+    print()
+
+    count = min(args.invoke_calls, args.additions)
+    start = time.perf_counter()
+    results = [add_tool.invoke(pair) for pair in pairs[:count]]
+    report("invoke", count, time.perf_counter() - start, args.additions)
+    assert results == expected[:count]
+
+    start = time.perf_counter()
+    results = batch_tools.invoke_batch(add_tool, pairs)
+    report("invoke_batch", args.additions, time.perf_counter() - start, args.additions)
+    assert results == expected
+
+    start = time.perf_counter()
+    results = batch_tools.invoke_columns(add_tool, a=a, b=b)
+    report("invoke_columns", args.additions, time.perf_counter() - start, args.additions)
+    assert results.tolist() == expected
+
+    count = min(args.registry_calls, args.additions)
+    registry = ToolRegistry([add_tool])
+    tool_calls = [{"name": "add_tool", "args": pair, "id": f"call_{index}"} for index, pair in enumerate(pairs[:count])]
+    start = time.perf_counter()
+    messages = registry.run(tool_calls)
+    report("registry", count, time.perf_counter() - start, args.additions)
+    assert [int(message.content) for message in messages] == expected[:count]
+    print(f"{'':<15} {registry.coalescer.calls} calls coalesced into {registry.coalescer.batches} NumPy call(s)\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+'''
+    Admission control for the Chainlit apps.
+
+    Every message starts LLM calls, API calls and graph runs. Without a limit a traffic spike starts all of them
+    at once, the providers throttle and everybody waits. The controller lets only max_concurrent requests run:
+
+        admission = AdmissionController(max_concurrent=8, max_wait=10)
+
+        try:
+            async with admission.slot(INTERACTIVE):
+                ...   # the graph run
+        except Busy as e:
+            await cl.Message(f"I'm busy, try again in {e.retry_after:.0f} s").send()
+
+    - The others wait in a priority queue: INTERACTIVE messages are admitted before BACKGROUND work,
+      first come first served within a priority
+    - The wait is estimated from the queue position and the recent run times. If it would be longer
+      than max_wait (the SLO), the request is refused at once with Busy instead of queueing. A request that
+      still ends up waiting longer than max_wait is refused as well
+    - stats() gives running and queued requests, admitted / refused counts and queue wait percentiles
+'''
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class Busy(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too busy, estimated wait {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=8, max_wait=10.0, initial_run_seconds=5.0, history=1000):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.running = 0
+        # (priority, arrival number, future) of the waiting requests
+        self._queue = []
+        # Waiting requests in the queue (it can also hold cancelled entries until they are popped)
+        self.waiting = 0
+        self._arrivals = itertools.count()
+        # Moving average of how long an admitted request runs, used for the wait estimate
+        self.run_seconds = initial_run_seconds
+        self._waits = deque(maxlen=history)
+        self.counts = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    def estimated_wait(self, priority=INTERACTIVE):
+        if self.running < self.max_concurrent and not self.waiting:
+            return 0.0
+        ahead = sum(1 for queued_priority, _, future in self._queue if queued_priority <= priority and not future.done())
+        # Every max_concurrent finished runs free one place in the queue
+        return (ahead // self.max_concurrent + 1) * self.run_seconds
+
+    async def _admit(self, priority):
+        if self.running < self.max_concurrent and not self.waiting:
+            self.running += 1
+            return 0.0
+
+        estimate = self.estimated_wait(priority)
+        if estimate > self.max_wait:
+            self.counts["rejected"] += 1
+            raise Busy(estimate)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._arrivals), future)
+        heapq.heappush(self._queue, entry)
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            # The place is handed over by _release(), which also counts it as running
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.counts["timed_out"] += 1
+            self._abandon(future)
+            raise Busy(self.estimated_wait(priority)) from None
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        return time.monotonic() - start
+
+    # A waiter that leaves: if it was just given a place, the place goes to the next one
+    def _abandon(self, future):
+        if future.done() and not future.cancelled():
+            self._release()
+        else:
+            future.cancel()
+            self.waiting -= 1
+
+    def _release(self):
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=INTERACTIVE):
+        wait = await self._admit(priority)
+        self.counts["admitted"] += 1
+        self._waits.append(wait)
+        start = time.monotonic()
+        try:
+            yield wait
+        finally:
+            self.run_seconds = 0.8 * self.run_seconds + 0.2 * (time.monotonic() - start)
+            self._release()
+
+    def stats(self):
+        waits = list(self._waits)
+        return {
+            "running": self.running,
+            "queued": self.waiting,
+            **self.counts,
+            "wait_p50": _percentile(waits, 50),
+            "wait_p95": _percentile(waits, 95),
+            "run_seconds": self.run_seconds,
+        }
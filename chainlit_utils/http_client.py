@@ -0,0 +1,108 @@
+'''
+    Async HTTP client for the Chainlit agents.
+
+    A blocking requests.get() inside an async node stops the whole event loop, so every connected user
+    waits for it. This client is async and shared by all the sessions:
+    - one pooled httpx.AsyncClient (keep-alive connections, connection limits and timeouts)
+    - JSON responses are cached for ttl seconds (or the max-age the server sends)
+    - a stale entry with an ETag / Last-Modified is revalidated: a 304 answer reuses the cached data
+    - concurrent fetches of the same URL share one request (single_flight.py). The request is finished
+      even if all the waiters leave, so its answer still lands in the cache
+
+        api = HttpClient("https://jsonplaceholder.typicode.com", timeout=5, ttl=300)
+        user = await api.get_json("/users/1")
+
+    The base URL can point to the local stand-in server (chainlit_utils/stub_api.py) for testing.
+'''
+
+import asyncio
+import re
+import time
+
+import httpx
+
+from chainlit_utils.single_flight import SingleFlight
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class _Entry:
+    __slots__ = ("data", "expires", "etag", "last_modified")
+
+    def __init__(self, data, expires, etag, last_modified):
+        self.data = data
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class HttpClient:
+    def __init__(self, base_url="", timeout=10.0, ttl=60.0, max_connections=100, max_entries=1024):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._client = None
+        self._loop = None
+        # URL -> _Entry
+        self._cache = {}
+        # Requests in flight, keyed by URL
+        self.flights = SingleFlight(cancel_orphans=False)
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "requests": 0}
+
+    # Created on first use, so the client belongs to the event loop of the app (a new loop gets a new client)
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+        return self._client
+
+    async def get_json(self, url, ttl=None):
+        entry = self._cache.get(url)
+        if entry is not None and entry.expires > time.monotonic():
+            self.stats["hits"] += 1
+            return entry.data
+
+        self.stats["misses"] += 1
+        return await self.flights.do(url, lambda: self._fetch(url, entry, self.ttl if ttl is None else ttl))
+
+    async def _fetch(self, url, entry, ttl):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        self.stats["requests"] += 1
+        response = await self.client.get(url, headers=headers)
+        max_age = _MAX_AGE.search(response.headers.get("cache-control", ""))
+        expires = time.monotonic() + (int(max_age.group(1)) if max_age else ttl)
+
+        if response.status_code == 304 and entry is not None:
+            self.stats["revalidated"] += 1
+            entry.expires = expires
+            return entry.data
+
+        response.raise_for_status()
+        data = response.json()
+        if "no-store" not in response.headers.get("cache-control", ""):
+            if len(self._cache) >= self.max_entries and url not in self._cache:
+                # Drops the entry that expires first
+                del self._cache[min(self._cache, key=lambda key: self._cache[key].expires)]
+            self._cache[url] = _Entry(data, expires, response.headers.get("etag"), response.headers.get("last-modified"))
+        return data
+
+    def invalidate(self, url=None):
+        if url is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(url, None)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
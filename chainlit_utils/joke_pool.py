@@ -0,0 +1,237 @@
+'''
+    Pool of pre-generated jokes for popular topics.
+
+    A few topics make up most of the traffic. The pool counts how often each topic is asked for, and a background
+    warmer generates good jokes for the hot topics while the app has spare capacity. A message about a hot
+    topic is then answered from the pool at once, without an LLM call:
+
+        pool = JokePool(FunnySchema, db_path="database/joke_pool.db")
+        warmer = PoolWarmer(pool, generate_joke, admission)
+
+        res = pool.take(message.content)   # a pooled FunnySchema, or None -> generate it live
+        warmer.start()                     # once the event loop runs, ie. in on_chat_start
+
+    - The jokes are stored in the joke_pool table of their own SQLite file (as the schema's JSON). Not in the
+      jokes database: example 6 shows the model every table of it when it asks for the INSERT query
+    - Only jokes rated at least min_rating are kept, the warmer tries a few times per topic
+    - Freshness and reuse limits: a joke is served at most max_serves times and only within max_age_seconds
+      after it was made. Spent and expired jokes are pruned
+    - Popularity decays (half_life_seconds), a topic is hot after min_requests recent requests.
+      The hot_topics most popular ones get target_size unused jokes each
+    - The warmer only works when the admission controller has free places (reserve of them are kept for users)
+      and its calls are BACKGROUND priority, so users are never queued behind it
+    - Counters in pool.stats and warmer.stats
+'''
+
+import asyncio
+import sqlite3
+import time
+
+from chainlit_utils.admission import BACKGROUND, Busy
+from chainlit_utils.metrics import DB_QUERY_SECONDS
+
+
+# Query latencies for /metrics
+_TAKE_SECONDS = DB_QUERY_SECONDS.labels("joke_pool_take")
+_ADD_SECONDS = DB_QUERY_SECONDS.labels("joke_pool_add")
+_COUNT_SECONDS = DB_QUERY_SECONDS.labels("joke_pool_available")
+_PRUNE_SECONDS = DB_QUERY_SECONDS.labels("joke_pool_prune")
+
+
+# Case and whitespace don't make a different topic
+def topic_key(topic):
+    return " ".join(str(topic).split()).casefold()
+
+
+class JokePool:
+    def __init__(self, schema, db_path="database/joke_pool.db", min_rating=7, max_serves=1, max_age_seconds=6 * 3600,
+                 target_size=3, hot_topics=10, min_requests=2, half_life_seconds=3600):
+        self.schema = schema
+        self.min_rating = min_rating
+        self.max_serves = max_serves
+        self.max_age_seconds = max_age_seconds
+        self.target_size = target_size
+        self.hot_topics = hot_topics
+        self.min_requests = min_requests
+        self.half_life_seconds = half_life_seconds
+        # topic key -> [decayed request count, time of the last request, topic as the user wrote it]
+        self.popularity = {}
+        self.stats = {"hits": 0, "misses": 0, "added": 0, "too_low": 0, "pruned": 0}
+
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS joke_pool (
+                id INTEGER PRIMARY KEY,
+                topic_key TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                served INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS joke_pool_topic ON joke_pool (topic_key, created_at)")
+        self.prune()
+
+    def _score(self, entry, now):
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life_seconds)
+
+    def record(self, topic):
+        now = time.time()
+        key = topic_key(topic)
+        entry = self.popularity.get(key)
+        if entry is None:
+            self.popularity[key] = [1.0, now, topic.strip()]
+        else:
+            entry[0] = self._score(entry, now) + 1
+            entry[1] = now
+
+    # The most popular topics right now, [(topic, score)] best first
+    def hot(self):
+        now = time.time()
+        scored = [(entry[2], self._score(entry, now)) for entry in self.popularity.values()]
+        scored = [(topic, score) for topic, score in scored if score >= self.min_requests]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        # Forget topics nobody has asked about in a long time
+        if len(self.popularity) > 100 * self.hot_topics:
+            self.popularity = {key: entry for key, entry in self.popularity.items()
+                               if self._score(entry, now) >= 0.1}
+        return scored[:self.hot_topics]
+
+    # Fresh jokes not served max_serves times yet
+    def available(self, topic):
+        with _COUNT_SECONDS.time():
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM joke_pool WHERE topic_key = ? AND served < ? AND created_at > ?",
+                (topic_key(topic), self.max_serves, time.time() - self.max_age_seconds),
+            ).fetchone()[0]
+
+    # Counts the request and returns a pooled joke (a schema object) or None
+    def take(self, topic):
+        self.record(topic)
+        with _TAKE_SECONDS.time():
+            answer = self._take(topic_key(topic))
+        if answer is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return self.schema.parse_raw(answer)
+
+    def _take(self, key):
+        cutoff = time.time() - self.max_age_seconds
+        # Least served first, then the oldest: it would expire first
+        for row_id, answer in self.conn.execute(
+            """
+            SELECT id, answer FROM joke_pool
+            WHERE topic_key = ? AND served < ? AND created_at > ?
+            ORDER BY served, created_at LIMIT 5
+            """,
+            (key, self.max_serves, cutoff),
+        ).fetchall():
+            # The condition on served keeps other processes using the same database from taking it too
+            updated = self.conn.execute(
+                "UPDATE joke_pool SET served = served + 1 WHERE id = ? AND served < ?", (row_id, self.max_serves)
+            ).rowcount
+            if updated:
+                return answer
+        return None
+
+    # Stores a generated joke if it is good enough. Returns True when it was added
+    def add(self, topic, answer):
+        if answer is None or getattr(answer, "rating", 0) < self.min_rating:
+            self.stats["too_low"] += 1
+            return False
+        with _ADD_SECONDS.time():
+            self.conn.execute(
+                "INSERT INTO joke_pool (topic_key, answer, rating, created_at) VALUES (?, ?, ?, ?)",
+                (topic_key(topic), answer.json(), answer.rating, time.time()),
+            )
+        self.stats["added"] += 1
+        return True
+
+    # Removes spent and expired jokes
+    def prune(self):
+        with _PRUNE_SECONDS.time():
+            removed = self.conn.execute(
+                "DELETE FROM joke_pool WHERE served >= ? OR created_at <= ?",
+                (self.max_serves, time.time() - self.max_age_seconds),
+            ).rowcount
+        self.stats["pruned"] += removed
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+class PoolWarmer:
+    # generate: async function(topic) returning a schema object (the same call the message handler makes)
+    def __init__(self, pool, generate, admission=None, interval=5.0, reserve=2, attempts=3, workers=4):
+        self.pool = pool
+        self.generate = generate
+        self.admission = admission
+        self.interval = interval
+        self.reserve = reserve
+        # LLM calls per missing joke at most, to cover answers that are rated too low
+        self.attempts = attempts
+        # Background LLM calls at most at once
+        self.workers = workers
+        self.task = None
+        self.stats = {"rounds": 0, "calls": 0, "errors": 0, "skipped_busy": 0}
+
+    # Starts the background task on the running event loop, if it isn't running yet
+    def start(self):
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def idle(self):
+        admission = self.admission
+        return admission is None or (not admission.waiting
+                                     and admission.running + self.reserve < admission.max_concurrent)
+
+    async def run(self):
+        while True:
+            await self.warm()
+            await asyncio.sleep(self.interval)
+
+    # One round: fills the pool of every hot topic up to target_size, as long as there is spare capacity.
+    # Every missing joke is a job, a few workers share the jobs and stop when the app gets busy
+    async def warm(self):
+        self.stats["rounds"] += 1
+        self.pool.prune()
+        jobs = iter([topic for topic, _ in self.pool.hot()
+                     for _ in range(self.pool.target_size - self.pool.available(topic))])
+        await asyncio.gather(*(self._worker(jobs) for _ in range(self.workers)))
+
+    async def _worker(self, jobs):
+        for topic in jobs:
+            for _ in range(self.attempts):
+                if not self.idle():
+                    self.stats["skipped_busy"] += 1
+                    return
+                try:
+                    if self.admission is None:
+                        answer = await self._call(topic)
+                    else:
+                        async with self.admission.slot(BACKGROUND):
+                            answer = await self._call(topic)
+                except Busy:
+                    self.stats["skipped_busy"] += 1
+                    return
+                except Exception:
+                    # A failing topic doesn't stop the others, the next round tries again
+                    self.stats["errors"] += 1
+                    break
+                if self.pool.add(topic, answer):
+                    break
+
+    async def _call(self, topic):
+        self.stats["calls"] += 1
+        return await self.generate(topic)
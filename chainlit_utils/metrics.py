@@ -0,0 +1,400 @@
+'''
+    Prometheus style metrics for the Chainlit apps.
+
+    Counters, gauges and histograms are kept in memory and served in the Prometheus text format
+    on the /metrics route of the Chainlit server:
+
+        metrics.add_route()                       # GET /metrics on the Chainlit (FastAPI) app
+        metrics.watch_admission(admission)        # stats of the other helpers are read at scrape time
+
+        @cl.on_message
+        @metrics.timed("on_message")
+        async def main(message): ...
+
+        await graph.ainvoke(state, config={**models.model_config(key), "callbacks": [metrics.llm_callback]})
+
+    Recording is cheap: a counter is one addition, a histogram a bisect and three additions, no locks.
+    The counters of admission control, single-flight, the HTTP client, the joke pool and the memo caches are
+    not recorded on the hot path at all, they are read from their stats when /metrics is scraped.
+
+    Metrics (the labels in braces):
+
+    chainlit_handler_seconds{handler}           histogram  Time spent in a Chainlit handler (metrics.timed)
+    chainlit_handler_errors_total{handler}      counter    Handler calls that raised
+    chainlit_sessions_active                    gauge      Chat sessions open now (on_chat_start - on_chat_end)
+    chainlit_first_output_seconds{handler}      histogram  Time to the first graph output shown (chainlit_utils/progress.py)
+    chainlit_first_token_seconds{handler}       histogram  Time to the first streamed token of the answer
+    graph_node_seconds{node}                    histogram  Run time of a LangGraph node (llm_callback)
+    llm_calls_total{provider}                   counter    Chat model calls (llm_callback)
+    llm_errors_total{provider}                  counter    Chat model calls that failed
+    llm_call_seconds{provider}                  histogram  Chat model call latency
+    llm_tokens_total{provider,kind}             counter    Tokens used, kind is input or output
+    db_query_seconds{query}                     histogram  SQLite query latency (the joke pool queries)
+    cache_hits_total{cache}                     counter    Cache hits: http:<name>, joke_pool or memo:<function>
+    cache_misses_total{cache}                   counter    Cache misses
+    cache_hit_ratio{cache}                      gauge      hits / (hits + misses)
+    single_flight_calls_total{flight,result}    counter    result is leader, coalesced or cancelled
+    single_flight_in_flight{flight}             gauge      Shared calls running now
+    admission_running                           gauge      Requests running now
+    admission_queued                            gauge      Requests waiting for a place
+    admission_requests_total{result}            counter    result is admitted, rejected or timed_out
+    admission_wait_seconds{quantile}            gauge      Queue wait of the recent requests, quantile 0.5 and 0.95
+    admission_run_seconds                       gauge      Moving average of the run time (for the wait estimate)
+    http_client_requests_total{client}          counter    Requests sent (misses and revalidations)
+    http_client_revalidated_total{client}       counter    Cached responses confirmed with 304 Not Modified
+    joke_pool_jokes_total{event}                counter    event is added, too_low or pruned
+    joke_pool_warmer_calls_total{result}        counter    Background LLM calls, result is ok or error
+'''
+
+import bisect
+import functools
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cached answer to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One count per bucket and one for +Inf. Cumulated only when exposed
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class Metric:
+    def __init__(self, kind, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> _Value or _Buckets
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            child = _Buckets(self.buckets) if self.kind == "histogram" else _Value()
+            self._children[values] = child
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = _labels_text(self.label_names, values)
+            if self.kind != "histogram":
+                yield f"{self.name}{labels} {_number(child.value)}"
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                bucket_labels = _labels_text(self.label_names + ("le",), values + (_number(bound),))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{labels} {_number(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        # Functions called at scrape time, yielding (name, kind, help, {label: value}, value)
+        self.collectors = []
+
+    def _add(self, kind, name, help, labels, **kwargs):
+        if name in self.metrics:
+            return self.metrics[name]
+        metric = Metric(kind, name, help, labels, **kwargs)
+        self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add("counter", name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add("gauge", name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add("histogram", name, help, labels, buckets=buckets)
+
+    def collector(self, function):
+        self.collectors.append(function)
+        return function
+
+    # The Prometheus text format
+    def expose(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        # Several collectors can report the same metric (ie. the hit counts of different caches)
+        collected = {}
+        for collector in self.collectors:
+            for name, kind, help, labels, value in collector():
+                collected.setdefault(name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, samples) in collected.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels_text(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("chainlit_handler_seconds", "Time spent in a Chainlit handler", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter("chainlit_handler_errors_total", "Handler calls that raised", ["handler"])
+SESSIONS_ACTIVE = REGISTRY.gauge("chainlit_sessions_active", "Chat sessions open now")
+FIRST_OUTPUT_SECONDS = REGISTRY.histogram("chainlit_first_output_seconds", "Time to the first graph output shown", ["handler"])
+FIRST_TOKEN_SECONDS = REGISTRY.histogram("chainlit_first_token_seconds", "Time to the first streamed token", ["handler"])
+NODE_SECONDS = REGISTRY.histogram("graph_node_seconds", "Run time of a LangGraph node", ["node"])
+LLM_CALLS = REGISTRY.counter("llm_calls_total", "Chat model calls", ["provider"])
+LLM_ERRORS = REGISTRY.counter("llm_errors_total", "Chat model calls that failed", ["provider"])
+LLM_SECONDS = REGISTRY.histogram("llm_call_seconds", "Chat model call latency", ["provider"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens used by chat model calls", ["provider", "kind"])
+DB_QUERY_SECONDS = REGISTRY.histogram("db_query_seconds", "SQLite query latency", ["query"], buckets=DB_BUCKETS)
+
+
+# Times an async handler and counts its errors
+def timed(handler):
+    seconds = HANDLER_SECONDS.labels(handler)
+    errors = HANDLER_ERRORS.labels(handler)
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# Time to the first output and first token of a ProgressMessage (chainlit_utils/progress.py)
+def observe_progress(handler, progress):
+    if progress.first_output is not None:
+        FIRST_OUTPUT_SECONDS.labels(handler).observe(progress.first_output)
+    if progress.first_token is not None:
+        FIRST_TOKEN_SECONDS.labels(handler).observe(progress.first_token)
+
+
+class MetricsCallback(BaseCallbackHandler):
+    '''
+        LLM calls, tokens and errors per provider, and the run time of the graph nodes.
+        Give it in the config of a graph or a model call: config={"callbacks": [metrics.llm_callback]}
+    '''
+
+    # Called in the caller's thread / event loop, not moved to a thread pool
+    run_inline = True
+
+    def __init__(self):
+        # run id -> (start time, provider or node histogram)
+        self._llm_runs = {}
+        self._node_runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        provider = (metadata or {}).get("ls_provider", "unknown")
+        self._llm_runs[run_id] = (time.perf_counter(), provider)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, provider = self._llm_runs.pop(run_id, (None, "unknown"))
+        LLM_CALLS.labels(provider).inc()
+        if start is not None:
+            LLM_SECONDS.labels(provider).observe(time.perf_counter() - start)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels(provider, "input").inc(usage.get("input_tokens", 0))
+                    LLM_TOKENS.labels(provider, "output").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        _, provider = self._llm_runs.pop(run_id, (None, "unknown"))
+        LLM_CALLS.labels(provider).inc()
+        LLM_ERRORS.labels(provider).inc()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, name=None, **kwargs):
+        # LangGraph tags the runnables of a node with its name, only the node itself is timed (not __start__)
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and node == name and not node.startswith("__"):
+            self._node_runs[run_id] = (time.perf_counter(), NODE_SECONDS.labels(node))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        run = self._node_runs.pop(run_id, None)
+        if run is not None:
+            run[1].observe(time.perf_counter() - run[0])
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+
+llm_callback = MetricsCallback()
+
+
+def _cache_samples(cache, hits, misses):
+    labels = {"cache": cache}
+    yield "cache_hits_total", "counter", "Cache hits", labels, hits
+    yield "cache_misses_total", "counter", "Cache misses", labels, misses
+    yield "cache_hit_ratio", "gauge", "Cache hits / lookups", labels, hits / (hits + misses) if hits + misses else 0.0
+
+
+def watch_admission(admission, registry=REGISTRY):
+    @registry.collector
+    def collect():
+        stats = admission.stats()
+        yield "admission_running", "gauge", "Requests running now", {}, stats["running"]
+        yield "admission_queued", "gauge", "Requests waiting for a place", {}, stats["queued"]
+        for result in ("admitted", "rejected", "timed_out"):
+            yield "admission_requests_total", "counter", "Admission decisions", {"result": result}, stats[result]
+        for quantile, key in (("0.5", "wait_p50"), ("0.95", "wait_p95")):
+            yield ("admission_wait_seconds", "gauge", "Queue wait of the recent requests",
+                   {"quantile": quantile}, stats[key])
+        yield "admission_run_seconds", "gauge", "Moving average of the run time", {}, stats["run_seconds"]
+
+
+def watch_flights(flights, name, registry=REGISTRY):
+    @registry.collector
+    def collect():
+        for result in ("leaders", "coalesced", "cancelled"):
+            yield ("single_flight_calls_total", "counter", "Single-flight calls",
+                   {"flight": name, "result": result.rstrip("s")}, flights.stats[result])
+        yield "single_flight_in_flight", "gauge", "Shared calls running now", {"flight": name}, flights.in_flight()
+
+
+def watch_http(client, name, registry=REGISTRY):
+    @registry.collector
+    def collect():
+        stats = client.stats
+        yield from _cache_samples(f"http:{name}", stats["hits"], stats["misses"])
+        yield "http_client_requests_total", "counter", "HTTP requests sent", {"client": name}, stats["requests"]
+        yield ("http_client_revalidated_total", "counter", "Cached responses confirmed with 304",
+               {"client": name}, stats["revalidated"])
+
+
+def watch_pool(pool, warmer=None, registry=REGISTRY):
+    @registry.collector
+    def collect():
+        yield from _cache_samples("joke_pool", pool.stats["hits"], pool.stats["misses"])
+        for event in ("added", "too_low", "pruned"):
+            yield "joke_pool_jokes_total", "counter", "Pooled jokes", {"event": event}, pool.stats[event]
+        if warmer is not None:
+            errors = warmer.stats["errors"]
+            for result, value in (("ok", warmer.stats["calls"] - errors), ("error", errors)):
+                yield ("joke_pool_warmer_calls_total", "counter", "Background LLM calls",
+                       {"result": result}, value)
+
+
+def watch_memo(registry=REGISTRY):
+    from graph_utils import memo
+
+    @registry.collector
+    def collect():
+        for function, stats in memo.stats().items():
+            yield from _cache_samples(f"memo:{function}", stats["hits"], stats["misses"])
+
+
+# Adds GET /metrics to the Chainlit server (a FastAPI app). Returns False when there is no server to add it to
+def add_route(app=None, path="/metrics", registry=REGISTRY):
+    if app is None:
+        try:
+            from chainlit.server import app
+        except ImportError:
+            return False
+    from fastapi.responses import PlainTextResponse
+
+    @app.get(path, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.expose(), media_type=CONTENT_TYPE)
+
+    # Chainlit serves its UI from a catch-all route, the new route has to come before it
+    app.router.routes.insert(0, app.router.routes.pop())
+    return True
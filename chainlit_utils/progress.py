@@ -0,0 +1,127 @@
+'''
+    One Chainlit message per answer, updated in place while the graph runs.
+
+        progress = ProgressMessage("Looking for a joke...")
+        await progress.send()
+        await progress.status("Writing a joke for Leanne Graham...")   # a node has finished
+        await progress.tool_chunk(args)      # tool call argument tokens of the structured output
+        await progress.finish(res["generated_joke"])
+
+    - The tool call arguments arrive as pieces of JSON. The `field` (the joke) is shown as it grows: once
+      its key has arrived, only the new characters of its string value are decoded and sent (stream_token).
+      Nothing is parsed twice, the work per piece doesn't grow with the length of the joke. After the
+      field's closing quote the rest of the arguments are ignored
+    - A status can't replace text that is already streaming, it is ignored after the first token
+    - status() and finish() send the whole message (update), tokens are the cheap streamed frames
+    - Seconds from the start: first_output (the first graph output shown, a status, token or the answer),
+      first_token and done. The Chainlit apps observe them in chainlit_utils/metrics.py
+'''
+
+import re
+import time
+
+import chainlit as cl
+
+
+_SPECIAL = re.compile(r'["\\]')
+_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+# Decodes the characters of a JSON string from position on. Returns the text, the position to continue
+# from and True when the closing quote was reached. Stops before an escape that hasn't fully arrived
+def _decode_string(text, position):
+    pieces = []
+    while position < len(text):
+        special = _SPECIAL.search(text, position)
+        if special is None:
+            pieces.append(text[position:])
+            position = len(text)
+            break
+        pieces.append(text[position:special.start()])
+        position = special.start()
+        if text[position] == '"':
+            return "".join(pieces), position + 1, True
+        if position + 1 >= len(text):
+            break
+        code = text[position + 1]
+        if code != "u":
+            pieces.append(_ESCAPES.get(code, code))
+            position += 2
+            continue
+        if position + 6 > len(text):
+            break
+        value = int(text[position + 2:position + 6], 16)
+        # An emoji is a surrogate pair, two escapes
+        if 0xD800 <= value < 0xDC00:
+            if position + 12 > len(text):
+                break
+            value = 0x10000 + ((value - 0xD800) << 10) + (int(text[position + 8:position + 12], 16) - 0xDC00)
+            position += 6
+        pieces.append(chr(value))
+        position += 6
+    return "".join(pieces), position, False
+
+
+class ProgressMessage:
+    def __init__(self, text, field="joke"):
+        self.message = cl.Message(content=text)
+        self.field = field
+        self.start = time.perf_counter()
+        self.first_output = None
+        self.first_token = None
+        self.done = None
+        # Arguments not decoded yet
+        self._arguments = ""
+        self._start = re.compile(rf'"{re.escape(field)}"\s*:\s*"')
+        # True once the field's string value has started, the arguments are then its characters
+        self._started = False
+        # Set when the field's value is complete, the rest of the arguments are ignored
+        self._complete = False
+        # Text of the field on the screen
+        self._shown = ""
+
+    def _elapsed(self):
+        elapsed = time.perf_counter() - self.start
+        if self.first_output is None:
+            self.first_output = elapsed
+        return elapsed
+
+    async def send(self):
+        await self.message.send()
+
+    async def status(self, text):
+        if self._shown:
+            return
+        self._elapsed()
+        self.message.content = text
+        await self.message.update()
+
+    async def tool_chunk(self, arguments):
+        if not arguments or self._complete:
+            return
+        self._arguments += arguments
+        if not self._started:
+            start = self._start.search(self._arguments)
+            if start is None:
+                # Only the end can still become the key, the rest is the other fields
+                self._arguments = self._arguments[-(len(self.field) + 16):]
+                return
+            self._started = True
+            self._arguments = self._arguments[start.end():]
+        text, position, self._complete = _decode_string(self._arguments, 0)
+        self._arguments = self._arguments[position:]
+        if not text:
+            return
+        elapsed = self._elapsed()
+        if self.first_token is None:
+            self.first_token = elapsed
+            # The first token replaces the status
+            await self.message.stream_token(text, is_sequence=True)
+        else:
+            await self.message.stream_token(text)
+        self._shown += text
+
+    async def finish(self, text):
+        self.done = self._elapsed()
+        self.message.content = text
+        await self.message.update()
@@ -0,0 +1,76 @@
+'''
+    Single-flight: concurrent identical requests share one execution.
+
+    When many users ask for a joke about the same topic at the same moment, only the first request
+    calls the model. The others wait for that call and get the same result:
+
+        flights = SingleFlight()
+        key = make_key(prompt, "openai:gpt-4o-mini", FunnySchema)
+        res = await flights.do(key, lambda: structured_llm.ainvoke(prompt))
+
+    - The key is normalized: case and whitespace in the prompt don't matter
+    - Waiters can leave (the user disconnects, the Chainlit task is cancelled) without stopping the call
+      for the others. When the last waiter leaves, the call is cancelled too (cancel_orphans=True)
+    - Only calls in flight are shared, nothing is cached after the call has finished
+    - Everyone gets the same result object, so it must not be modified
+    - Counters in flights.stats: calls, leaders (real executions), coalesced, cancelled
+'''
+
+import asyncio
+
+
+def make_key(prompt, model=None, schema=None):
+    text = " ".join(str(prompt).split()).casefold()
+    schema_name = f"{schema.__module__}.{schema.__qualname__}" if isinstance(schema, type) else schema
+    return (text, model, schema_name)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, cancel_orphans=True):
+        self.cancel_orphans = cancel_orphans
+        # key -> _Flight in progress
+        self._flights = {}
+        self.stats = {"calls": 0, "leaders": 0, "coalesced": 0, "cancelled": 0}
+
+    def in_flight(self):
+        return len(self._flights)
+
+    async def do(self, key, function):
+        self.stats["calls"] += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.stats["leaders"] += 1
+            flight = _Flight(asyncio.ensure_future(function()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._done(key, flight))
+        else:
+            self.stats["coalesced"] += 1
+
+        flight.waiters += 1
+        try:
+            # shield: a waiter that is cancelled doesn't cancel the shared call
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and self.cancel_orphans and not flight.task.done():
+                self.stats["cancelled"] += 1
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _done(self, key, flight):
+        self._forget(key, flight)
+        # Marks the error as seen, the waiters (if any are left) get it from await
+        if not flight.task.cancelled():
+            flight.task.exception()
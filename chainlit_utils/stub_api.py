@@ -0,0 +1,118 @@
+'''
+    Local stand-in for the JSON API used by 8_chainlit_api_agent.py (jsonplaceholder.typicode.com).
+
+    Serves /users and /users/<id> with the same shape of data, an ETag on every response (a matching
+    If-None-Match gets 304 Not Modified) and an optional artificial latency. Counts the requests it gets,
+    so tests and benchmarks can check how many really reached the server.
+
+    Run from the repository root and point the example at it:
+    -> python -m chainlit_utils.stub_api --port 8765 --latency 0.2
+    -> JOKE_API_URL=http://127.0.0.1:8765 chainlit run 8_chainlit_api_agent.py
+
+    Or in-process: server = start_in_thread(latency=0.2); server.url; server.requests; server.shutdown()
+'''
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_user(user_id):
+    return {
+        "id": user_id,
+        "name": f"Test User {user_id}",
+        "username": f"user{user_id}",
+        "email": f"user{user_id}@example.com",
+        "address": {"street": "Test Street", "suite": f"Apt. {user_id}", "city": "Testville", "zipcode": "00000"},
+        "phone": "000-000-0000",
+        "website": "example.com",
+        "company": {"name": "Test Company", "catchPhrase": "Stand-in data", "bs": "offline testing"},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        match = re.fullmatch(r"/users(?:/(\d+))?/?", self.path.split("?")[0])
+        if match is None or (match.group(1) and not 1 <= int(match.group(1)) <= server.users):
+            self._send(404, b'{"error": "not found"}')
+            return
+        if match.group(1):
+            data = make_user(int(match.group(1)))
+        else:
+            data = [make_user(user_id) for user_id in range(1, server.users + 1)]
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            with server.lock:
+                server.not_modified += 1
+            self._send(304, b"", etag)
+        else:
+            self._send(200, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Keeps the console quiet
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, users=10):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.users = users
+        self.requests = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+# Port 0 picks a free port, see server.url
+def start_in_thread(port=0, latency=0.0, users=10):
+    server = StubServer(port=port, latency=latency, users=users)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--users", type=int, default=10)
+    args = parser.parse_args()
+
+    server = StubServer(port=args.port, latency=args.latency, users=args.users)
+    print(f"Stand-in API at {server.url} (/users, /users/<1-{args.users}>)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
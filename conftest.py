@@ -0,0 +1 @@
+# pytest puts this directory on sys.path, so the tests import llm_utils, graph_utils, ... like the examples do
@@ -1,17 +1,17 @@
 import sqlite3
-import os
 
 
-def initialize_database(db_path):
+def initialize_database(db_path, print_jokes=True):
     print("Initializing the database...")
-    # Check if the database file already exists
-    db_exists = os.path.exists(db_path)
-
     # Connect to the database
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
-    if not db_exists:
+    # Check if the jokes table already exists
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='jokes'")
+    table_exists = c.fetchone() is not None
+
+    if not table_exists:
         print("Creating the jokes table...")
         # Create a table
         c.execute(
@@ -85,13 +85,14 @@ def initialize_database(db_path):
         # Commit the transaction
         conn.commit()
 
-    # Fetch and print all rows from the jokes table
-    c.execute("SELECT * FROM jokes")
-    rows = c.fetchall()
+    # Fetch and print all rows from the jokes table (not for the batch jobs, the table can be big)
+    if print_jokes:
+        c.execute("SELECT * FROM jokes")
+        rows = c.fetchall()
 
-    print("Jokes in the database:")
-    for row in rows:
-        print(f"Topic: {row[0]}, Joke: {row[1]}, Rating: {row[2]}")
+        print("Jokes in the database:")
+        for row in rows:
+            print(f"Topic: {row[0]}, Joke: {row[1]}, Rating: {row[2]}")
 
     # Close the connection
     conn.close()
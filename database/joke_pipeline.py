@@ -0,0 +1,226 @@
+'''
+    The nightly joke job: 6_database_and_agents.py over a large number of topics, as a staged pipeline
+    (graph_utils/pipeline.py) instead of one graph run per topic.
+
+    - generate (asyncio workers): the joke as in the joke node, and for a joke rated over the threshold the
+      INSERT query as in the database_query node. The model's tool call arguments are passed on unparsed
+    - check (shard processes, routed by the normalized joke): the arguments are parsed into FunnySchema and
+      QuerySchema, the joke is compared with the jokes seen before (the database's and this run's, same
+      text ignoring case, punctuation and spacing), and the query is run on an empty in-memory copy of the
+      jokes table. Only a single INSERT into jokes is allowed there. The row it inserted is what gets written,
+      the query itself is never run on the real database
+    - write (one process): the rows are inserted in batches with INSERT OR IGNORE
+
+    The joke improver loop of the graph is left out: a low rated joke is counted and skipped.
+
+    Input is a text file with one topic per line, or the JSONL of the batch runner ("joke_topic" of each line).
+    Run from the repository root:
+    -> python -m database.joke_pipeline topics.txt --model openai:gpt-4o-mini --shards 4 --workers 64
+'''
+
+import argparse
+import functools
+import json
+import re
+import sqlite3
+import sys
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field, ValidationError
+
+from database import init_db, sql
+from graph_utils.pipeline import Pipeline, SqliteWriter, print_report, shard_of
+from llm_utils import http_cassettes, models, structured_output
+
+
+# Same prompts and schemas as 6_database_and_agents.py (it runs its demo on import)
+FUNNY_LLM_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You are the funniest person in the world, a comedian, a joker. You make up jokes about every topic. Try to make unique jokes when asked.
+    Topic: {topic}
+    """
+)
+
+DATABASE_QUERY_LLM_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You are a seasoned database expert specializing in crafting optimized SQL-lite queries. Your task is to generate insert query, to insert new joke to database.
+
+    Topic: {topic}
+
+    Joke: {joke}
+
+    Rating: {rating}
+
+    Available Database Tables:
+    {tables}
+
+    Detailed Table Descriptions and Relationships:
+    {table_descriptions}
+
+    Consider the structure and relationships between the tables to ensure the query efficiently identifies and ranks jokes by their relevance to the topic.
+    **Important, no duplicate jokes in the database.**
+    """
+)
+
+
+@structured_output.register_schema
+class FunnySchema(BaseModel):
+    topic: str = Field(
+        description="The topic of the joke",
+    )
+    joke: str = Field(
+        description="The joke",
+    )
+    rating: int = Field(
+        description="The rating of the joke, from 1 to 10 (bigger is funnuer)",
+    )
+    rating_reason: str = Field(
+        description="Why the joke is rated this way",
+    )
+
+
+@structured_output.register_schema
+class QuerySchema(BaseModel):
+    query: str = Field(
+        description="The generated query to find the closest jokes to the given topic",
+    )
+
+
+JOKE_INSERT = "INSERT OR IGNORE INTO jokes (topic, joke, rating) VALUES (?, ?, ?)"
+
+# Jokes under this rating are not inserted, as in is_done() of the graph
+MIN_RATING = 5
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+# Two jokes are the same if they only differ in case, punctuation and spacing
+def joke_key(joke):
+    return " ".join(_NON_WORD.sub(" ", str(joke).lower()).split())
+
+
+def _tool_args(message):
+    return message.tool_calls[0]["args"] if message.tool_calls else {}
+
+
+async def generate(model, topic, tables, table_descriptions, min_rating=MIN_RATING):
+    message = await structured_output.bind_raw(model, FunnySchema).ainvoke(FUNNY_LLM_PROMPT.format(topic=topic))
+    record = {"topic": topic, "joke": _tool_args(message), "query": None}
+    rating = record["joke"].get("rating")
+    # No query for a joke that won't be inserted
+    if not isinstance(rating, int) or rating < min_rating:
+        return record
+    prompt = DATABASE_QUERY_LLM_PROMPT.format(topic=topic,
+                                              joke=record["joke"].get("joke"),
+                                              rating=rating,
+                                              tables=tables,
+                                              table_descriptions=table_descriptions)
+    message = await structured_output.bind_raw(model, QuerySchema).ainvoke(prompt)
+    record["query"] = _tool_args(message)
+    return record
+
+
+def route(record):
+    return joke_key(record["joke"].get("joke", ""))
+
+
+_ALLOWED = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_TRANSACTION}
+
+
+# The generated query may insert into and read from jokes (INSERT ... WHERE NOT EXISTS), nothing else
+def _authorize(action, arg1, arg2, database, trigger):
+    if action in (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_READ) and arg1 == "jokes":
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_OK if action in _ALLOWED else sqlite3.SQLITE_DENY
+
+
+class JokeChecks:
+    def __init__(self, shard, shards, db_path, min_rating=MIN_RATING):
+        self.min_rating = min_rating
+        conn = sqlite3.connect(db_path)
+        table = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='jokes'").fetchone()[0]
+        # Jokes already in the database, the ones routed to this shard
+        self.seen = set()
+        for (joke,) in conn.execute("SELECT joke FROM jokes"):
+            key = joke_key(joke)
+            if shard_of(key, shards) == shard:
+                self.seen.add(key)
+        conn.close()
+        # Empty copy of the table for trying the queries
+        self.scratch = sqlite3.connect(":memory:")
+        self.scratch.execute(table)
+        self.scratch.set_authorizer(_authorize)
+
+    # The row the query inserts into the empty table
+    def _inserted_row(self, query):
+        if not sqlite3.complete_statement(query):
+            raise ValueError("incomplete statement")
+        try:
+            if self.scratch.execute(query).rowcount != 1:
+                raise ValueError("not an insert of one row")
+            self.scratch.set_authorizer(None)
+            return self.scratch.execute("SELECT topic, joke, rating FROM jokes").fetchone()
+        finally:
+            self.scratch.rollback()
+            self.scratch.set_authorizer(_authorize)
+
+    def __call__(self, record):
+        try:
+            joke = FunnySchema.parse_obj(record["joke"])
+        except ValidationError:
+            return "invalid joke", None
+        if joke.rating < self.min_rating:
+            return "low rating", None
+        try:
+            row = self._inserted_row(QuerySchema.parse_obj(record["query"] or {}).query)
+        # sqlite3.Warning: more than one statement
+        except (ValidationError, ValueError, sqlite3.Error, sqlite3.Warning):
+            return "invalid query", None
+        key = joke_key(joke.joke)
+        if joke_key(row[1]) != key or not isinstance(row[2], int):
+            return "query does not match the joke", None
+        if key in self.seen:
+            return "duplicate", None
+        self.seen.add(key)
+        return "ok", row
+
+
+def read_topics(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)["joke_topic"] if path.endswith(".jsonl") else line
+
+
+def build(model, db_path="database/jokes.db", min_rating=MIN_RATING, **options):
+    init_db.initialize_database(db_path, print_jokes=False)
+    tables = sql.list_tables(db_path)
+    return Pipeline(functools.partial(generate, model,
+                                      tables=tables,
+                                      table_descriptions=sql.describe_table([tables], db_path),
+                                      min_rating=min_rating),
+                    route,
+                    functools.partial(JokeChecks, db_path=db_path, min_rating=min_rating),
+                    SqliteWriter(db_path, JOKE_INSERT),
+                    **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="Text file with one topic per line, or JSONL with joke_topic")
+    parser.add_argument("--model", default="openai", help="Model key for llm_utils.models, ie. openai:gpt-4o-mini")
+    parser.add_argument("--db", default="database/jokes.db")
+    parser.add_argument("--shards", type=int, help="Check processes, defaults to the number of cores. 0 = in the event loop")
+    parser.add_argument("--workers", type=int, default=32, help="Model calls in flight")
+    parser.add_argument("--min-rating", type=int, default=MIN_RATING)
+    parser.add_argument("--progress-every", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    http_cassettes.install_from_env()
+    pipeline = build(models.get_model(args.model), args.db, args.min_rating, shards=args.shards, workers=args.workers)
+    print_report(pipeline.run(read_topics(args.topics), args.progress_every), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
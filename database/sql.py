@@ -32,10 +32,10 @@ def run_query(query, db_path="database/jokes.db"):
 
 
 # List all the tables in the database
-def list_tables():
+def list_tables(db_path="database/jokes.db"):
     print("Listing tables...")
     # Connect to the database
-    conn = sqlite3.connect("database/jokes.db")
+    conn = sqlite3.connect(db_path)
     # Assuming you have already connected to the database
     cur = conn.cursor()
     query = """
@@ -50,9 +50,9 @@ def list_tables():
 
 
 # describe the tables in the database with their columns
-def describe_table(table_names: List[str]):
+def describe_table(table_names: List[str], db_path="database/jokes.db"):
     print("Describing tables...")
-    conn = sqlite3.connect("database/jokes.db")
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
     descriptions = {}
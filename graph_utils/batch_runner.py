@@ -0,0 +1,208 @@
+'''
+    Batch runner for the compiled graphs.
+
+    Runs a graph once for every initial state in a JSONL file, concurrently with asyncio:
+    - a fixed number of workers, so at most --workers runs (and their model calls) are in flight
+    - a failing item is written to the errors file and doesn't stop the others
+    - results and errors are appended to JSONL files as soon as each item finishes
+    - progress and throughput are printed to stderr while the batch runs
+    - ids already in the results file are skipped, so an interrupted batch continues where it stopped.
+      Failed items are not in the results file and are tried again
+
+    The script is loaded like a module (its demo only runs under __name__ == "__main__") and has to define
+    a compiled `graph`. If it also defines initial_state(**fields), the fields of each input line
+    (everything but "id") are passed to it, otherwise they are used as the initial state as such.
+    The state is built when the item starts, so budgets and deadlines don't run while it waits in the queue.
+
+    Input, one item per line (id defaults to the line number):
+        {"id": "cats", "joke_topic": "Very bad joke about bengal cats"}
+        {"id": "dogs", "joke_topic": "Dad joke about dogs"}
+
+    Run from the repository root:
+    -> python -m graph_utils.batch_runner 6_database_and_agents.py topics.jsonl --workers 8 --model openai
+    --profile (or GRAPH_PROFILE=1) writes cProfile stats of every run into profiles/, see graph_utils/profiling.py
+    --cassette FILE records (--cassette-mode record) or replays the HTTP traffic of the runs, see llm_utils/http_cassettes.py
+'''
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+
+from langchain_core.runnables.config import merge_configs
+
+from graph_utils import profiling
+from graph_utils.checkpoint import dumps_state
+from llm_utils import http_cassettes, models
+
+
+def load_script(path):
+    name = "batch_" + os.path.splitext(os.path.basename(path))[0].replace(".", "_")
+    # The scripts import the helper packages and open database/ relative to the repository root
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_items(path):
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            yield str(item.pop("id", line_number)), item
+
+
+# Ids in an earlier results file. A half written last line (the process died while writing) is ignored
+def completed_ids(path):
+    ids = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    ids.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    pass
+    return ids
+
+
+class BatchRunner:
+    def __init__(self, graph, initial_state=None, config=None, workers=8, item_timeout=None):
+        self.graph = graph
+        self.initial_state = initial_state
+        self.config = config
+        self.workers = workers
+        self.item_timeout = item_timeout
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+
+    async def _run_item(self, item_id, fields):
+        state = self.initial_state(**fields) if self.initial_state else fields
+        # The item id is the run id in the token ledger (llm_utils/ledger.py)
+        config = merge_configs(self.config, {"configurable": {"run_id": item_id}})
+        return await asyncio.wait_for(self.graph.ainvoke(state, config), timeout=self.item_timeout)
+
+    async def _worker(self, queue, results, errors):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            item_id, fields = item
+            start = time.perf_counter()
+            try:
+                result = await self._run_item(item_id, fields)
+            # The example nodes call exit() when the model's answer is unusable, that fails only this item
+            except (Exception, SystemExit) as e:
+                errors.write(json.dumps({"id": item_id,
+                                         "error": f"{type(e).__name__}: {e}",
+                                         "traceback": traceback.format_exc(),
+                                         "seconds": round(time.perf_counter() - start, 3)}) + "\n")
+                errors.flush()
+                self.failed += 1
+            else:
+                # The state is written like a checkpoint (Records and messages as [type, content])
+                results.write(f'{{"id":{json.dumps(item_id)},'
+                              f'"seconds":{time.perf_counter() - start:.3f},'
+                              f'"state":{dumps_state(result)}}}\n')
+                results.flush()
+                self.done += 1
+
+    async def _report(self, total, every):
+        start = time.perf_counter()
+        while True:
+            await asyncio.sleep(every)
+            self._print_progress(total, time.perf_counter() - start)
+
+    def _print_progress(self, total, elapsed):
+        finished = self.done + self.failed
+        rate = finished / elapsed if elapsed else 0.0
+        eta = f"{(total - finished) / rate:.0f}s" if rate else "-"
+        print(f"{finished}/{total} done ({self.failed} failed, {self.skipped} skipped) "
+              f"{rate:.2f} items/s, eta {eta}", file=sys.stderr)
+
+    async def run(self, input_path, results_path, errors_path, progress_every=5.0):
+        done_before = completed_ids(results_path)
+        total = sum(1 for item_id, _ in read_items(input_path) if item_id not in done_before)
+
+        # The queue is bounded, so the input file is read only as fast as the workers take items
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        start = time.perf_counter()
+        with open(results_path, "a") as results, open(errors_path, "a") as errors:
+            workers = [asyncio.create_task(self._worker(queue, results, errors)) for _ in range(self.workers)]
+            reporter = asyncio.create_task(self._report(total, progress_every))
+            try:
+                for item_id, fields in read_items(input_path):
+                    if item_id in done_before:
+                        self.skipped += 1
+                        continue
+                    await queue.put((item_id, fields))
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                reporter.cancel()
+                for worker in workers:
+                    worker.cancel()
+
+        self._print_progress(total, time.perf_counter() - start)
+        return self.done, self.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("script", help="Example script defining a compiled `graph`, ie. 6_database_and_agents.py")
+    parser.add_argument("input", help="JSONL file, one initial state per line")
+    parser.add_argument("--results", help="Defaults to <input>.results.jsonl")
+    parser.add_argument("--errors", help="Defaults to <input>.errors.jsonl")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--model", default="openai", help="Model key for llm_utils.models, ie. openai:gpt-4o-mini")
+    parser.add_argument("--item-timeout", type=float, help="Seconds before a single item is failed")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--verbose", action="store_true", help="Keep the prints of the graph's nodes")
+    parser.add_argument("--profile", action="store_true",
+                        help="cProfile / tracemalloc output per graph run (graph_utils/profiling.py), or GRAPH_PROFILE=1")
+    parser.add_argument("--cassette", help="Record / replay the HTTP traffic (llm_utils/http_cassettes.py), or HTTP_CASSETTE")
+    parser.add_argument("--cassette-mode", choices=["replay", "record", "auto"], default="replay")
+    args = parser.parse_args()
+
+    if args.cassette:
+        http_cassettes.install(args.cassette, args.cassette_mode)
+    else:
+        http_cassettes.install_from_env()
+    if args.profile:
+        profiling.enable(**profiling.env_options())
+    else:
+        profiling.enable_from_env()
+
+    base = os.path.splitext(args.input)[0]
+    results_path = args.results or f"{base}.results.jsonl"
+    errors_path = args.errors or f"{base}.errors.jsonl"
+
+    module = load_script(args.script)
+    runner = BatchRunner(module.graph,
+                         initial_state=getattr(module, "initial_state", None),
+                         config=models.model_config(args.model),
+                         workers=args.workers,
+                         item_timeout=args.item_timeout)
+
+    # The nodes print every step, with many runs at once that is only noise
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with output:
+        done, failed = asyncio.run(runner.run(args.input, results_path, errors_path, args.progress_every))
+
+    print(f"Results: {results_path} ({done} new)", file=sys.stderr)
+    if failed:
+        print(f"Errors: {errors_path} ({failed} failed, run again to retry them)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+'''
+    Vectorized batch mode for simple tools.
+
+    Invoking a LangChain tool validates the arguments, runs callbacks and builds a result message.
+    For a tool like add_tool that is a lot of work around a single integer addition. A tool can declare
+    a batch implementation working on NumPy arrays, one array per argument:
+
+        @tool
+        def add_tool(a: int, b: int) -> int: ...
+
+        @batch_tools.vectorized(add_tool)
+        def add_many(a, b):
+            return a + b
+
+    Then many calls of the tool can be run as one NumPy call:
+    - invoke_batch(add_tool, [{"a": 1, "b": 2}, ...]) -> [3, ...]
+    - invoke_columns(add_tool, a=array, b=array) -> array, no per-call Python objects at all
+    - Coalescer: concurrent `await coalescer.ainvoke(tool, args)` calls are collected until the event loop
+      runs out of other work and flushed as one batch. ToolRegistry (tool_node.py) sends the calls of tools
+      with a batch implementation through it, so calls from one model turn or from many graph runs at once
+      (ie. the batch runner) are coalesced. With an executor the batches run in its threads, so the
+      registry's tool timeouts apply to them
+
+    The arguments are validated and converted with the tool's args_schema (pydantic v1 or v2) like in
+    tool.invoke, so "1" is the number 1. Only numeric columns go to the batch implementation, and an
+    integer result is checked against the same calculation in floats, NumPy integers wrap around silently
+    where Python's don't. When the arguments don't validate or the columns don't fit, the batch falls back
+    to invoking the tool call by call, so the broken calls get their own errors. An error of the batch
+    implementation itself is raised.
+'''
+
+import asyncio
+
+import numpy as np
+import pydantic
+from langchain_core.pydantic_v1 import ValidationError
+
+
+# Arguments that don't validate, pydantic v1 and v2 schemas
+_VALIDATION_ERRORS = (ValidationError, pydantic.ValidationError)
+
+
+# Tool name -> batch implementation
+_batch_implementations = {}
+
+
+def vectorized(tool):
+    def decorator(function):
+        _batch_implementations[tool.name] = function
+        return function
+
+    return decorator
+
+
+def has_batch(tool):
+    return tool.name in _batch_implementations
+
+
+# The calls can't be run as one batch, they are invoked one by one
+class _NotBatchable(Exception):
+    pass
+
+
+def invoke_columns(tool, **columns):
+    return _batch_implementations[tool.name](**{name: np.asarray(values) for name, values in columns.items()})
+
+
+def _invoke_each(tool, args_list, return_exceptions):
+    results = []
+    for args in args_list:
+        try:
+            results.append(tool.invoke(args))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+# The arguments as the tool itself would see them (types converted, defaults filled)
+def _validated(tool, args_list):
+    schema = tool.args_schema
+    if schema is None:
+        return args_list
+    if hasattr(schema, "model_validate"):
+        return [schema.model_validate(args).model_dump() for args in args_list]
+    return [schema.parse_obj(args).dict() for args in args_list]
+
+
+# Numeric dtypes: bool, int, unsigned and float. Strings and too big integers become other dtypes
+def _numeric(column):
+    return column.dtype.kind in "biuf"
+
+
+# True when an integer result wrapped around. The same calculation in floats is close to the exact result
+def _overflowed(function, columns, results):
+    if results.dtype.kind not in "iu":
+        return False
+    with np.errstate(all="ignore"):
+        exact = function(**{name: column.astype(np.float64) for name, column in columns.items()})
+    return not np.allclose(results, exact, rtol=1e-9, atol=0.5)
+
+
+# Results of the calls in the same order, as Python values
+def invoke_batch(tool, args_list, return_exceptions=False):
+    function = _batch_implementations.get(tool.name)
+    if function is None or not args_list:
+        return _invoke_each(tool, args_list, return_exceptions)
+    try:
+        validated = _validated(tool, args_list)
+        columns = {name: np.asarray([args[name] for args in validated]) for name in validated[0]}
+        if not all(_numeric(column) for column in columns.values()):
+            raise _NotBatchable(f"Arguments of {tool.name} are not all numeric")
+        results = np.asarray(function(**columns))
+        if len(results) != len(args_list):
+            raise ValueError(f"Batch implementation of {tool.name} returned {len(results)} results for {len(args_list)} calls")
+        if _overflowed(function, columns, results):
+            raise _NotBatchable(f"Batch implementation of {tool.name} overflowed")
+        return results.tolist()
+    except (_NotBatchable, *_VALIDATION_ERRORS):
+        return _invoke_each(tool, args_list, return_exceptions)
+
+
+class Coalescer:
+    def __init__(self, max_batch=65_536, executor=None):
+        self.max_batch = max_batch
+        # Thread pool for the batches, so the callers can time them out. None = in the event loop
+        self.executor = executor
+        # Tool name -> (tool, arguments, [(future, first index, last index)]) waiting for the next flush
+        self.pending = {}
+        self.calls = 0
+        self.batches = 0
+
+    async def ainvoke(self, tool, args):
+        result = (await self.ainvoke_many(tool, [args]))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    # Several calls with one future. Results are returned in order, failed calls as their exceptions
+    async def ainvoke_many(self, tool, args_list):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.get(tool.name)
+        if batch is None:
+            batch = self.pending[tool.name] = (tool, [], [])
+            # Runs after every task that is already ready to run has had its turn
+            loop.call_soon(self._flush, tool.name)
+        start = len(batch[1])
+        batch[1].extend(args_list)
+        batch[2].append((future, start, len(batch[1])))
+        if len(batch[1]) >= self.max_batch:
+            self._flush(tool.name)
+        return await future
+
+    def _flush(self, name):
+        batch = self.pending.pop(name, None)
+        if batch is None:
+            return
+        tool, args_list, waiters = batch
+        self.calls += len(args_list)
+        self.batches += 1
+        if self.executor is not None:
+            running = asyncio.get_running_loop().run_in_executor(self.executor, invoke_batch, tool, args_list, True)
+            running.add_done_callback(lambda done: _deliver(waiters, done.exception(), done.result))
+            return
+        try:
+            results = invoke_batch(tool, args_list, return_exceptions=True)
+        except Exception as e:
+            _deliver(waiters, e, None)
+        else:
+            _deliver(waiters, None, lambda: results)
+
+
+# The results (results() -> list) or the error of the whole batch to the waiting callers.
+# A caller that timed out is skipped
+def _deliver(waiters, error, results):
+    if error is None:
+        results = results()
+    for future, start, end in waiters:
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(results[start:end])
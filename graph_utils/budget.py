@@ -0,0 +1,82 @@
+'''
+    Per-run deadlines and token budgets.
+
+    The budget is plain data in the agent's state:
+    - "deadline":    time.time() when the run has to be finished
+    - "tokens_left": tokens the run may still spend. Every node subtracts what its model calls used
+
+    Nodes call the models through ainvoke() / abatch() below. They cancel the call when the deadline passes
+    (the provider request is cancelled with the asyncio task) and return the tokens the call used.
+    Routers check low() and take the cheapest way out when there isn't enough budget for another round.
+'''
+
+import asyncio
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import merge_configs
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, tokens_used=0):
+        super().__init__("The run's deadline passed before the model answered")
+        self.tokens_used = tokens_used
+
+
+# Sums up the tokens reported by the model calls made with it
+class TokenCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        counted = False
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.tokens += usage.get("total_tokens", 0)
+                    counted = True
+        if not counted and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            self.tokens += usage.get("total_tokens", 0)
+
+
+def deadline_in(seconds):
+    return time.time() + seconds
+
+
+def new_budget(seconds, tokens):
+    return {"deadline": deadline_in(seconds), "tokens_left": tokens}
+
+
+def time_left(state):
+    return state["deadline"] - time.time()
+
+
+# True when the run can't afford another round (reserve = what one more round is expected to cost)
+def low(state, reserve_seconds=0, reserve_tokens=0):
+    return time_left(state) <= reserve_seconds or state["tokens_left"] <= reserve_tokens
+
+
+async def _call(coroutine, state, counter):
+    try:
+        result = await asyncio.wait_for(coroutine, timeout=max(0, time_left(state)))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(counter.tokens) from None
+    return result, counter.tokens
+
+
+def _with_counter(config):
+    counter = TokenCounter()
+    return counter, merge_configs(config or {}, {"callbacks": [counter]})
+
+
+# Returns (result, tokens used). Raises DeadlineExceeded if the deadline passes first
+async def ainvoke(runnable, input, state, config=None):
+    counter, config = _with_counter(config)
+    return await _call(runnable.ainvoke(input, config), state, counter)
+
+
+async def abatch(runnable, inputs, state, config=None, **kwargs):
+    counter, config = _with_counter(config)
+    return await _call(runnable.abatch(inputs, config, **kwargs), state, counter)
@@ -0,0 +1,116 @@
+'''
+    Append-only state channels for the agents.
+
+    Instead of mutating and returning the whole state (state["messages"] += [...]; return state),
+    nodes return only what changed: {"messages": [Record("ai", "...")]}.
+    The reducer given in the state definition tells LangGraph how the change is merged into the state:
+
+        class AgentState(TypedDict):
+            numbers: Annotated[AppendLog, channels.append]
+            messages: Annotated[Deque[Record], channels.ring_buffer(50)]
+
+    Reducers must not modify the old value in place (LangGraph applies the same update to copies of the
+    channels when it evaluates conditional edges), so:
+    - append returns a new AppendLog which shares all the old entries, appending is O(1) and nothing is copied
+    - ring_buffer keeps only the newest maxlen entries. Copying it costs at most maxlen, however long the loop runs
+    - Record is a compact message (role + content) with __slots__, much lighter than a LangChain message
+'''
+
+from collections import deque
+
+
+class Record:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+    def __repr__(self):
+        return f"Record({self.role!r}, {self.content!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.role == other.role and self.content == other.content
+
+
+# One entry of an AppendLog, pointing to the entry before it
+class _Link:
+    __slots__ = ("item", "previous")
+
+    def __init__(self, item, previous):
+        self.item = item
+        self.previous = previous
+
+
+class AppendLog:
+    '''
+        Immutable append-only sequence. extend() returns a new log that shares the entries of the old one.
+        Works like a read-only list: len(), iteration, indexing and comparison with lists.
+    '''
+    __slots__ = ("_last", "_length", "_items")
+
+    def __init__(self, items=()):
+        self._last = None
+        self._length = 0
+        self._items = None
+        for item in items:
+            self._last = _Link(item, self._last)
+            self._length += 1
+
+    def extend(self, items):
+        log = AppendLog()
+        log._last, log._length = self._last, self._length
+        for item in items:
+            log._last = _Link(item, log._last)
+            log._length += 1
+        return log
+
+    # The entries are collected into a list on the first read and cached (the log never changes)
+    def _list(self):
+        if self._items is None:
+            items = [None] * self._length
+            link = self._last
+            for index in range(self._length - 1, -1, -1):
+                items[index] = link.item
+                link = link.previous
+            self._items = items
+        return self._items
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def __getitem__(self, index):
+        return self._list()[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(self._list())
+
+
+def _as_items(value):
+    if isinstance(value, (list, tuple, deque, AppendLog)):
+        return value
+    return (value,)
+
+
+# Reducer: appends the update to the log without copying the existing entries
+def append(left, right):
+    if not isinstance(left, AppendLog):
+        left = AppendLog(left or ())
+    return left.extend(_as_items(right))
+
+
+# Reducer factory: the channel holds only the newest maxlen entries
+def ring_buffer(maxlen):
+    def reducer(left, right):
+        buffer = deque(left or (), maxlen=maxlen)
+        buffer.extend(_as_items(right))
+        return buffer
+
+    reducer.__name__ = f"ring_buffer_{maxlen}"
+    return reducer
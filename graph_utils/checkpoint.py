@@ -0,0 +1,230 @@
+'''
+    SQLite checkpoints for graph runs.
+
+    The agent's state is stored after every node, keyed by a run id. If the process dies in the middle
+    of a run, running it again with the same run id continues after the last node that completed.
+
+    - States are stored as JSON. Records and plain text LangChain messages are stored as [type, content]
+    - The state should hold only plain data (the model is given in the graph's config, see llm_utils/models.py).
+      Keys listed in skip_keys are left out and can be given again with restore= when the run is resumed
+    - Writes use one open connection in WAL mode without waiting for fsync on every commit,
+      so a checkpoint costs well under a millisecond for the example states
+    - Retention: finished runs are compacted to their final checkpoint, old runs are pruned
+
+    The graph needs an entry point that knows where to continue. The driver puts the name of the last
+    completed node into the state key "last_node" when a run is resumed (see 6_database_and_agents.py)
+'''
+
+import json
+import sqlite3
+import time
+from collections import deque
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.runnables.config import merge_configs
+
+from graph_utils.channels import AppendLog, Record
+
+
+# Plain text messages are stored as [type, content], message_to_dict is several times slower
+_PLAIN_MESSAGES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+def _default(value):
+    if isinstance(value, Record):
+        return {"__record__": [value.role, value.content]}
+    # Ring buffers and append logs are stored as lists, the reducers turn them back into channels
+    if isinstance(value, (deque, AppendLog)):
+        return list(value)
+    if isinstance(value, BaseMessage):
+        if value.type in _PLAIN_MESSAGES and not value.additional_kwargs and not getattr(value, "tool_calls", None):
+            return {"__message__": [value.type, value.content]}
+        return {"__message__": message_to_dict(value)}
+    raise TypeError(f"Object of type {type(value).__name__} can't be checkpointed")
+
+
+def _object_hook(value):
+    if "__record__" in value:
+        return Record(*value["__record__"])
+    if "__message__" in value:
+        message = value["__message__"]
+        if isinstance(message, list):
+            return _PLAIN_MESSAGES[message[0]](content=message[1])
+        return messages_from_dict([message])[0]
+    return value
+
+
+def dumps_state(state, skip_keys=()):
+    return json.dumps({key: value for key, value in state.items() if key not in skip_keys},
+                      default=_default, separators=(",", ":"))
+
+
+def loads_state(data):
+    return json.loads(data, object_hook=_object_hook)
+
+
+# The run id is also the run id of the token ledger (llm_utils/ledger.py)
+def _with_run_id(config, run_id):
+    return merge_configs(config, {"configurable": {"run_id": run_id}})
+
+
+class Checkpointer:
+    def __init__(self, db_path="database/checkpoints.db", skip_keys=(),
+                 keep_runs=100, max_age_seconds=7 * 24 * 3600):
+        self.skip_keys = skip_keys
+        self.keep_runs = keep_runs
+        self.max_age_seconds = max_age_seconds
+
+        # Autocommit connection, every checkpoint is its own small transaction
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL is still safe against corruption, only the very last commits may be lost on power loss
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                node TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (run_id, step)
+            )
+            """
+        )
+        self.prune()
+
+    def save(self, run_id, step, node, state):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (run_id, step, node, state, created_at) VALUES (?, ?, ?, ?, ?)",
+            (run_id, step, node, dumps_state(state, self.skip_keys), now),
+        )
+
+    # Returns (step, node, state) of the latest checkpoint or None
+    def last(self, run_id):
+        row = self.conn.execute(
+            "SELECT step, node, state FROM checkpoints WHERE run_id = ? ORDER BY step DESC LIMIT 1",
+            (run_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], loads_state(row[2])
+
+    def status(self, run_id):
+        row = self.conn.execute("SELECT status FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def _set_status(self, run_id, status):
+        now = time.time()
+        self.conn.execute(
+            """
+            INSERT INTO runs (run_id, status, created_at, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+            """,
+            (run_id, status, now, now),
+        )
+
+    # Runs the graph and stores the state after every node.
+    # restore holds the skipped keys, which are put back when resuming
+    # Returns (step, state to start from), or (None, final state) when the run is already finished
+    def _start(self, run_id, state, restore):
+        step = 0
+        checkpoint = self.last(run_id)
+        if checkpoint is not None:
+            step, node, saved_state = checkpoint
+            if self.status(run_id) == "finished":
+                print(f"Run '{run_id}' is already finished, returning its final state")
+                return None, {**saved_state, **(restore or {})}
+            print(f"Resuming run '{run_id}' after node '{node}' (step {step})")
+            state = {**saved_state, **(restore or {}), "last_node": node}
+        self._set_status(run_id, "running")
+        return step, state
+
+    def _finish(self, run_id):
+        self._set_status(run_id, "finished")
+        self.compact(run_id)
+
+    def run(self, graph, state, run_id, restore=None, config=None):
+        step, state = self._start(run_id, state, restore)
+        if step is None:
+            return state
+
+        result, node = state, None
+        # "updates" tells which node just finished, the following "values" chunk is the whole state after it
+        config = _with_run_id(config, run_id)
+        for mode, chunk in graph.stream(state, config, stream_mode=["updates", "values"]):
+            if mode == "updates":
+                node = next(iter(chunk))
+            elif node is not None:
+                step += 1
+                self.save(run_id, step, node, chunk)
+                result, node = chunk, None
+
+        self._finish(run_id)
+        return result
+
+    # Same as run() for graphs with async nodes
+    async def arun(self, graph, state, run_id, restore=None, config=None):
+        step, state = self._start(run_id, state, restore)
+        if step is None:
+            return state
+
+        result, node = state, None
+        config = _with_run_id(config, run_id)
+        async for mode, chunk in graph.astream(state, config, stream_mode=["updates", "values"]):
+            if mode == "updates":
+                node = next(iter(chunk))
+            elif node is not None:
+                step += 1
+                self.save(run_id, step, node, chunk)
+                result, node = chunk, None
+
+        self._finish(run_id)
+        return result
+
+    # Keeps only the final checkpoint of a run
+    def compact(self, run_id):
+        self.conn.execute(
+            "DELETE FROM checkpoints WHERE run_id = ? AND step < (SELECT MAX(step) FROM checkpoints WHERE run_id = ?)",
+            (run_id, run_id),
+        )
+
+    # Removes runs older than max_age_seconds and everything but the newest keep_runs runs
+    def prune(self):
+        cutoff = time.time() - self.max_age_seconds
+        old_runs = self.conn.execute(
+            """
+            SELECT run_id FROM runs
+            WHERE updated_at < ?
+            OR run_id NOT IN (SELECT run_id FROM runs ORDER BY updated_at DESC LIMIT ?)
+            """,
+            (cutoff, self.keep_runs),
+        ).fetchall()
+        for (run_id,) in old_runs:
+            self.delete(run_id)
+        return len(old_runs)
+
+    def delete(self, run_id):
+        self.conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+        self.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def close(self):
+        self.conn.close()
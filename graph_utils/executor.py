@@ -0,0 +1,156 @@
+'''
+    Minimal executor for small deterministic graphs.
+
+    LangGraph's runtime is built for LLM agents: channels, checkpoints, parallel branches, streaming and retries.
+    For graphs whose nodes are plain sync functions (4.1, 5.1 and 6.1) that bookkeeping costs far more than
+    the nodes themselves. This StateGraph takes the same definitions and compiles them into a tight loop:
+
+        workflow = executor.StateGraph(AgentState)      # instead of langgraph.graph.StateGraph
+        workflow.add_node("add", add_x)
+        workflow.add_conditional_edges("add", is_done)
+        workflow.set_entry_point("add")
+        graph = workflow.compile()
+        graph.invoke({"marks": ["X"]})
+
+    - Reducers are read from the Annotated state definition, like LangGraph does
+    - Every node has one way forward: a single edge or a conditional edge returning one node name (or END)
+    - No recursion limit unless one is given in the config: graph.invoke(state, {"recursion_limit": 100})
+    - Nodes that take a config argument get the config, like in LangGraph
+    Parallel branches, async nodes, Send, checkpointers and streaming are not supported, use LangGraph for those.
+'''
+
+import inspect
+import typing
+
+from langgraph.errors import GraphRecursionError
+from langgraph.graph import END, START
+
+
+def _takes_config(function):
+    try:
+        return "config" in inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+# State key -> (reducer, default value) for the keys Annotated with a reducer
+def _reducers(schema):
+    reducers = {}
+    for key, hint in typing.get_type_hints(schema, include_extras=True).items():
+        metadata = getattr(hint, "__metadata__", ())
+        if metadata and callable(metadata[-1]):
+            origin = typing.get_origin(hint.__origin__) or hint.__origin__
+            try:
+                default = origin()
+            except Exception:
+                default = None
+            reducers[key] = (metadata[-1], default)
+    return reducers
+
+
+class StateGraph:
+    def __init__(self, schema):
+        self.schema = schema
+        self.nodes = {}
+        self.edges = {}
+        self.branches = {}
+
+    def add_node(self, node, action=None):
+        if action is None:
+            node, action = node.__name__, node
+        if node in self.nodes:
+            raise ValueError(f"Node '{node}' already exists")
+        if inspect.iscoroutinefunction(action):
+            raise ValueError(f"Node '{node}' is async, the executor runs only sync nodes")
+        self.nodes[node] = action
+
+    def add_edge(self, start, end):
+        if not isinstance(start, str):
+            raise ValueError("Joining several nodes into one isn't supported by the executor")
+        if start in self.edges or start in self.branches:
+            raise ValueError(f"Node '{start}' already has a way forward, parallel branches aren't supported")
+        self.edges[start] = end
+
+    def add_conditional_edges(self, source, path, path_map=None):
+        if source in self.edges or source in self.branches:
+            raise ValueError(f"Node '{source}' already has a way forward, parallel branches aren't supported")
+        if isinstance(path_map, (list, tuple)):
+            path_map = {name: name for name in path_map}
+        self.branches[source] = (path, path_map)
+
+    def set_entry_point(self, node):
+        self.add_edge(START, node)
+
+    def set_conditional_entry_point(self, path, path_map=None):
+        self.add_conditional_edges(START, path, path_map)
+
+    def set_finish_point(self, node):
+        self.add_edge(node, END)
+
+    def compile(self):
+        for start, end in self.edges.items():
+            for name in (start, end):
+                if name not in (START, END) and name not in self.nodes:
+                    raise ValueError(f"Edge {start} -> {end} uses unknown node '{name}'")
+        if START not in self.edges and START not in self.branches:
+            raise ValueError("The graph has no entry point")
+        return CompiledGraph(self)
+
+
+class CompiledGraph:
+    def __init__(self, builder):
+        self.reducers = _reducers(builder.schema)
+        # Node name -> (function, takes config)
+        self.nodes = {name: (action, _takes_config(action)) for name, action in builder.nodes.items()}
+        # Node name -> next node, or (router, takes config, path map)
+        self.next = dict(builder.edges)
+        for source, (path, path_map) in builder.branches.items():
+            self.next[source] = (path, _takes_config(path), path_map)
+
+    def _route(self, step, state, config):
+        if isinstance(step, str):
+            return step
+        path, takes_config, path_map = step
+        target = path(state, config=config) if takes_config else path(state)
+        if not isinstance(target, str):
+            raise ValueError(f"Router {path.__name__} returned {target!r}, the executor follows only one node at a time")
+        return path_map[target] if path_map else target
+
+    def invoke(self, input, config=None):
+        config = config or {}
+        limit = config.get("recursion_limit")
+        reducers = self.reducers
+        nodes = self.nodes
+        routes = self.next
+
+        # The input is merged into empty channels, the reducers turn ie. lists into their channel types
+        state = {}
+        for key, value in input.items():
+            if key in reducers:
+                reducer, default = reducers[key]
+                state[key] = reducer(default, value)
+            else:
+                state[key] = value
+        for key, (reducer, default) in reducers.items():
+            if key not in state and default is not None:
+                state[key] = default
+
+        node = self._route(routes[START], state, config)
+        steps = 0
+        while node != END:
+            if limit is not None and steps >= limit:
+                raise GraphRecursionError(f"Recursion limit of {limit} reached without hitting a stop condition")
+            function, takes_config = nodes[node]
+            update = function(state, config=config) if takes_config else function(state)
+            if update:
+                for key, value in update.items():
+                    if key in reducers:
+                        state[key] = reducers[key][0](state.get(key, reducers[key][1]), value)
+                    else:
+                        state[key] = value
+            step = routes.get(node)
+            if step is None:
+                raise ValueError(f"Node '{node}' has no edge forward")
+            node = self._route(step, state, config)
+            steps += 1
+        return state
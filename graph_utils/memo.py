@@ -0,0 +1,141 @@
+'''
+    Memoization of pure nodes and routers.
+
+    A node whose output depends only on a few keys of the state (and maybe on the model in the config)
+    doesn't have to run again for the same input. @memo.node remembers the returned update
+    (or the router's answer) in an LRU cache keyed by a fingerprint of those inputs:
+
+        @memo.node(keys=("number_a", "number_b"))
+        def add_agent(state): ...
+
+        # LLM node: the same topic with the same model gives the cached joke
+        @memo.node(keys=("joke_topic",), config_keys=("model",))
+        def joker_agent(state, config): ...
+
+        # Routers can fingerprint something cheaper than the whole value
+        @memo.node(key=lambda state: len(state["marks"]))
+        def is_done(state): ...
+
+    It is opt-in: only decorate functions that don't depend on anything else (time, randomness, budgets).
+    keys, config_keys or key must be given: without them every call would get the first call's answer.
+    Sync and async functions are supported. Hit rates are in memo.stats().
+'''
+
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+
+from graph_utils.checkpoint import dumps_state
+
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+# "module.function" -> its cache, for stats() and clear(). Two modules may have nodes with the same name
+_caches = {}
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Sync nodes of one step can run in parallel threads
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+def _fingerprint(state, config, keys, config_keys, key):
+    if key is not None:
+        values = (key(state),)
+    else:
+        values = tuple(state.get(name) for name in keys)
+    if config_keys:
+        configurable = (config or {}).get("configurable", {})
+        values += tuple(configurable.get(name) for name in config_keys)
+    if all(isinstance(value, _PRIMITIVES) for value in values):
+        return values
+    # Lists, Records and messages are fingerprinted by their JSON, the same way checkpoints store them
+    return dumps_state({"values": values})
+
+
+# The cached update is copied, so the caller can't change the cached one
+def _copy(result):
+    return dict(result) if isinstance(result, dict) else result
+
+
+def node(keys=(), config_keys=(), key=None, maxsize=1024):
+    if not keys and not config_keys and key is None:
+        raise ValueError("memo.node() needs keys, config_keys or key, the inputs the cached answer depends on")
+
+    def decorator(function):
+        cache = _LRU(maxsize)
+        _caches[f"{function.__module__}.{function.__qualname__}"] = cache
+
+        # LangGraph passes the config as a keyword argument when the function takes one
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(state, *args, **kwargs):
+                fingerprint = _fingerprint(state, kwargs.get("config"), keys, config_keys, key)
+                hit, result = cache.get(fingerprint)
+                if not hit:
+                    result = await function(state, *args, **kwargs)
+                    cache.put(fingerprint, result)
+                return _copy(result)
+        else:
+            @functools.wraps(function)
+            def wrapper(state, *args, **kwargs):
+                fingerprint = _fingerprint(state, kwargs.get("config"), keys, config_keys, key)
+                hit, result = cache.get(fingerprint)
+                if not hit:
+                    result = function(state, *args, **kwargs)
+                    cache.put(fingerprint, result)
+                return _copy(result)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+# "module.function" -> hits, misses, hit rate and cache size
+def stats():
+    return {
+        name: {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hit_rate": cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0,
+            "size": len(cache.entries),
+        }
+        for name, cache in _caches.items()
+    }
+
+
+def print_stats():
+    for name, values in stats().items():
+        print(f"{name:<40} hits {values['hits']:>8}  misses {values['misses']:>8}  "
+              f"hit rate {values['hit_rate']:6.1%}  cached {values['size']}")
+
+
+def clear():
+    for cache in _caches.values():
+        with cache.lock:
+            cache.entries.clear()
+            cache.hits = 0
+            cache.misses = 0
@@ -0,0 +1,318 @@
+'''
+    Staged multi-process pipeline: generate -> check -> write.
+
+    For batch jobs that are mostly waiting for the model but also do CPU work per item (parsing the
+    structured output, duplicate checks, validating a query). In one interpreter the CPU work holds up the
+    event loop and the model calls wait for it, so the stages run apart:
+
+    - generate: `workers` asyncio tasks in the main process call generate(item) -> record. Only model calls
+    - check:    `shards` processes. A record goes to the shard picked by route(record) (a string, ie. the
+                normalized joke), so a shard sees every record with the same key and can check duplicates
+                with a local set. checker(shard, shards) is called in the process and returns
+                check(record) -> (status, row). Rows with status "ok" are written, other statuses are counted
+    - write:    one process owns the database, writer.open() / writer.write(rows) -> rows written / writer.close().
+                Rows from all the shards are written in batches, one transaction each
+
+    The queues between the stages are bounded: when the writer or a shard falls behind, the generation
+    workers wait instead of piling records up in memory. Records travel in chunks of `chunk_size`.
+    shards=0 runs the checks and writes in the event loop, the way a single script does (for comparison).
+    checker and writer are pickled to the processes (module level classes / functools.partial).
+
+        pipeline = Pipeline(generate, route, functools.partial(Checks, db_path=path), SqliteWriter(path, INSERT))
+        stats = pipeline.run(topics)
+        print_report(stats)
+
+    The joke job of 6_database_and_agents.py is in database/joke_pipeline.py,
+    throughput from 1 to N cores: python -m benchmarks.pipeline_scaling
+'''
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import sqlite3
+import sys
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Shard of a routing key, the same in every process (hash() of a string is not)
+def shard_of(key, shards):
+    return zlib.crc32(key.encode()) % shards
+
+
+class SqliteWriter:
+    def __init__(self, db_path, insert_sql):
+        self.db_path = db_path
+        self.insert_sql = insert_sql
+        self.conn = None
+
+    def open(self):
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    # Rows really inserted, INSERT OR IGNORE skips the ones the table already has
+    def write(self, rows):
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(self.insert_sql, rows)
+        return self.conn.total_changes - before
+
+    def close(self):
+        self.conn.close()
+
+
+def _check_chunk(check, chunk, counts):
+    rows = []
+    for record in chunk:
+        try:
+            status, row = check(record)
+        except Exception as e:
+            status, row = f"error: {type(e).__name__}", None
+        counts[status] += 1
+        if status == "ok":
+            rows.append(row)
+    return rows
+
+
+def _shard_main(checker, shard, shards, inbox, outbox, reports):
+    check = checker(shard, shards)
+    reports.put(("ready", f"shard {shard}"))
+    counts = Counter()
+    busy = 0.0
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        rows = _check_chunk(check, chunk, counts)
+        busy += time.perf_counter() - start
+        if rows:
+            outbox.put(rows)
+    # Tells the writer this shard is done
+    outbox.put(None)
+    reports.put(("shard", shard, dict(counts), busy))
+
+
+def _writer_main(writer, inbox, shards, batch_size, reports):
+    writer.open()
+    reports.put(("ready", "writer"))
+    finished = written = batches = 0
+    busy = 0.0
+    while finished < shards:
+        batch = []
+        chunk = inbox.get()
+        # Takes what the shards have already sent, up to batch_size rows per transaction
+        while True:
+            if chunk is None:
+                finished += 1
+            else:
+                batch.extend(chunk)
+            if len(batch) >= batch_size or finished == shards:
+                break
+            try:
+                chunk = inbox.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            start = time.perf_counter()
+            written += writer.write(batch)
+            busy += time.perf_counter() - start
+            batches += 1
+    writer.close()
+    reports.put(("writer", written, batches, busy))
+
+
+class Pipeline:
+    def __init__(self, generate, route, checker, writer, shards=None, workers=32,
+                 queue_size=16, chunk_size=64, batch_size=1000, flush_every=1.0):
+        self.generate = generate
+        self.route = route
+        self.checker = checker
+        self.writer = writer
+        self.shards = os.cpu_count() if shards is None else shards
+        self.workers = workers
+        # Chunks a queue holds before the stage in front of it waits
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        # Seconds a partly filled chunk may wait, matters when the model is slow
+        self.flush_every = flush_every
+
+    def run(self, items, progress_every=None):
+        return asyncio.run(self.arun(items, progress_every))
+
+    async def arun(self, items, progress_every=None):
+        self._counts = Counter()
+        self._generated = 0
+        self._buffers = [[] for _ in range(max(self.shards, 1))]
+        self._processes = []
+        if self.shards:
+            return await self._run_sharded(items, progress_every)
+        return await self._run_inline(items, progress_every)
+
+    # Blocking queue calls of the main process, they fail instead of hanging when a stage process died
+    def _call(self, function, *args):
+        while True:
+            try:
+                return function(*args, timeout=1.0)
+            except (queue.Full, queue.Empty):
+                dead = [process.name for process in self._processes if process.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"Pipeline process failed: {', '.join(dead)}")
+
+    async def _run_sharded(self, items, progress_every):
+        loop = asyncio.get_running_loop()
+        # Spawned, not forked: the main process has an event loop and threads running
+        context = multiprocessing.get_context("spawn")
+        inboxes = [context.Queue(self.queue_size) for _ in range(self.shards)]
+        rows = context.Queue(self.queue_size)
+        reports = context.Queue()
+        for shard in range(self.shards):
+            self._processes.append(context.Process(target=_shard_main, name=f"shard {shard}", daemon=True,
+                                                   args=(self.checker, shard, self.shards, inboxes[shard], rows, reports)))
+        self._processes.append(context.Process(target=_writer_main, name="writer", daemon=True,
+                                               args=(self.writer, rows, self.shards, self.batch_size, reports)))
+        for process in self._processes:
+            process.start()
+
+        # Puts block the calling thread when a shard's queue is full, the generation workers wait on them
+        senders = ThreadPoolExecutor(self.shards)
+
+        async def send(shard, chunk):
+            await loop.run_in_executor(senders, self._call, inboxes[shard].put, chunk)
+
+        try:
+            # The processes import their modules first, the clock starts when all of them are ready
+            for _ in self._processes:
+                await loop.run_in_executor(None, self._call, reports.get)
+            start = time.perf_counter()
+            await self._generate_all(items, send, progress_every, start)
+            for shard in range(self.shards):
+                await send(shard, None)
+
+            stats = {"shard_busy": [0.0] * self.shards}
+            for _ in self._processes:
+                report = await loop.run_in_executor(None, self._call, reports.get)
+                if report[0] == "shard":
+                    _, shard, counts, busy = report
+                    self._counts.update(counts)
+                    stats["shard_busy"][shard] = busy
+                else:
+                    _, stats["written"], stats["batches"], stats["writer_busy"] = report
+            seconds = time.perf_counter() - start
+        finally:
+            senders.shutdown(wait=False)
+            for process in self._processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        return self._stats(stats, seconds)
+
+    async def _run_inline(self, items, progress_every):
+        check = self.checker(0, 1)
+        self.writer.open()
+        stats = {"shard_busy": [0.0], "written": 0, "batches": 0, "writer_busy": 0.0}
+        batch = []
+
+        def write():
+            started = time.perf_counter()
+            stats["written"] += self.writer.write(batch)
+            stats["writer_busy"] += time.perf_counter() - started
+            stats["batches"] += 1
+            batch.clear()
+
+        async def send(shard, chunk):
+            if chunk:
+                started = time.perf_counter()
+                batch.extend(_check_chunk(check, chunk, self._counts))
+                stats["shard_busy"][0] += time.perf_counter() - started
+            if len(batch) >= self.batch_size:
+                write()
+
+        start = time.perf_counter()
+        try:
+            await self._generate_all(items, send, progress_every, start)
+            if batch:
+                write()
+        finally:
+            self.writer.close()
+        return self._stats(stats, time.perf_counter() - start)
+
+    async def _generate_all(self, items, send, progress_every, start):
+        # Bounded, so the items are read only as fast as they are generated
+        pending = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def flush(shard):
+            chunk, self._buffers[shard] = self._buffers[shard], []
+            if chunk:
+                await send(shard, chunk)
+
+        async def worker():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                try:
+                    record = await self.generate(item)
+                except Exception as e:
+                    self._counts[f"generate error: {type(e).__name__}"] += 1
+                    continue
+                self._generated += 1
+                shard = shard_of(self.route(record), self.shards) if self.shards else 0
+                self._buffers[shard].append(record)
+                if len(self._buffers[shard]) >= self.chunk_size:
+                    await flush(shard)
+
+        async def flusher():
+            while True:
+                await asyncio.sleep(self.flush_every)
+                for shard in range(len(self._buffers)):
+                    await flush(shard)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_every)
+                elapsed = time.perf_counter() - start
+                print(f"{self._generated} generated, {self._generated / elapsed:.1f} items/s", file=sys.stderr)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        helpers = [asyncio.create_task(flusher())]
+        if progress_every:
+            helpers.append(asyncio.create_task(reporter()))
+        try:
+            for item in items:
+                await pending.put(item)
+            for _ in workers:
+                await pending.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers + helpers:
+                task.cancel()
+        for shard in range(len(self._buffers)):
+            await flush(shard)
+
+    def _stats(self, stats, seconds):
+        return {
+            "shards": self.shards,
+            "workers": self.workers,
+            "generated": self._generated,
+            "statuses": dict(self._counts),
+            "seconds": seconds,
+            "items_per_second": self._generated / seconds if seconds else 0.0,
+            **stats,
+        }
+
+
+def print_report(stats, file=sys.stderr):
+    seconds = stats["seconds"]
+    print(f"{stats['generated']} items in {seconds:.1f} s, {stats['items_per_second']:.1f} items/s "
+          f"({stats['shards'] or 'no'} shard processes, {stats['workers']} generation workers)", file=file)
+    for status, count in sorted(stats["statuses"].items(), key=lambda entry: -entry[1]):
+        print(f"  {status:<32} {count:>8}", file=file)
+    busy = ", ".join(f"{value / seconds:.0%}" for value in stats["shard_busy"]) if seconds else "-"
+    print(f"  written {stats['written']} rows in {stats['batches']} transactions", file=file)
+    print(f"  busy: checks {busy}, writer {stats['writer_busy'] / seconds if seconds else 0:.0%}", file=file)
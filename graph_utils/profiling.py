@@ -0,0 +1,430 @@
+'''
+    Profiling mode for the example scripts, the graph runs and the Chainlit apps.
+
+    The scripts don't have to be edited. Run any of them through this module:
+
+        python -m graph_utils.profiling 5_conditional_agent.py
+        python -m graph_utils.profiling --memory-interval 10 -m chainlit run 8_chainlit_api_agent.py
+        python -m graph_utils.profiling --whole 3_add_schema.py      # no graph: profile the whole script
+
+    The batch runner has the same switch: --profile, or GRAPH_PROFILE=1 in the environment. So does the Chainlit
+    app with a graph: GRAPH_PROFILE=1 chainlit run 8_chainlit_api_agent.py (7_chainlit_chat_ui.py has no graph).
+    GRAPH_PROFILE_DIR, GRAPH_PROFILE_TOP and GRAPH_PROFILE_MEMORY_INTERVAL give the defaults of the options.
+
+    Every graph run (LangGraph invoke / stream / ainvoke / astream and graph_utils/executor.py) gets its own files
+    in the output directory (default profiles/):
+    - run-0001-<graph>.prof             cProfile stats of the whole run (pstats, snakeviz, gprof2dot)
+    - run-0001-<graph>.node-<node>.prof cProfile stats of each node
+    - run-0001-<graph>.txt              wall and CPU time and memory per node, the top-N functions per node
+                                        and of the run, and with --memory the biggest allocations of the run
+    - memory-0001.snapshot              with --memory-interval, tracemalloc snapshots (tracemalloc.Snapshot.load)
+      memory.txt                        and the top-N differences between the consecutive snapshots
+    - summary.txt                       node totals over all the runs, written at exit
+
+    Only one cProfile profiler can be active at a time. Runs that start while another run is being profiled
+    (concurrent Chainlit sessions, subgraphs) are timed per node but their functions are counted in the
+    profile of the first run. A node is profiled on its own only when it runs in the thread the run started in
+    and no other node is running. Async runs: whatever else the event loop runs while a node awaits is counted
+    in that node too.
+'''
+
+import argparse
+import atexit
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import merge_configs
+
+
+# The run being profiled in the current context, nested runs (subgraphs) belong to it
+_current_run = contextvars.ContextVar("profiling_run", default=None)
+
+_profiler = None
+
+
+def _safe_name(name):
+    return "".join(char if char.isalnum() or char in "-_." else "_" for char in str(name))
+
+
+def _top_functions(profiles, top, sort="cumulative"):
+    profiles = [profile for profile in profiles if profile is not None]
+    if not profiles:
+        return "    (not profiled)\n"
+    out = io.StringIO()
+    # Profilers and Stats objects can be mixed
+    stats = pstats.Stats(stream=out)
+    stats.add(*profiles)
+    stats.sort_stats(sort).print_stats(top)
+    # Skip the header lines of pstats
+    lines = out.getvalue().splitlines()
+    start = next((index for index, line in enumerate(lines) if line.strip().startswith("ncalls")), 0)
+    return "\n".join("    " + line for line in lines[start:] if line.strip()) + "\n"
+
+
+class _NodeStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = 0
+        self.profiled = 0
+        self.profile = None
+
+
+class _Run:
+    def __init__(self, number, name, owner):
+        self.number = number
+        self.name = name
+        # The run that has the cProfile profiler, None if it's this one
+        self.owner = owner
+        self.thread = threading.get_ident()
+        self.profile = None
+        self.nodes = {}
+        # run id / node name -> (node name, start wall, start CPU, start memory, node profiler)
+        self.active_nodes = {}
+        self.snapshot = None
+        self.memory_differences = []
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    @property
+    def label(self):
+        return f"run-{self.number:04d}-{_safe_name(self.name)}"
+
+
+class _NodeCallback(BaseCallbackHandler):
+    # Called in the node's own thread / task
+    run_inline = True
+
+    def __init__(self, profiler, run):
+        self.profiler = profiler
+        self.run = run
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, name=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and node == name and not node.startswith("__"):
+            self.profiler.node_start(self.run, run_id, node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.profiler.node_end(self.run, run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.profiler.node_end(self.run, run_id)
+
+
+class Profiler:
+    def __init__(self, out_dir="profiles", top=20, memory=False, memory_interval=None, memory_frames=10):
+        self.out_dir = out_dir
+        self.top = top
+        self.memory = memory or bool(memory_interval)
+        self.memory_interval = memory_interval
+        os.makedirs(out_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._runs = 0
+        # The run that owns the cProfile profiler now
+        self._profiling = None
+        self._node_profiling = False
+        # Node name -> _NodeStats over all the runs
+        self.totals = {}
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(memory_frames)
+        self._stop = threading.Event()
+        if memory_interval:
+            threading.Thread(target=self._memory_snapshots, daemon=True).start()
+
+    # Runs
+
+    def start_run(self, graph):
+        if _current_run.get() is not None:
+            return None, None
+        with self._lock:
+            self._runs += 1
+            run = _Run(self._runs, getattr(graph, "name", None) or type(graph).__name__, self._profiling)
+            if self._profiling is None:
+                self._profiling = run
+        # The snapshot is taken before the profiler starts, it is slow
+        if self.memory:
+            run.snapshot = self._snapshot()
+        if run.owner is None:
+            run.profile = cProfile.Profile()
+            run.profile.enable()
+        return run, _current_run.set(run)
+
+    def finish_run(self, run, token):
+        if run is None:
+            return
+        _current_run.reset(token)
+        if run.profile is not None:
+            run.profile.disable()
+            with self._lock:
+                self._profiling = None
+        run.wall = time.perf_counter() - run.wall
+        run.cpu = time.process_time() - run.cpu
+        if run.snapshot is not None:
+            run.memory_differences = self._snapshot().compare_to(run.snapshot, "lineno")[:self.top]
+        self._write_run(run)
+
+    # Nodes
+
+    def node_start(self, run, key, node):
+        profile = None
+        # A node is profiled on its own when the run owns the profiler, the node runs in the run's thread
+        # and no other node is being profiled. The run's profiler is paused meanwhile
+        if run.profile is not None and threading.get_ident() == run.thread and not self._node_profiling:
+            run.profile.disable()
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._node_profiling = True
+            except ValueError:
+                profile = None
+                run.profile.enable()
+        memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        run.active_nodes[key] = (node, time.perf_counter(), time.process_time(), memory, profile)
+
+    def node_end(self, run, key):
+        entry = run.active_nodes.pop(key, None)
+        if entry is None:
+            return
+        node, wall, cpu, memory, profile = entry
+        if profile is not None:
+            profile.disable()
+            self._node_profiling = False
+            run.profile.enable()
+        for stats in (run.nodes.setdefault(node, _NodeStats()), self.totals.setdefault(node, _NodeStats())):
+            stats.calls += 1
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += time.process_time() - cpu
+            if self.memory:
+                stats.memory += tracemalloc.get_traced_memory()[0] - memory
+        if profile is not None:
+            stats = run.nodes[node]
+            stats.profiled += 1
+            if stats.profile is None:
+                stats.profile = pstats.Stats(profile)
+            else:
+                stats.profile.add(profile)
+
+    # Output
+
+    def _write_run(self, run):
+        path = os.path.join(self.out_dir, run.label)
+        run_profiles = []
+        if run.profile is not None:
+            # The nodes were profiled separately, the run's file has everything
+            run_stats = pstats.Stats(run.profile)
+            for node, stats in run.nodes.items():
+                if stats.profile is not None:
+                    stats.profile.dump_stats(f"{path}.node-{_safe_name(node)}.prof")
+                    run_stats.add(stats.profile)
+            run_stats.dump_stats(f"{path}.prof")
+            run_profiles.append(run_stats)
+
+        lines = [f"{run.label}: {run.wall:.3f} s wall, {run.cpu:.3f} s CPU"]
+        if run.owner is not None:
+            lines.append(f"Started while {run.owner.label} was profiled, its functions are in that profile")
+        lines.append("")
+        lines.append(f"{'node':<24} {'calls':>6} {'wall s':>9} {'CPU s':>9} {'memory KiB':>11} {'profiled':>9}")
+        for node, stats in run.nodes.items():
+            lines.append(f"{node:<24} {stats.calls:>6} {stats.wall:>9.3f} {stats.cpu:>9.3f} "
+                         f"{stats.memory / 1024:>11.1f} {stats.profiled:>9}")
+        for node, stats in run.nodes.items():
+            lines.append(f"\nTop {self.top} functions of node {node} (cumulative time)")
+            lines.append(_top_functions([stats.profile], self.top))
+        if run_profiles:
+            lines.append(f"\nTop {self.top} functions of the run (own time)")
+            lines.append(_top_functions(run_profiles, self.top, sort="tottime"))
+        if run.snapshot is not None:
+            lines.append(f"\nTop {self.top} memory differences over the run")
+            lines += [f"    {difference}" for difference in run.memory_differences]
+        with open(f"{path}.txt", "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    # Without the allocations of the profiling itself
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats, sys.modules[__name__])
+        ])
+
+    def _memory_snapshots(self):
+        previous = None
+        number = 0
+        while not self._stop.wait(self.memory_interval):
+            number += 1
+            snapshot = self._snapshot()
+            snapshot.dump(os.path.join(self.out_dir, f"memory-{number:04d}.snapshot"))
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"memory-{number:04d} at {time.strftime('%H:%M:%S')}: "
+                     f"{current / 1024:.1f} KiB traced, peak {peak / 1024:.1f} KiB"]
+            if previous is not None:
+                lines += [f"    {difference}" for difference in snapshot.compare_to(previous, "lineno")[:self.top]]
+            with open(os.path.join(self.out_dir, "memory.txt"), "a") as f:
+                f.write("\n".join(lines) + "\n\n")
+            previous = snapshot
+
+    def write_summary(self):
+        self._stop.set()
+        lines = [f"{self._runs} graph runs", "",
+                 f"{'node':<24} {'calls':>8} {'wall s':>10} {'CPU s':>10} {'wall ms/call':>13} {'memory KiB':>11}"]
+        for node, stats in sorted(self.totals.items(), key=lambda item: item[1].wall, reverse=True):
+            lines.append(f"{node:<24} {stats.calls:>8} {stats.wall:>10.3f} {stats.cpu:>10.3f} "
+                         f"{stats.wall / stats.calls * 1000:>13.2f} {stats.memory / 1024:>11.1f}")
+        with open(os.path.join(self.out_dir, "summary.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Profiles of {self._runs} graph runs in {self.out_dir}/", file=sys.stderr)
+
+
+# Hooks
+
+def _patch_langgraph(profiler):
+    from langgraph.pregel import Pregel
+
+    # invoke() and ainvoke() go through stream() and astream()
+    stream, astream = Pregel.stream, Pregel.astream
+
+    @functools.wraps(stream)
+    def profiled_stream(graph, input, config=None, **kwargs):
+        run, token = profiler.start_run(graph)
+        if run is None:
+            yield from stream(graph, input, config, **kwargs)
+            return
+        try:
+            yield from stream(graph, input, merge_configs(config, {"callbacks": [_NodeCallback(profiler, run)]}),
+                              **kwargs)
+        finally:
+            profiler.finish_run(run, token)
+
+    @functools.wraps(astream)
+    async def profiled_astream(graph, input, config=None, **kwargs):
+        run, token = profiler.start_run(graph)
+        if run is None:
+            async for chunk in astream(graph, input, config, **kwargs):
+                yield chunk
+            return
+        try:
+            async for chunk in astream(graph, input,
+                                       merge_configs(config, {"callbacks": [_NodeCallback(profiler, run)]}),
+                                       **kwargs):
+                yield chunk
+        finally:
+            profiler.finish_run(run, token)
+
+    Pregel.stream, Pregel.astream = profiled_stream, profiled_astream
+
+
+def _patch_executor(profiler):
+    from graph_utils import executor
+
+    invoke = executor.CompiledGraph.invoke
+
+    def profiled_node(name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            run = _current_run.get()
+            if run is None:
+                return function(*args, **kwargs)
+            profiler.node_start(run, name, name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.node_end(run, name)
+
+        return wrapper
+
+    @functools.wraps(invoke)
+    def profiled_invoke(graph, input, config=None):
+        if not getattr(graph, "_profiled_nodes", False):
+            graph.nodes = {name: (profiled_node(name, function), takes_config)
+                           for name, (function, takes_config) in graph.nodes.items()}
+            graph._profiled_nodes = True
+        run, token = profiler.start_run(graph)
+        try:
+            return invoke(graph, input, config)
+        finally:
+            profiler.finish_run(run, token)
+
+    executor.CompiledGraph.invoke = profiled_invoke
+
+
+def enable(out_dir="profiles", top=20, memory=False, memory_interval=None):
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(out_dir, top, memory, memory_interval)
+        _patch_langgraph(_profiler)
+        _patch_executor(_profiler)
+        atexit.register(_profiler.write_summary)
+    return _profiler
+
+
+def env_options():
+    interval = os.getenv("GRAPH_PROFILE_MEMORY_INTERVAL")
+    return {
+        "out_dir": os.getenv("GRAPH_PROFILE_DIR", "profiles"),
+        "top": int(os.getenv("GRAPH_PROFILE_TOP", "20")),
+        "memory_interval": float(interval) if interval else None,
+    }
+
+
+# GRAPH_PROFILE=1 turns profiling on
+def enable_from_env():
+    if os.getenv("GRAPH_PROFILE", "").lower() in ("1", "true", "yes"):
+        return enable(**env_options())
+    return None
+
+
+def main():
+    defaults = env_options()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=defaults["out_dir"], help="Output directory")
+    parser.add_argument("--top", type=int, default=defaults["top"], help="Functions listed per node and run")
+    parser.add_argument("--memory", action="store_true", help="tracemalloc: memory per node, allocations per run")
+    parser.add_argument("--memory-interval", type=float, default=defaults["memory_interval"],
+                        help="Seconds between tracemalloc snapshots (implies --memory)")
+    parser.add_argument("--whole", action="store_true", help="Profile the whole script as one run")
+    parser.add_argument("-m", dest="module", help="Run a module, ie. -m chainlit run 7_chainlit_chat_ui.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="The script and its arguments")
+    args = parser.parse_args()
+    if not args.module and not args.args:
+        parser.error("give a script or -m module")
+
+    # The script sees its own name and arguments, and imports the helper packages from its directory
+    sys.argv = [args.module or args.args[0]] + args.args[0 if args.module else 1:]
+    if not args.module:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.args[0])))
+
+    def run_script():
+        if args.module:
+            runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+        else:
+            runpy.run_path(args.args[0], run_name="__main__")
+
+    if not args.whole:
+        enable(args.out, args.top, args.memory, args.memory_interval)
+        run_script()
+        return
+
+    os.makedirs(args.out, exist_ok=True)
+    name = _safe_name(os.path.basename(args.module or args.args[0]))
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(run_script)
+    finally:
+        profile.dump_stats(os.path.join(args.out, f"{name}.prof"))
+        with open(os.path.join(args.out, f"{name}.txt"), "w") as f:
+            f.write(f"Top {args.top} functions of {name} (cumulative time)\n")
+            f.write(_top_functions([profile], args.top))
+        print(f"Profile of {name} in {args.out}/", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+'''
+    Tool execution for the agents.
+
+    ToolRegistry is built once from the tools. It is used for:
+    - looking up tools by name (no dict built on every tool call)
+    - binding the tools to a model, cached per model like structured_output.bind()
+    - running all the tool calls of one model answer concurrently: sync tools in a thread pool,
+      async tools with asyncio.gather. Every call has a timeout, a slow or failing tool answers with an error
+      message instead of stopping the agent (the model can then react to it)
+    - calls of tools with a vectorized batch implementation (batch_tools.py) are coalesced into one NumPy call,
+      run in the thread pool with the same timeout
+
+    The model <-> tools loop as a graph (see 6.2_LLM_with_tools.py):
+
+        registry = ToolRegistry([bad_add_tool], timeout=10)
+        workflow.add_node("agent", agent)             # model with registry.bind(model), returns the AI message
+        workflow.add_node("tools", registry.node)     # runs the tool calls of the last message
+        workflow.add_conditional_edges("agent", registry.route)   # "tools" while the model asks for tools, else END
+        workflow.add_edge("tools", "agent")
+
+    Without a graph: await registry.run_agent(model, messages)
+
+    Note: a sync tool that times out keeps its thread until it returns, Python threads can't be killed.
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import ToolMessage
+from langgraph.graph import END
+
+from graph_utils import batch_tools
+
+
+class ToolRegistry:
+    def __init__(self, tools, timeout=30.0, timeouts=None, max_workers=16):
+        self.tools = {tool.name.lower(): tool for tool in tools}
+        # Default timeout in seconds and overrides per tool name
+        self.timeout = timeout
+        self.timeouts = {name.lower(): seconds for name, seconds in (timeouts or {}).items()}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        # (id(model), model, bound model), see structured_output.bind()
+        self._bound = {}
+        # Collects the calls of tools with a batch implementation, shared by all the runs using this registry.
+        # The batches run in the pool, so they have the tool's timeout like the other calls
+        self.coalescer = batch_tools.Coalescer(executor=self.pool)
+
+    def bind(self, model):
+        cached = self._bound.get(id(model))
+        if cached is not None and cached[0] is model:
+            return cached[1]
+        bound = model.bind_tools(list(self.tools.values()))
+        self._bound[id(model)] = (model, bound)
+        return bound
+
+    def _error(self, tool_call, text):
+        return ToolMessage(content=text, name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+
+    async def _call(self, tool_call):
+        name = tool_call["name"].lower()
+        tool = self.tools.get(name)
+        if tool is None:
+            return self._error(tool_call, f"Unknown tool '{tool_call['name']}'. Available tools: {', '.join(self.tools)}")
+
+        tool_call = {**tool_call, "type": "tool_call"}
+        if tool.coroutine is not None:
+            call = tool.ainvoke(tool_call)
+        else:
+            call = asyncio.get_running_loop().run_in_executor(self.pool, tool.invoke, tool_call)
+        timeout = self.timeouts.get(name, self.timeout)
+        try:
+            return await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            return self._error(tool_call, f"Tool '{tool_call['name']}' didn't answer in {timeout} s")
+        except Exception as e:
+            return self._error(tool_call, f"Tool '{tool_call['name']}' failed: {type(e).__name__}: {e}")
+
+    # All the calls of one tool with a batch implementation, as one entry of the coalescer
+    async def _call_batch(self, tool, tool_calls):
+        timeout = self.timeouts.get(tool.name.lower(), self.timeout)
+        try:
+            results = await asyncio.wait_for(
+                self.coalescer.ainvoke_many(tool, [tool_call["args"] for tool_call in tool_calls]), timeout=timeout)
+        except asyncio.TimeoutError:
+            return [self._error(tool_call, f"Tool '{tool_call['name']}' didn't answer in {timeout} s")
+                    for tool_call in tool_calls]
+        except Exception as e:
+            return [self._error(tool_call, f"Tool '{tool_call['name']}' failed: {type(e).__name__}: {e}")
+                    for tool_call in tool_calls]
+        messages = []
+        for tool_call, result in zip(tool_calls, results):
+            if isinstance(result, Exception):
+                messages.append(self._error(tool_call, f"Tool '{tool_call['name']}' failed: {type(result).__name__}: {result}"))
+            else:
+                messages.append(ToolMessage(content=str(result), name=tool.name, tool_call_id=tool_call["id"]))
+        return messages
+
+    # Runs the tool calls concurrently, the answers are in the same order as the calls
+    async def arun(self, tool_calls):
+        single, batched = [], {}
+        for index, tool_call in enumerate(tool_calls):
+            tool = self.tools.get(tool_call["name"].lower())
+            if tool is not None and batch_tools.has_batch(tool):
+                batched.setdefault(tool.name, (tool, []))[1].append(index)
+            else:
+                single.append(index)
+
+        answers = await asyncio.gather(
+            *(self._call(tool_calls[index]) for index in single),
+            *(self._call_batch(tool, [tool_calls[index] for index in indexes]) for tool, indexes in batched.values()),
+        )
+        messages = [None] * len(tool_calls)
+        for index, message in zip(single, answers):
+            messages[index] = message
+        for (tool, indexes), batch_messages in zip(batched.values(), answers[len(single):]):
+            for index, message in zip(indexes, batch_messages):
+                messages[index] = message
+        return messages
+
+    def run(self, tool_calls):
+        return asyncio.run(self.arun(tool_calls))
+
+    # Graph node: answers the tool calls of the last message in state["messages"]
+    async def node(self, state):
+        return {"messages": await self.arun(state["messages"][-1].tool_calls)}
+
+    # Router after the model's node
+    def route(self, state):
+        return "tools" if getattr(state["messages"][-1], "tool_calls", None) else END
+
+    # The same loop without a graph. Returns the messages of the whole conversation
+    async def run_agent(self, model, messages, max_turns=10):
+        model = self.bind(model)
+        messages = list(messages)
+        for _ in range(max_turns):
+            ai_message = await model.ainvoke(messages)
+            messages.append(ai_message)
+            if not ai_message.tool_calls:
+                break
+            messages.extend(await self.arun(ai_message.tool_calls))
+        return messages
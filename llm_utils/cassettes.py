@@ -0,0 +1,240 @@
+'''
+    Recorded model answers (cassettes) for reproducible, offline runs.
+
+    A cassette is plugged in as the model's LangChain cache. In record mode every call goes to the provider
+    and the answer is appended to the cassette with its latency. In replay mode the answers come from the
+    cassette and a call that wasn't recorded raises CassetteMiss, so the provider is never called:
+
+        model = cassettes.use(models.get_model("openai:gpt-4o-mini"), "cassettes/openai.jsonl", "record")
+        ...
+        model = cassettes.use(models.get_model("openai:gpt-4o-mini"), "cassettes/openai.jsonl")   # replay
+
+    - A call is matched by its messages and the model's settings including the bound tools / schema,
+      so the same prompts, schemas and graphs give the same calls when replayed
+    - A prompt recorded several times keeps all the answers (takes). Replay serves them in the recorded
+      order and starts over when they run out, so a prompt asked N times gives the same N answers
+    - The recorded latency is slept times `speed` when replaying (0 = instant). Every call served or
+      recorded is listed in `calls` as (latency seconds, prompt tokens, completion tokens)
+    - Mode "auto" replays what is recorded and records the rest
+    - A failed call is recorded too, as a take with the error's type and message. Replay raises it again as
+      RecordedError, so the failure rates stay the same offline. Errors are recorded through a callback
+      of the model (the cache isn't told about failed calls): use() adds it when recording
+    - A cassette is a JSON lines file, one answer or error per line
+
+    To record a whole script or app without changing it, including non-LLM HTTP APIs, use the HTTP
+    cassettes of llm_utils/http_cassettes.py instead. Its docstring compares the two.
+'''
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.load import dumpd, dumps
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+
+REPLAY, RECORD, AUTO = "replay", "record", "auto"
+
+# The classes a cassette holds, the answers are revived only into these
+_CLASSES = {cls.__name__: cls for cls in (Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk)}
+
+
+class CassetteMiss(KeyError):
+    pass
+
+
+# A recorded failure of the provider, replayed. error_type is the name of the original exception's class
+class RecordedError(Exception):
+    def __init__(self, error_type, message):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+def call_key(prompt, llm_string):
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+
+# An answer stored with dumpd() back to its objects. Not langchain_core's load(): it is marked beta and
+# newer versions warn on every call without an allowlist, the allowlist here is _CLASSES
+def _revive(value):
+    if isinstance(value, list):
+        return [_revive(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if value.get("lc") == 1 and "type" in value:
+        cls = _CLASSES.get(value.get("id", [""])[-1]) if value["type"] == "constructor" else None
+        if cls is None:
+            raise ValueError(f"Can't replay {value.get('type')} {value.get('id')} from a cassette")
+        return cls(**_revive(value.get("kwargs", {})))
+    return {key: _revive(item) for key, item in value.items()}
+
+
+def _usage(generations):
+    prompt = completion = 0
+    for generation in generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+        prompt += usage.get("input_tokens", 0)
+        completion += usage.get("output_tokens", 0)
+    return prompt, completion
+
+
+class Cassette(BaseCache):
+    def __init__(self, path, mode=REPLAY, speed=0.0):
+        if mode not in (REPLAY, RECORD, AUTO):
+            raise ValueError(f"Unknown cassette mode '{mode}', use {REPLAY}, {RECORD} or {AUTO}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        # key -> recorded takes: (latency, generations, error). error is {"type", "message"} for a failed call
+        self._takes = defaultdict(list)
+        # key -> index of the next take to replay
+        self._next = defaultdict(int)
+        # key -> start times of the calls being recorded
+        self._started = defaultdict(deque)
+        # prompt -> keys of the calls being recorded, for finding the call of an error
+        self._recording = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.calls = []
+        # Calls that weren't recorded (replay mode)
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._takes[entry["key"]].append((entry["latency"], entry.get("generations"), entry.get("error")))
+
+    # Number of recorded answers. Not __len__: the model skips a cache that is falsy
+    def recorded(self):
+        return sum(len(takes) for takes in self._takes.values())
+
+    def _replay(self, prompt, llm_string):
+        key = call_key(prompt, llm_string)
+        with self._lock:
+            takes = self._takes.get(key)
+            if takes and self.mode != RECORD:
+                index = self._next[key]
+                self._next[key] = index + 1
+                latency, generations, error = takes[index % len(takes)]
+                if error is not None:
+                    self.calls.append((latency, 0, 0))
+                    return latency, None, RecordedError(error["type"], error["message"])
+                generations = [_revive(generation) for generation in generations]
+                self.calls.append((latency, *_usage(generations)))
+                return latency, generations, None
+            if self.mode == REPLAY:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded answer in {self.path} for the call (key {key[:12]}). "
+                                   f"Record it first with mode '{RECORD}' or '{AUTO}'")
+            self._started[key].append(time.perf_counter())
+            self._recording[prompt].append(key)
+        return None, None, None
+
+    def lookup(self, prompt, llm_string):
+        latency, generations, error = self._replay(prompt, llm_string)
+        if (generations is not None or error is not None) and self.speed:
+            time.sleep(latency * self.speed)
+        if error is not None:
+            raise error
+        return generations
+
+    async def alookup(self, prompt, llm_string):
+        latency, generations, error = self._replay(prompt, llm_string)
+        if (generations is not None or error is not None) and self.speed:
+            await asyncio.sleep(latency * self.speed)
+        if error is not None:
+            raise error
+        return generations
+
+    # Seconds since the oldest call of the key being recorded started. Call with the lock held
+    def _finish(self, prompt, key):
+        started = self._started[key]
+        recording = self._recording[prompt]
+        if key in recording:
+            recording.remove(key)
+        if not recording:
+            del self._recording[prompt]
+        return time.perf_counter() - started.popleft() if started else 0.0
+
+    # Call with the lock held
+    def _append(self, entry):
+        self._takes[entry["key"]].append((entry["latency"], entry.get("generations"), entry.get("error")))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    # Called by the model after a call that wasn't replayed
+    def update(self, prompt, llm_string, return_val):
+        key = call_key(prompt, llm_string)
+        with self._lock:
+            latency = self._finish(prompt, key)
+            self.calls.append((latency, *_usage(return_val)))
+            self._append({"key": key, "latency": round(latency, 4),
+                          "generations": [dumpd(generation) for generation in return_val]})
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        self.update(prompt, llm_string, return_val)
+
+    # A call that was being recorded failed. prompt is the call's messages as the cache sees them (dumps).
+    # The same messages in flight with other settings (another schema) can't be told apart here,
+    # the oldest of them gets the error
+    def record_error(self, prompt, error):
+        with self._lock:
+            recording = self._recording.get(prompt)
+            if not recording:
+                return
+            key = recording[0]
+            latency = self._finish(prompt, key)
+            self.calls.append((latency, 0, 0))
+            self._append({"key": key, "latency": round(latency, 4),
+                          "error": {"type": type(error).__name__, "message": str(error)}})
+
+    # Only forgets the replay positions, recordings are removed by deleting the file
+    def clear(self, **kwargs):
+        with self._lock:
+            self._next.clear()
+
+
+# Tells the cassette about the model's failed calls. Runs inline: the error must be recorded before the
+# caller sees it, a replay right after has to find it
+class _ErrorRecorder(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+        # run_id -> the call's messages
+        self._prompts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        # One run per prompt, the cache gets the same dumps() of the messages
+        self._prompts[run_id] = dumps(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._prompts.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        prompt = self._prompts.pop(run_id, None)
+        # Not a cancelled call
+        if prompt is not None and isinstance(error, Exception) and not isinstance(error, RecordedError):
+            self.cassette.record_error(prompt, error)
+
+
+# Plays the model's calls from a cassette (path or Cassette). Returns the model
+def use(model, cassette, mode=REPLAY, speed=0.0):
+    if not isinstance(cassette, Cassette):
+        cassette = Cassette(cassette, mode, speed)
+    model.cache = cassette
+    callbacks = [callback for callback in model.callbacks or [] if not isinstance(callback, _ErrorRecorder)]
+    if cassette.mode != REPLAY:
+        callbacks.append(_ErrorRecorder(cassette))
+    model.callbacks = callbacks
+    return model
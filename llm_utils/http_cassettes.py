@@ -0,0 +1,400 @@
+'''
+    Record / replay of the outbound HTTP traffic: the OpenAI and Cohere clients, the API client of
+    8_chainlit_api_agent.py and anything else using httpx or requests.
+
+    In record mode the requests go out and every answer is stored in a cassette. In replay mode the answers
+    come from the cassette and the network is never touched: a request that wasn't recorded raises
+    CassetteMiss. Any script, graph or Chainlit app can be run against a cassette without editing it:
+
+        python -m llm_utils.http_cassettes --mode record cassettes/jokes.db 5_conditional_agent.py
+        python -m llm_utils.http_cassettes cassettes/jokes.db 5_conditional_agent.py          # replay
+        python -m llm_utils.http_cassettes --mode auto cassettes/api.db -m chainlit run 8_chainlit_api_agent.py
+        python -m llm_utils.http_cassettes --list cassettes/jokes.db
+
+    Or in code: install("cassettes/jokes.db", "replay"), or the transports for one client:
+    httpx.Client(transport=RecordingTransport(cassette)). HTTP_CASSETTE=<file> (and HTTP_CASSETTE_MODE)
+    in the environment installs the cassette in the apps and the batch runner, see install_from_env().
+
+    Matching (Matcher): a request is identified by its method, normalized URL and body
+    - URL: scheme and host lower case, default port dropped, query parameters sorted, the ones in
+      ignore_query (keys, tokens, timestamps) left out
+    - JSON bodies are compared as data (key order and white space don't matter), keys in ignore_json are
+      left out. Other bodies are compared as bytes
+    - Headers are not matched unless listed in match_headers (user agents, retry counts and idempotency
+      keys change between runs)
+    A request sent several times keeps all the answers (takes), replayed in order and from the start again
+    when they run out.
+
+    The cassette is a SQLite file, one row per answer indexed by the request key. The bodies are zlib
+    compressed, credentials (Authorization, API key headers, cookies) are never stored. Replay reads the
+    answers of a key once and serves them from memory.
+
+    Which cassette: this one or the model cassettes of llm_utils/cassettes.py. Both use the same modes and
+    raise the same CassetteMiss.
+    - HTTP cassettes (this module) replay a whole process without touching its code: every client, also
+      the non-LLM APIs (the joke API of example 8), streamed answers and HTTP errors with their status
+      codes (retries run as they did). Requests are matched on the wire, so an upgrade of the provider's
+      client library that changes the request bodies makes the old recordings miss
+    - Model cassettes are plugged into one model in code (cassettes.use). A call is matched by its
+      messages and the model's settings, not by the bytes a client sends, so the recordings don't depend
+      on the client library. They keep the token usage and provider errors of every call, in a JSON lines
+      file that is easy to read and diff. Used by the provider comparison benchmark
+    Use one of them for a given model: a call answered by a model cassette never reaches the HTTP layer.
+'''
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import runpy
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+from llm_utils.cassettes import AUTO, RECORD, REPLAY, CassetteMiss
+
+
+# Never written into a cassette
+_SECRET_HEADERS = {"authorization", "api-key", "x-api-key", "cookie", "set-cookie", "openai-organization",
+                   "openai-project", "proxy-authorization"}
+# The stored body is already decoded and its length is known again when replayed
+_BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+_SKIPPED_HEADERS = _SECRET_HEADERS | _BODY_HEADERS
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class Matcher:
+    def __init__(self, ignore_query=("api_key", "key", "token", "access_token", "timestamp", "ts", "_"),
+                 ignore_json=(), match_headers=()):
+        self.ignore_query = set(ignore_query)
+        self.ignore_json = set(ignore_json)
+        self.match_headers = [header.lower() for header in match_headers]
+        # URL -> normalized URL, a replayed session asks for the same URLs again and again
+        self._urls = {}
+
+    def url(self, url):
+        normalized = self._urls.get(url)
+        if normalized is None:
+            if len(self._urls) >= 4096:
+                self._urls.clear()
+            normalized = self._urls[url] = self._normalize(url)
+        return normalized
+
+    def _normalize(self, url):
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        if parts.port and parts.port != _DEFAULT_PORTS.get(parts.scheme.lower()):
+            host = f"{host}:{parts.port}"
+        query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if name not in self.ignore_query)
+        return urlunsplit((parts.scheme.lower(), host, parts.path or "/", urlencode(query), ""))
+
+    def body(self, body):
+        if not body:
+            return b""
+        try:
+            data = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return body
+        if isinstance(data, dict) and self.ignore_json:
+            data = {name: value for name, value in data.items() if name not in self.ignore_json}
+        return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+    def key(self, method, url, headers, body):
+        digest = hashlib.sha256(f"{method.upper()} {self.url(url)}\n".encode())
+        for header in self.match_headers:
+            digest.update(f"{header}: {headers.get(header, '')}\n".encode())
+        digest.update(self.body(body))
+        return digest.hexdigest()
+
+
+def _stored_headers(headers):
+    return [(name, value) for name, value in headers if name.lower() not in _SKIPPED_HEADERS]
+
+
+class HttpCassette:
+    def __init__(self, path, mode=REPLAY, matcher=None, speed=0.0):
+        if mode not in (REPLAY, RECORD, AUTO):
+            raise ValueError(f"Unknown cassette mode '{mode}', use {REPLAY}, {RECORD} or {AUTO}")
+        self.path = path
+        self.mode = mode
+        self.matcher = matcher or Matcher()
+        self.speed = speed
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS interactions (
+                key TEXT NOT NULL,
+                take INTEGER NOT NULL,
+                method TEXT NOT NULL,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                latency REAL NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (key, take)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        # key -> recorded answers: (status, headers, body, latency)
+        self._takes = {}
+        # key -> index of the next take to replay
+        self._next = {}
+        self.stats = {"replayed": 0, "recorded": 0, "misses": 0}
+
+    def _load(self, key):
+        takes = self._takes.get(key)
+        if takes is None:
+            rows = self._conn.execute(
+                "SELECT status, headers, body, latency FROM interactions WHERE key = ? ORDER BY take", (key,)
+            ).fetchall()
+            takes = [(status, json.loads(headers), zlib.decompress(body), latency)
+                     for status, headers, body, latency in rows]
+            self._takes[key] = takes
+        return takes
+
+    # The next recorded answer (status, headers, body, latency), or None when the request must go out
+    def replay(self, key, method, url):
+        with self._lock:
+            takes = self._load(key)
+            if takes and self.mode != RECORD:
+                index = self._next.get(key, 0)
+                self._next[key] = index + 1
+                self.stats["replayed"] += 1
+                return takes[index % len(takes)]
+            if self.mode == REPLAY:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"No recorded answer in {self.path} for {method} {url} (key {key[:12]}). "
+                                   f"Record it first with mode '{RECORD}' or '{AUTO}'")
+        return None
+
+    def record(self, key, method, url, status, headers, body, latency):
+        headers = _stored_headers(headers)
+        with self._lock:
+            takes = self._load(key)
+            self._conn.execute(
+                "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, len(takes), method, self.matcher.url(url), status, json.dumps(headers),
+                 zlib.compress(body), latency, time.time()),
+            )
+            self._conn.commit()
+            takes.append((status, headers, body, latency))
+            self.stats["recorded"] += 1
+
+    def _key(self, request):
+        return self.matcher.key(request.method, str(request.url), request.headers, request.content)
+
+    @staticmethod
+    def _response(request, answer):
+        status, headers, body, _ = answer
+        return httpx.Response(status, headers=headers, content=body, request=request)
+
+    # httpx: send(request) -> response of the real transport
+    def handle(self, request, send):
+        request.read()
+        key = self._key(request)
+        answer = self.replay(key, request.method, str(request.url))
+        if answer is not None:
+            if self.speed:
+                time.sleep(answer[3] * self.speed)
+            return self._response(request, answer)
+        start = time.perf_counter()
+        response = send(request)
+        body = response.read()
+        latency = time.perf_counter() - start
+        response.close()
+        self.record(key, request.method, str(request.url), response.status_code, response.headers.multi_items(),
+                    body, latency)
+        return self._response(request, (response.status_code, _stored_headers(response.headers.multi_items()),
+                                        body, latency))
+
+    async def ahandle(self, request, send):
+        await request.aread()
+        key = self._key(request)
+        answer = self.replay(key, request.method, str(request.url))
+        if answer is not None:
+            if self.speed:
+                await asyncio.sleep(answer[3] * self.speed)
+            return self._response(request, answer)
+        start = time.perf_counter()
+        response = await send(request)
+        body = await response.aread()
+        latency = time.perf_counter() - start
+        await response.aclose()
+        self.record(key, request.method, str(request.url), response.status_code, response.headers.multi_items(),
+                    body, latency)
+        return self._response(request, (response.status_code, _stored_headers(response.headers.multi_items()),
+                                        body, latency))
+
+    # requests: send() -> response of the real adapter
+    def handle_requests(self, request, send):
+        import requests
+
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        key = self.matcher.key(request.method, request.url, {k.lower(): v for k, v in request.headers.items()}, body)
+        answer = self.replay(key, request.method, request.url)
+        if answer is None:
+            start = time.perf_counter()
+            response = send()
+            latency = time.perf_counter() - start
+            headers = list(response.raw.headers.items()) if response.raw is not None else list(response.headers.items())
+            answer = (response.status_code, _stored_headers(headers), response.content, latency)
+            self.record(key, request.method, request.url, *answer)
+        elif self.speed:
+            time.sleep(answer[3] * self.speed)
+        status, headers, content, _ = answer
+        response = requests.models.Response()
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = ""
+        return response
+
+    # Rows of (method, url, status, takes, stored bytes)
+    def interactions(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT method, url, status, COUNT(*), SUM(LENGTH(body)) FROM interactions "
+                "GROUP BY key ORDER BY MIN(recorded_at)"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        return self.cassette.handle(request, self.inner.handle_request)
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        return await self.cassette.ahandle(request, self.inner.handle_async_request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+_installed = None
+_originals = {}
+
+
+# Sends every httpx and requests request of the process through the cassette (path or HttpCassette)
+def install(cassette, mode=REPLAY, matcher=None, speed=0.0):
+    global _installed
+    if not isinstance(cassette, HttpCassette):
+        cassette = HttpCassette(cassette, mode, matcher, speed)
+    if _installed is None:
+        _originals["httpx"] = (httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request)
+        handle_request, handle_async_request = _originals["httpx"]
+
+        def patched_handle_request(transport, request):
+            return _installed.handle(request, lambda request: handle_request(transport, request))
+
+        async def patched_handle_async_request(transport, request):
+            return await _installed.ahandle(request, lambda request: handle_async_request(transport, request))
+
+        httpx.HTTPTransport.handle_request = patched_handle_request
+        httpx.AsyncHTTPTransport.handle_async_request = patched_handle_async_request
+
+        # requests is optional, only the benchmarks use it
+        try:
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            pass
+        else:
+            send = _originals["requests"] = HTTPAdapter.send
+
+            def patched_send(adapter, request, **kwargs):
+                return _installed.handle_requests(request, lambda: send(adapter, request, **kwargs))
+
+            HTTPAdapter.send = patched_send
+    _installed = cassette
+    return cassette
+
+
+def uninstall():
+    global _installed
+    if _installed is None:
+        return
+    httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request = _originals.pop("httpx")
+    if "requests" in _originals:
+        from requests.adapters import HTTPAdapter
+
+        HTTPAdapter.send = _originals.pop("requests")
+    _installed.close()
+    _installed = None
+
+
+# HTTP_CASSETTE=<file> installs the cassette, HTTP_CASSETTE_MODE=replay|record|auto (default replay)
+def install_from_env():
+    path = os.getenv("HTTP_CASSETTE")
+    if path:
+        return install(path, os.getenv("HTTP_CASSETTE_MODE", REPLAY))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=[REPLAY, RECORD, AUTO], default=os.getenv("HTTP_CASSETTE_MODE", REPLAY))
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay the recorded latencies times this")
+    parser.add_argument("--list", action="store_true", help="List the recorded requests of the cassette")
+    parser.add_argument("-m", dest="module", help="Run a module, ie. -m chainlit run 8_chainlit_api_agent.py")
+    parser.add_argument("cassette")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="The script and its arguments")
+    args = parser.parse_args()
+
+    if args.list:
+        cassette = HttpCassette(args.cassette)
+        for method, url, status, takes, size in cassette.interactions():
+            print(f"{method:<6} {status:>3} {takes:>4} takes {size:>9} bytes  {url}")
+        cassette.close()
+        return
+    if not args.module and not args.args:
+        parser.error("give a script or -m module")
+
+    cassette = install(args.cassette, args.mode, speed=args.speed)
+    # Same as graph_utils.profiling: the script sees its own name and arguments
+    sys.argv = [args.module or args.args[0]] + args.args[0 if args.module else 1:]
+    try:
+        if args.module:
+            runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+        else:
+            sys.path.insert(0, os.path.dirname(os.path.abspath(args.args[0])))
+            runpy.run_path(args.args[0], run_name="__main__")
+    finally:
+        print(f"\nHTTP cassette {args.cassette} ({args.mode}): {cassette.stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
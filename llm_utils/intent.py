@@ -0,0 +1,177 @@
+'''
+    Local intent classifier for routing a message to a single schema.
+
+    3.1_Multiple_schemas.py lets the model choose between schemas with a Union: every request carries all
+    the schemas, the answer depends on their order in the Union and Cohere can't handle it at all.
+    The classifier decides "joke" or "conversation" locally in microseconds, and the model is called
+    with only the matching schema:
+
+        schema = {"joke": FunnySchema, "conversation": ConversationalSchema}[intent.classify(message)]
+        structured_llm = structured_output.bind(model, schema)
+
+    - Features: TF-IDF of words, word pairs and character trigrams of the words ("jokes" ~ "joke")
+    - Model: multinomial logistic regression trained with NumPy (gradient descent with L2 regularization)
+    - The default classifier is trained from EXAMPLES on first use, which takes some milliseconds
+'''
+
+import re
+
+import numpy as np
+
+
+# Small labeled training set. Add examples here when a message is routed wrong
+EXAMPLES = [
+    ("Tell me a joke about cows", "joke"),
+    ("Tell me a joke", "joke"),
+    ("Make a joke about cats", "joke"),
+    ("Do you know any good jokes?", "joke"),
+    ("Say something funny about programmers", "joke"),
+    ("I need a pun about coffee", "joke"),
+    ("Give me a dad joke", "joke"),
+    ("Make me laugh", "joke"),
+    ("Joke about the weather please", "joke"),
+    ("Can you tell a funny story about dogs", "joke"),
+    ("A knock knock joke about doors", "joke"),
+    ("Something hilarious about Mondays", "joke"),
+    ("Roast my cooking skills", "joke"),
+    ("Write a one-liner about lawyers", "joke"),
+    ("Tell a joke about Finland", "joke"),
+    ("I want to hear a joke about space", "joke"),
+    ("Cheer me up with a joke", "joke"),
+    ("Give me a pun on bananas", "joke"),
+    ("Got any jokes about math?", "joke"),
+    ("Make fun of the rain", "joke"),
+    ("Be funny about airports", "joke"),
+    ("Humor me with something about cheese", "joke"),
+    ("Tell me something funny", "joke"),
+    ("Crack a joke about computers", "joke"),
+    ("Joke: elephants", "joke"),
+    ("funny joke about teachers", "joke"),
+    ("Can I get a joke about pizza", "joke"),
+    ("Limerick about a cat please", "joke"),
+    ("Make a silly joke about fish", "joke"),
+    ("Lighten the mood with a joke about meetings", "joke"),
+    ("What is the capital of Finland", "conversation"),
+    ("How are you today?", "conversation"),
+    ("What time is it in Tokyo?", "conversation"),
+    ("Explain how photosynthesis works", "conversation"),
+    ("Who wrote Hamlet?", "conversation"),
+    ("Can you help me with my homework?", "conversation"),
+    ("What is the weather like in Helsinki", "conversation"),
+    ("How do I cook pasta?", "conversation"),
+    ("Hello there", "conversation"),
+    ("Thanks for the help", "conversation"),
+    ("What does a cow eat?", "conversation"),
+    ("Translate good morning to Finnish", "conversation"),
+    ("How many legs does a spider have", "conversation"),
+    ("Recommend a good book", "conversation"),
+    ("What is the meaning of life", "conversation"),
+    ("Why is the sky blue?", "conversation"),
+    ("Summarize the plot of Star Wars", "conversation"),
+    ("How far is the moon", "conversation"),
+    ("What is your name?", "conversation"),
+    ("Can you explain recursion", "conversation"),
+    ("Where is the Eiffel tower", "conversation"),
+    ("How do computers store numbers?", "conversation"),
+    ("What should I eat for dinner", "conversation"),
+    ("Is it going to rain tomorrow", "conversation"),
+    ("Good morning", "conversation"),
+    ("Which programming language should I learn first", "conversation"),
+    ("What are the benefits of coffee", "conversation"),
+    ("How tall is Mount Everest", "conversation"),
+    ("Tell me about the history of Rome", "conversation"),
+    ("What do cats like to play with", "conversation"),
+]
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+# Words, word pairs and character trigrams of the words
+def features(text):
+    words = _WORD.findall(text.lower())
+    result = list(words)
+    result.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    for word in words:
+        padded = f"<{word}>"
+        result.extend(padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+
+class IntentClassifier:
+    def __init__(self, epochs=300, learning_rate=2.0, l2=1e-3):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.labels = []
+        self.vocabulary = {}
+        self.idf = None
+        self.weights = None
+        self.bias = None
+
+    # Feature indexes and TF-IDF values of a text, L2 normalized. Unknown features are left out
+    def _vector(self, text):
+        counts = {}
+        for feature in features(text):
+            index = self.vocabulary.get(feature)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+        indexes = np.fromiter(counts, dtype=np.intp, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * self.idf[indexes]
+        norm = np.sqrt(values @ values)
+        return indexes, values / norm if norm else values
+
+    def fit(self, texts, labels):
+        self.labels = sorted(set(labels))
+        documents = [set(features(text)) for text in texts]
+        self.vocabulary = {feature: index for index, feature in enumerate(sorted(set().union(*documents)))}
+        document_frequency = np.zeros(len(self.vocabulary))
+        for document in documents:
+            document_frequency[[self.vocabulary[feature] for feature in document]] += 1
+        self.idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+
+        x = np.zeros((len(texts), len(self.vocabulary)))
+        for row, text in enumerate(texts):
+            indexes, values = self._vector(text)
+            x[row, indexes] = values
+        y = np.zeros((len(texts), len(self.labels)))
+        y[np.arange(len(texts)), [self.labels.index(label) for label in labels]] = 1
+
+        self.weights = np.zeros((len(self.vocabulary), len(self.labels)))
+        self.bias = np.zeros(len(self.labels))
+        for _ in range(self.epochs):
+            probabilities = _softmax(x @ self.weights + self.bias)
+            error = (probabilities - y) / len(texts)
+            self.weights -= self.learning_rate * (x.T @ error + self.l2 * self.weights)
+            self.bias -= self.learning_rate * error.sum(axis=0)
+        return self
+
+    # label -> probability
+    def predict_proba(self, text):
+        indexes, values = self._vector(text)
+        probabilities = _softmax(values @ self.weights[indexes] + self.bias)
+        return dict(zip(self.labels, probabilities.tolist()))
+
+    def predict(self, text):
+        indexes, values = self._vector(text)
+        return self.labels[int(np.argmax(values @ self.weights[indexes] + self.bias))]
+
+
+def _softmax(scores):
+    exp = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+_default = None
+
+
+def default_classifier():
+    global _default
+    if _default is None:
+        texts, labels = zip(*EXAMPLES)
+        _default = IntentClassifier().fit(texts, labels)
+    return _default
+
+
+# "joke" or "conversation"
+def classify(text):
+    return default_classifier().predict(text)
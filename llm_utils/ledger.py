@@ -0,0 +1,315 @@
+'''
+    Token and cost ledger.
+
+    Every call of a model created by the registry (llm_utils/models.py) appends a record to a SQLite ledger:
+    time, run id, graph node, provider, model, prompt and completion tokens, latency, cache hit and error.
+    With it the providers can be compared by what the runs really cost:
+
+        python -m llm_utils.ledger report --by day,provider
+        python -m llm_utils.ledger report --by node,model --days 7
+
+    - The records are written by a background thread in batches (one transaction per batch_size records or
+      every flush_seconds), so a model call only puts a tuple into a queue
+    - The run id is the "run_id" key of the configurable config, ie. models.model_config(key, run_id="cats")
+      (the batch runner and the checkpointer set it). If the callback is also in the graph's config, the id of
+      the root run is used for the others
+    - Answers served from an app's own cache (ie. the joke pool) are recorded with record_cache_hit()
+    - Cost is computed when reporting, from PRICES (USD per million tokens), so prices can be updated afterwards
+    - LLM_LEDGER=0 turns recording off, LLM_LEDGER_DB chooses the database file. The default is database/ledger.db
+      of the repository, wherever the script is started from
+'''
+
+import argparse
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DB = os.getenv("LLM_LEDGER_DB", os.path.join(ROOT, "database", "ledger.db"))
+
+# "provider:model" or "provider" -> USD per million (prompt, completion) tokens. Check the providers' price lists
+PRICES = {
+    "openai:gpt-4o-mini": (0.15, 0.60),
+    "openai:gpt-4o": (2.50, 10.00),
+    "cohere:command-r": (0.15, 0.60),
+    "cohere:command-r-plus": (2.50, 10.00),
+    "cohere": (0.15, 0.60),
+}
+
+_COLUMNS = ("ts", "run_id", "node", "provider", "model", "prompt_tokens", "completion_tokens",
+            "latency_ms", "cache_hit", "error")
+
+# Group by keys of the report -> SQL expression
+_GROUPS = {
+    "day": "date(ts, 'unixepoch', 'localtime')",
+    "hour": "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')",
+    "run": "run_id",
+    "node": "node",
+    "provider": "provider",
+    "model": "provider || ':' || COALESCE(model, '')",
+}
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS calls (
+            ts REAL NOT NULL,
+            run_id TEXT,
+            node TEXT,
+            provider TEXT,
+            model TEXT,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            cache_hit INTEGER NOT NULL,
+            error INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS calls_ts ON calls (ts)")
+    conn.commit()
+    return conn
+
+
+def split_key(model_key):
+    provider, _, model = model_key.partition(":")
+    return provider, model
+
+
+def price(provider, model):
+    return PRICES.get(f"{provider}:{model}") or PRICES.get(provider) or (0.0, 0.0)
+
+
+class Ledger:
+    def __init__(self, db_path=DEFAULT_DB, batch_size=200, flush_seconds=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name="ledger-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    # Cheap for the caller: the row goes to the writer thread
+    def record(self, run_id, node, provider, model, prompt_tokens, completion_tokens, latency_ms,
+               cache_hit=False, error=False):
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), run_id, node, provider, model, prompt_tokens, completion_tokens,
+                         latency_ms, int(cache_hit), int(error)))
+
+    def _writer(self):
+        conn = _connect(self.db_path)
+        rows = []
+        stop = False
+        while not stop:
+            deadline = time.monotonic() + self.flush_seconds
+            while len(rows) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    # flush(): write what there is and tell the caller
+                    self._write(conn, rows)
+                    rows = []
+                    item.set()
+                    continue
+                rows.append(item)
+            self._write(conn, rows)
+            rows = []
+        conn.close()
+
+    def _write(self, conn, rows):
+        if rows:
+            with conn:
+                conn.executemany(f"INSERT INTO calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                                 rows)
+            self.written += len(rows)
+
+    # Waits until everything recorded so far is in the database
+    def flush(self, timeout=10.0):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10.0)
+        self._thread = None
+
+    # Rows of (group values..., calls, prompt tokens, completion tokens, cost USD, average latency ms,
+    # cache hits, errors)
+    def rollup(self, by=("day", "provider"), days=None):
+        for key in by:
+            if key not in _GROUPS:
+                raise ValueError(f"Unknown group '{key}', use {', '.join(_GROUPS)}")
+        self.flush()
+        if not os.path.exists(self.db_path):
+            return []
+        groups = [_GROUPS[key] for key in by]
+        where, params = "", ()
+        if days is not None:
+            where, params = "WHERE ts >= ?", (time.time() - days * 24 * 3600,)
+        conn = _connect(self.db_path)
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT {', '.join(groups)}, provider, model, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),
+                       SUM(latency_ms), SUM(cache_hit), SUM(error)
+                FROM calls {where}
+                GROUP BY {', '.join(groups + ['provider', 'model'])}
+                """,
+                params,
+            ).fetchall()
+        finally:
+            conn.close()
+
+        # Cost per provider and model first, then summed into the requested groups
+        totals = {}
+        for row in rows:
+            group = row[:len(by)]
+            provider, model, calls, prompt, completion, latency, hits, errors = row[len(by):]
+            prompt_price, completion_price = price(provider, model)
+            total = totals.setdefault(group, [0, 0, 0, 0.0, 0.0, 0, 0])
+            total[0] += calls
+            total[1] += prompt
+            total[2] += completion
+            total[3] += (prompt * prompt_price + completion * completion_price) / 1e6
+            total[4] += latency
+            total[5] += hits
+            total[6] += errors
+        # Cache hits take no time, the average latency is of the model calls
+        return [(*group, calls, prompt, completion, cost, latency / max(1, calls - hits), hits, errors)
+                for group, (calls, prompt, completion, cost, latency, hits, errors) in sorted(
+                    totals.items(), key=lambda item: tuple(str(value) for value in item[0]))]
+
+
+class LedgerCallback(BaseCallbackHandler):
+    # Called in the caller's thread / event loop, not moved to a thread pool
+    run_inline = True
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        # model run id -> (start time, run id, node, provider, model)
+        self._calls = {}
+        # chain run id -> root run id, when the callback is in the graph's config
+        self._roots = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._roots[run_id] = self._roots.get(parent_run_id, parent_run_id) or run_id
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._roots.pop(run_id, None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._roots.pop(run_id, None)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        graph_run = metadata.get("run_id") or self._roots.get(parent_run_id)
+        self._calls[run_id] = (time.perf_counter(), str(graph_run) if graph_run else None,
+                               metadata.get("langgraph_node"), metadata.get("ls_provider"),
+                               metadata.get("ls_model_name"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        start, graph_run, node, provider, model = call
+        prompt = completion = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt += usage.get("input_tokens", 0)
+                    completion += usage.get("output_tokens", 0)
+        self.ledger.record(graph_run, node, provider, model, prompt, completion,
+                           (time.perf_counter() - start) * 1000)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        start, graph_run, node, provider, model = call
+        self.ledger.record(graph_run, node, provider, model, 0, 0, (time.perf_counter() - start) * 1000, error=True)
+
+
+ledger = Ledger()
+callback = LedgerCallback(ledger)
+
+
+def enabled():
+    return os.getenv("LLM_LEDGER", "1").lower() not in ("0", "false", "no")
+
+
+# Adds the ledger callback to a model, every call of the model is recorded
+def attach(model):
+    if enabled():
+        callbacks = list(model.callbacks or [])
+        if callback not in callbacks:
+            model.callbacks = callbacks + [callback]
+    return model
+
+
+# An answer served from a cache instead of a model call. model_key is "provider:model"
+def record_cache_hit(model_key, node=None, run_id=None):
+    if enabled():
+        provider, model = split_key(model_key)
+        ledger.record(run_id, node, provider, model, 0, 0, 0.0, cache_hit=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--by", default="day,provider", help=f"Comma separated: {', '.join(_GROUPS)}")
+    parser.add_argument("--days", type=float, help="Only the last N days")
+    args = parser.parse_args()
+
+    by = [key.strip() for key in args.by.split(",") if key.strip()]
+    rows = Ledger(args.db).rollup(by, args.days)
+    if not rows:
+        print(f"No calls in {args.db}")
+        return
+    widths = [max(len(key), *(len(str(row[index])) for row in rows)) for index, key in enumerate(by)]
+    header = "  ".join(f"{key:<{width}}" for key, width in zip(by, widths))
+    print(f"{header}  {'calls':>7} {'prompt tok':>11} {'compl. tok':>11} {'cost USD':>10} {'avg ms':>8} "
+          f"{'cached':>7} {'errors':>7}")
+    totals = [0, 0, 0, 0.0, 0, 0]
+    for row in rows:
+        group, (calls, prompt, completion, cost, latency, hits, errors) = row[:len(by)], row[len(by):]
+        labels = "  ".join(f"{str(value):<{width}}" for value, width in zip(group, widths))
+        print(f"{labels}  {calls:>7} {prompt:>11} {completion:>11} {cost:>10.4f} {latency:>8.0f} {hits:>7} {errors:>7}")
+        for index, value in enumerate((calls, prompt, completion, cost, hits, errors)):
+            totals[index] += value
+    calls, prompt, completion, cost, hits, errors = totals
+    print(f"{'total':<{len(header)}}  {calls:>7} {prompt:>11} {completion:>11} {cost:>10.4f} {'':>8} {hits:>7} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
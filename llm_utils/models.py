@@ -0,0 +1,75 @@
+'''
+    Model registry.
+
+    Instead of putting the chat model into the agent's state, the graph is invoked with a short model key
+    in its config and the nodes look the model up from here. The state then holds only plain data,
+    so it can be copied, serialized, checkpointed and sent to other processes.
+
+        graph.invoke(state, config=models.model_config("openai:gpt-4o-mini"))
+
+        def joker_agent(state: AgentState, config: RunnableConfig) -> dict:
+            llm = models.model_from_config(config)
+
+    Keys are "provider" or "provider:model name". Models are created once per key and reused, and a provider's
+    package is imported only when its first model is created.
+    Every call of the provider models is recorded in the token and cost ledger (llm_utils/ledger.py).
+'''
+
+import os
+
+from llm_utils import ledger
+
+
+# The provider packages are imported on the first use of the provider: importing langchain_openai
+# and langchain_cohere takes most of a script's start up time, and usually only one of them is used
+# stream_usage: streamed calls (the token streaming of example 8) report their tokens too
+def _openai(model_name):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(api_key=os.getenv("OPENAI_API_KEY"), model=model_name or "gpt-4o-mini", stream_usage=True)
+
+
+# Without a model name ChatCohere asks the API for the default model on every call, so the name is always given
+def _cohere(model_name):
+    from langchain_cohere import ChatCohere
+
+    return ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"),
+                      model=model_name or os.getenv("COHERE_MODEL", "command-r"))
+
+
+# provider -> function(model name) returning a chat model
+_providers = {
+    "openai": _openai,
+    "cohere": _cohere,
+}
+
+# model key -> chat model
+_models = {}
+
+
+def register_provider(provider, factory):
+    _providers[provider] = factory
+
+
+# Registers a ready made model under a key, ie. the offline models used by the benchmarks
+def register_model(key, model):
+    _models[key] = model
+
+
+def get_model(key):
+    model = _models.get(key)
+    if model is None:
+        provider, _, model_name = key.partition(":")
+        if provider not in _providers:
+            raise KeyError(f"Unknown model provider '{provider}'. Known providers: {', '.join(_providers)}")
+        model = ledger.attach(_providers[provider](model_name))
+        _models[key] = model
+    return model
+
+
+def model_config(key, **configurable):
+    return {"configurable": {"model": key, **configurable}}
+
+
+def model_from_config(config):
+    return get_model(config["configurable"]["model"])
@@ -0,0 +1,66 @@
+'''
+    Memoized structured output binding.
+
+    model.with_structured_output(Schema) converts the schema into a tool / JSON schema and builds
+    a new runnable chain every time it is called. Agents that loop (joke -> joke_improver -> joke ...)
+    would pay that price on every node execution, so the bound runnables are cached here.
+
+    Usage:
+    - Decorate schemas with @register_schema so their JSON schema is generated once at import
+    - Call bind(model, Schema) inside the nodes instead of model.with_structured_output(Schema)
+'''
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+# Schema class -> precomputed tool definition (JSON schema)
+_schema_json = {}
+
+# (id(model), schema class) -> (model, bound runnable)
+# The model itself is kept in the value so its id can't be reused by another object while cached
+_bound_runnables = {}
+
+# Simple counters, handy when comparing cached and uncached runs
+stats = {"hits": 0, "misses": 0}
+
+
+def register_schema(schema):
+    # Generating the schema also fills pydantic's own schema cache,
+    # so the conversion done by with_structured_output later on is cheap as well
+    _schema_json[schema] = convert_to_openai_tool(schema)
+    return schema
+
+
+# Returns the precomputed tool definition of the schema
+def schema_json(schema):
+    if schema not in _schema_json:
+        register_schema(schema)
+    return _schema_json[schema]
+
+
+# Returns a structured output runnable for the model and schema, building it only on the first call
+def bind(model, schema, **kwargs):
+    key = (id(model), schema, tuple(sorted(kwargs.items())))
+    cached = _bound_runnables.get(key)
+    if cached is not None and cached[0] is model:
+        stats["hits"] += 1
+        return cached[1]
+
+    stats["misses"] += 1
+    schema_json(schema)
+    runnable = model.with_structured_output(schema, **kwargs)
+    _bound_runnables[key] = (model, runnable)
+    return runnable
+
+
+# The bound model of bind(model, schema) without the output parser: returns the model's message with the
+# tool call, for callers that parse the arguments elsewhere (ie. in the check processes of graph_utils/pipeline.py)
+def bind_raw(model, schema):
+    return bind(model, schema).first
+
+
+# Drops all cached runnables (for example when models are recreated)
+def clear():
+    _bound_runnables.clear()
+    stats["hits"] = 0
+    stats["misses"] = 0
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from chainlit_utils.admission import BACKGROUND, INTERACTIVE, AdmissionController, Busy
+
+
+def test_interactive_requests_are_admitted_first():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_wait=10, initial_run_seconds=0.1)
+        order = []
+        release = asyncio.Event()
+
+        async def request(name, priority):
+            async with admission.slot(priority):
+                order.append(name)
+                if name == "first":
+                    await release.wait()
+
+        first = asyncio.create_task(request("first", INTERACTIVE))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(request("background", BACKGROUND)),
+                  asyncio.create_task(request("interactive", INTERACTIVE))]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *others)
+        return order, admission.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["first", "interactive", "background"]
+    assert stats["running"] == 0 and stats["queued"] == 0 and stats["admitted"] == 3
+
+
+def test_refused_when_the_wait_would_be_too_long():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_wait=1, initial_run_seconds=5)
+        async with admission.slot():
+            with pytest.raises(Busy):
+                async with admission.slot():
+                    pass
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 1 and stats["running"] == 0
+
+
+def test_cancelled_waiter_gives_its_place_back():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_wait=10, initial_run_seconds=0.1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.slot():
+                await release.wait()
+
+        async def waiter():
+            async with admission.slot():
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await holding
+        # The place isn't lost: a new request is admitted at once
+        async with admission.slot() as wait:
+            assert wait == 0.0
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == 0 and stats["queued"] == 0
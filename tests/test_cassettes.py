@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm_utils import cassettes
+
+
+# Answers with a numbered joke, fails for prompts containing "boom"
+class CountingModel(BaseChatModel):
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "counting"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if "boom" in messages[-1].content:
+            raise ValueError("provider said no")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"joke {self.calls}"))])
+
+
+def test_replay_serves_the_takes_in_order(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    recording = cassettes.use(CountingModel(), path, cassettes.RECORD)
+    assert [recording.invoke("cats").content for _ in range(2)] == ["joke 1", "joke 2"]
+
+    replaying = cassettes.use(CountingModel(), path)
+    assert [replaying.invoke("cats").content for _ in range(3)] == ["joke 1", "joke 2", "joke 1"]
+    assert replaying.calls == 0
+
+
+def test_call_that_was_not_recorded_is_a_miss(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    cassettes.use(CountingModel(), path, cassettes.RECORD).invoke("cats")
+
+    replaying = cassettes.use(CountingModel(), path)
+    with pytest.raises(cassettes.CassetteMiss):
+        replaying.invoke("dogs")
+    assert replaying.calls == 0
+    assert replaying.cache.misses == 1
+
+
+def test_recorded_error_is_raised_again(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    recording = cassettes.use(CountingModel(), path, cassettes.RECORD)
+    with pytest.raises(ValueError):
+        recording.invoke("boom")
+    with pytest.raises(ValueError):
+        asyncio.run(recording.ainvoke("async boom"))
+    assert recording.cache.recorded() == 2
+
+    replaying = cassettes.use(CountingModel(), path)
+    with pytest.raises(cassettes.RecordedError, match="ValueError: provider said no"):
+        replaying.invoke("boom")
+    with pytest.raises(cassettes.RecordedError):
+        asyncio.run(replaying.ainvoke("async boom"))
+    assert replaying.calls == 0
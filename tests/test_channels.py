@@ -0,0 +1,40 @@
+from typing import Annotated, Deque, TypedDict
+
+from langgraph.graph import END, StateGraph
+
+from graph_utils import channels
+from graph_utils.channels import Record
+from graph_utils.checkpoint import dumps_state, loads_state
+
+
+def test_ring_buffer_keeps_the_newest_entries():
+    reducer = channels.ring_buffer(3)
+    old = reducer(None, [1, 2])
+    new = reducer(old, [3, 4])
+    assert list(new) == [2, 3, 4]
+    # The old value is not modified, LangGraph may still use it
+    assert list(old) == [1, 2]
+    # A single entry is appended as one item
+    assert list(reducer(new, Record("ai", "hi"))) == [3, 4, Record("ai", "hi")]
+
+
+class State(TypedDict):
+    messages: Annotated[Deque[Record], channels.ring_buffer(3)]
+    rounds: int
+
+
+def test_ring_buffer_in_a_graph_loop():
+    def talk(state):
+        return {"messages": [Record("ai", f"round {state['rounds']}")], "rounds": state["rounds"] + 1}
+
+    workflow = StateGraph(State)
+    workflow.add_node("talk", talk)
+    workflow.set_entry_point("talk")
+    workflow.add_conditional_edges("talk", lambda state: END if state["rounds"] == 10 else "talk")
+    result = workflow.compile().invoke({"messages": [Record("human", "start")], "rounds": 0})
+    assert [record.content for record in result["messages"]] == ["round 7", "round 8", "round 9"]
+
+    # Checkpointed as a list, the reducer makes it a ring buffer again
+    restored = loads_state(dumps_state(result))
+    assert [record.content for record in channels.ring_buffer(3)(restored["messages"], [])] == \
+        ["round 7", "round 8", "round 9"]
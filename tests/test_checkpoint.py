@@ -0,0 +1,60 @@
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.graph import END, StateGraph
+
+from graph_utils import channels
+from graph_utils.checkpoint import Checkpointer
+
+
+class State(TypedDict):
+    steps: Annotated[channels.AppendLog, channels.append]
+    last_node: str
+
+
+def build(calls, fail):
+    def first(state):
+        calls.append("first")
+        return {"steps": ["first"]}
+
+    def second(state):
+        calls.append("second")
+        if fail:
+            raise RuntimeError("the process died")
+        return {"steps": ["second"]}
+
+    workflow = StateGraph(State)
+    workflow.add_node("first", first)
+    workflow.add_node("second", second)
+    workflow.add_edge("first", "second")
+    workflow.add_edge("second", END)
+    # Continues after the last completed node, like resume_entry of 6_database_and_agents.py
+    workflow.set_conditional_entry_point(lambda state: "second" if state.get("last_node") == "first" else "first",
+                                         {"first": "first", "second": "second"})
+    return workflow.compile()
+
+
+def test_resume_after_the_last_completed_node(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path / "checkpoints.db"))
+    calls = []
+    with pytest.raises(RuntimeError):
+        checkpointer.run(build(calls, fail=True), {"steps": []}, run_id="run")
+    assert checkpointer.status("run") == "running"
+    assert checkpointer.last("run")[1] == "first"
+
+    result = checkpointer.run(build(calls, fail=False), {"steps": []}, run_id="run")
+    # The first node isn't run again
+    assert calls == ["first", "second", "second"]
+    assert list(result["steps"]) == ["first", "second"]
+    assert checkpointer.status("run") == "finished"
+
+
+def test_finished_run_returns_its_final_state(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path / "checkpoints.db"))
+    calls = []
+    checkpointer.run(build(calls, fail=False), {"steps": []}, run_id="run")
+    result = checkpointer.run(build(calls, fail=False), {"steps": []}, run_id="run")
+    assert calls == ["first", "second"]
+    assert list(result["steps"]) == ["first", "second"]
+    # Compacted to the final checkpoint
+    assert checkpointer.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] == 1
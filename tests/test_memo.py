@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from graph_utils import memo
+
+
+def test_cached_by_the_given_keys():
+    calls = []
+
+    @memo.node(keys=("a", "b"))
+    def add(state):
+        calls.append(state)
+        return {"total": state["a"] + state["b"]}
+
+    assert add({"a": 1, "b": 2, "other": "x"}) == {"total": 3}
+    assert add({"a": 1, "b": 2, "other": "y"}) == {"total": 3}
+    assert add({"a": 2, "b": 2}) == {"total": 4}
+    assert len(calls) == 2
+    # The caller gets a copy, changing it doesn't change the cached update
+    add({"a": 1, "b": 2})["total"] = 0
+    assert add({"a": 1, "b": 2}) == {"total": 3}
+
+
+def test_async_node_with_config_keys():
+    calls = []
+
+    @memo.node(keys=("topic",), config_keys=("model",))
+    async def joke(state, config):
+        calls.append(config["configurable"]["model"])
+        return {"joke": f"{state['topic']} by {config['configurable']['model']}"}
+
+    async def scenario():
+        for model in ("a", "b", "a"):
+            await joke({"topic": "cats"}, config={"configurable": {"model": model}})
+
+    asyncio.run(scenario())
+    assert calls == ["a", "b"]
+
+
+def test_node_without_keys_is_refused():
+    with pytest.raises(ValueError):
+        memo.node()
+
+
+def test_stats_are_per_module_and_function():
+    @memo.node(keys=("a",))
+    def node(state):
+        return state["a"]
+
+    node({"a": 1})
+    node({"a": 1})
+    stats = memo.stats()[f"{__name__}.test_stats_are_per_module_and_function.<locals>.node"]
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
@@ -0,0 +1,55 @@
+import asyncio
+
+from chainlit_utils.single_flight import SingleFlight, make_key
+
+
+def test_identical_calls_share_one_execution():
+    async def scenario():
+        flights = SingleFlight()
+        executions = []
+
+        async def call():
+            executions.append(1)
+            await asyncio.sleep(0.01)
+            return "joke"
+
+        keys = [make_key("Joke about  Cats", "model"), make_key("joke about cats", "model")]
+        results = await asyncio.gather(*(flights.do(key, call) for key in keys))
+        return results, executions, flights
+
+    results, executions, flights = asyncio.run(scenario())
+    assert results == ["joke", "joke"]
+    assert len(executions) == 1
+    assert flights.stats["coalesced"] == 1
+    assert flights.in_flight() == 0
+
+
+def test_call_is_cancelled_when_all_waiters_leave():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def call():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flights.do("key", call)) for _ in range(3)]
+        await started.wait()
+        # One waiter leaving doesn't stop the call for the others
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set() and flights.in_flight() == 1
+        for waiter in waiters[1:]:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flights
+
+    flights = asyncio.run(scenario())
+    assert flights.stats["cancelled"] == 1
+    assert flights.in_flight() == 0